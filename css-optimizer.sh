@@ -73,7 +73,7 @@ export CSS_OPT_SHIELD_WGT_TRIMMING=ON
 #    parser.add_argument("-sx", "--max-stiffness", type=float, help="Max total stiffness", default=100.0)
 # "-mw", "--max-tot-weight", type=float, help="Max total weight (kg/m2)", default=20.0)
 # "-mc", "--max-tco", type=int, help="Max TCO (Total Cost of Ownership)", default=10)
-# "-hs", "--history-slice", type=str, help="History slicing directive ('a:b' -> from a-th element, length b, 'a:'  -> from a-th element to end, ':b'  -> first b elements, '_:b'  -> last b elements)", default=None)
+# "-hs", "--history-slice", type=str, help="History slicing directive ('a:b' -> from a-th element, length b, 'a:'  -> from a-th element to end, ':b'  -> first b elements, '_:b'  -> last b elements, coresets: 'best:k' -> k best, 'diverse:k' -> best of k clusters, 'strata:k' -> k best across material sequences, combined with '+', e.g. '_:5+best:5+diverse:20')", default=None)
 # "-oc", "--optimizer-config", type=str, help="Core optimization engine configuration file", default="./config/optimizer_conf.json")
 # "-x0", "--x0-file", type=str, help="Initial shield configuration", default=None)
 #  -x0 ./config/init_shield_x0.json \
@@ -92,8 +92,9 @@ exec python src/shield_optimizer.py \
   --pr objfun_evaluator objfun_base250801.ObjFEval_Base250801 \
   --pr objfun_config ${OPT_CONFIG_DIR}/objfun_params.json \
   --pr target_evaluator trgeval_base250801.TargetEval_Base250801 \
-  --pr history_file ${OPT_STATE_DIR}/optimizer_state.pkl \
-  --pr history_slice _:5 \
+  --pr history_file ${OPT_STATE_DIR}/optimizer_state.sqlite \
+  --pr history_slice _:5+best:5+strata:10+diverse:20 \
+  --pr sim_cache_file ${OPT_STATE_DIR}/sim_cache.sqlite \
   --pr target_energy_eff 0.9 \
   --pr target_protection_eff 0.9 \
   --pr penalization_value 1e6 \
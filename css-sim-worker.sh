@@ -0,0 +1,35 @@
+#!/bin/bash
+
+# Simulation worker daemon, to be launched (in background) on each simulation node, from the same directory as the optimizer.
+# It pulls simulation jobs from the shared queue directory, which has to be the same 'sim_queue_dir' the optimizer is configured with
+# (run the optimizer with '--pr sim_backend queue'). Launch one worker per simulator slot of the node.
+# Usage: nohup ./css-sim-worker.sh <queue dir> > ${OPT_LOGS_DIR}/css-sim-worker-<n>.log 2>&1 &
+
+. ./bin/env.sh
+
+if [ -z "$1" ]; then
+  echo "Usage: $0 <queue dir>"
+  exit 1
+fi
+
+. ${VENV_HOME}/bin/activate
+
+############## Editable section: BEGIN ############
+
+#Log levels for the worker: DEBUG, INFO, WARNING, ERROR, CRITICAL
+export CSS_OPT_LOG_LEVEL=INFO
+
+#[requires CSS 5.1.2 or sup] If CSS_OPT_SAV_STEPDATA is set in this script, it will supersede the correspondent setting in the CSS launch script.
+#It is best to set it to OFF, so to avoid huge disk size usage.
+export CSS_OPT_SAV_STEPDATA=OFF
+
+############## Editable section: END ##############
+
+#exec best so the process does not proliferate another pid
+exec python src/sim_worker.py \
+  --pr sim_queue_dir $1 \
+  --pr sim_lease_timeout 60 \
+  --pr sim_poll_interval 1.0 \
+  --pr simulation_script ./css_wrap.sh \
+  --pr optimizer_out_dir ${OPT_OUT_DIR} \
+  --pr geom_config_files_dir ${CSS_CFG_OPTIM}
@@ -19,7 +19,46 @@ sims_log_dir=${OPT_LOGS_DIR}
 #sims_log=${sims_log_dir}/sims-${curr_tstamp}.log
 sims_log=${sims_log_dir}/sims.log
 
+# Multi-geometry manifest (ref. README): the simulator is invoked once for all the shields listed in the manifest,
+# one "<run ID> <geometry configuration file> [<fidelity>]" line per shield. Requires a simulator launch script supporting the '--manifest' option.
+if [ "$1" == "--manifest" ]; then
+  manifest_file=$2
+  echo "[$(date)][SIM WRAP][manifest] Simulation wrapper command: $(basename "$0") $@"
+  echo "[$(date)][SIM WRAP][manifest] Simulation wrapper command: $(basename "$0") $@" >> ${sims_log}
+  if [ ! -d "${css_proj_dir}" ]; then
+    echo "[$(date)][SIM WRAP][manifest] ERROR - Simulator NOT FOUND (missing: ${css_proj_dir})"
+    echo "[$(date)][SIM WRAP][manifest] ERROR - Simulator NOT FOUND (missing: ${css_proj_dir})" >> ${sims_log}
+    exit 1
+  fi
+  cd "${css_proj_dir}"
+  echo "[$(date)][SIM WRAP][manifest] Launching simulation: ${CSS_LAUNCH_SCRIPT} ${CSS_MODE} --manifest ${manifest_file}"
+  echo "[$(date)][SIM WRAP][manifest] Launching simulation: ${CSS_LAUNCH_SCRIPT} ${CSS_MODE} --manifest ${manifest_file}" >> ${sims_log}
+  ./${CSS_LAUNCH_SCRIPT} ${CSS_MODE} --manifest "${manifest_file}"
+  cd "${optim_dir}"
+
+  # results are checked per shield: the optimizer regards the missing ones as failed simulations
+  missing_results=0
+  while read -r SIM_ID SIM_GEOM_PATH SIM_FIDELITY; do
+    if [ -n "${SIM_ID}" ]; then
+      target_kpis_file="${CSS_OUT_DIR}/r${SIM_ID}/glob_kpis_${SIM_ID}.csv"
+      if [ ! -f "${target_kpis_file}" ]; then
+        echo "[$(date)][SIM WRAP][${SIM_ID}] ERROR - RESULTS NOT FOUND (missing: ${target_kpis_file})" >> ${sims_log}
+        missing_results=$((missing_results + 1))
+      fi
+    fi
+  done < "${manifest_file}"
+  echo "[$(date)][SIM WRAP][manifest] Processing complete (missing results: ${missing_results})."
+  echo "[$(date)][SIM WRAP][manifest] Processing complete (missing results: ${missing_results})." >> ${sims_log}
+  if [ ${missing_results} -gt 0 ]; then
+    exit 1
+  fi
+  exit 0
+fi
+
 SIM_ID=$1
+# Fidelity level (optional, multi-fidelity run mode): number of primary particles, passed to the CSS launch script after the simulation ID.
+# If not specified, the CSS launch script uses its default (full statistics).
+SIM_FIDELITY=$2
 
 echo "[$(date)][SIM WRAP][${SIM_ID}] Simulation wrapper command: $(basename "$0") $@"
 echo "[$(date)][SIM WRAP][${SIM_ID}] Simulation wrapper command: $(basename "$0") $@" >> ${sims_log}
@@ -32,10 +71,10 @@ SIM_OUT_ROOT="${CSS_OUT_DIR}/r${SIM_ID}"
 if [ -d "${css_proj_dir}" ]; then
   cd "${css_proj_dir}"
   #sim_command=./run-css.sh ${CSS_MODE} ${SIM_ID}
-  echo "[$(date)][SIM WRAP][${SIM_ID}] Launching simulation: ${CSS_LAUNCH_SCRIPT} ${CSS_MODE} ${SIM_ID}"
-  echo "[$(date)][SIM WRAP][${SIM_ID}] Launching simulation: ${CSS_LAUNCH_SCRIPT} ${CSS_MODE} ${SIM_ID}" >> ${sims_log}
+  echo "[$(date)][SIM WRAP][${SIM_ID}] Launching simulation: ${CSS_LAUNCH_SCRIPT} ${CSS_MODE} ${SIM_ID} ${SIM_FIDELITY}"
+  echo "[$(date)][SIM WRAP][${SIM_ID}] Launching simulation: ${CSS_LAUNCH_SCRIPT} ${CSS_MODE} ${SIM_ID} ${SIM_FIDELITY}" >> ${sims_log}
   #"${sim_command}"
-  ./${CSS_LAUNCH_SCRIPT} ${CSS_MODE} ${SIM_ID}
+  ./${CSS_LAUNCH_SCRIPT} ${CSS_MODE} ${SIM_ID} ${SIM_FIDELITY}
   cd "${optim_dir}"
 
   target_kpis_file="${SIM_OUT_ROOT}/glob_kpis_${SIM_ID}.csv"
@@ -0,0 +1,18 @@
+#!/bin/bash
+
+# Stand-in for a persistent simulator server (same contract as dummy_simulation.sh). Usage: ./dummy_sim_server.sh <socket path>
+# Then run the optimizer with: --pr sim_backend server --pr sim_server_socket <socket path>
+
+. ./bin/env.sh
+#. /${VENV_HOME}/bin/activate
+
+if [ -z "$1" ]; then
+  echo "Usage: $0 <socket path>"
+  exit 1
+fi
+
+exec python src/dummy/dummy_sim_server.py \
+  --pr sim_server_socket $1 \
+  --pr optimizer_out_dir ${OPT_OUT_DIR} \
+  --pr startup_secs 2 \
+  --pr run_secs 0.5
@@ -7,18 +7,50 @@ echo "(INSIDE DUMMY SIM) Simulation command: $(basename "$0") $@"
 echo "(INSIDE DUMMY SIM) Simulation command: $(basename "$0") $@" >> ${OPT_LOGS_DIR}/sims-dummy.log
 echo "(INSIDE DUMMY SIM) Processing ..."
 
-SIM_ID=$1
-
-SIM_OUT_ROOT="${OPT_OUT_DIR}/r${SIM_ID}"
-mkdir -p "${SIM_OUT_ROOT}"
-TARGET_KPIS_FILE="${SIM_OUT_ROOT}/glob_kpis_${SIM_ID}.csv"
-
-echo "[opttrace][dummy] GlobThickness;GlobNormWeight;EnergyEfficiency;ProtectionEfficiency: 270.000000;1870.400000;0.505040;0.665954"
-echo "GlobThickness;GlobNormWeight;EnergyEfficiency;ProtectionEfficiency" > "${TARGET_KPIS_FILE}"
-echo "270.000000;1870.400000;0.505040;0.665954" >> "${TARGET_KPIS_FILE}"
+# Fidelity level (number of primary particles, optional): the dummy simulation ignores it
+create_dummy_kpis() {
+  SIM_ID=$1
+  SIM_FIDELITY=$2
+
+  SIM_OUT_ROOT="${OPT_OUT_DIR}/r${SIM_ID}"
+  mkdir -p "${SIM_OUT_ROOT}"
+  TARGET_KPIS_FILE="${SIM_OUT_ROOT}/glob_kpis_${SIM_ID}.csv"
+
+  echo "[opttrace][dummy] GlobThickness;GlobNormWeight;EnergyEfficiency;ProtectionEfficiency: 270.000000;1870.400000;0.505040;0.665954"
+  echo "GlobThickness;GlobNormWeight;EnergyEfficiency;ProtectionEfficiency" > "${TARGET_KPIS_FILE}"
+  echo "270.000000;1870.400000;0.505040;0.665954" >> "${TARGET_KPIS_FILE}"
+
+  echo "(INSIDE DUMMY SIM) Results created: ${TARGET_KPIS_FILE} (fidelity: ${SIM_FIDELITY:-default})"
+}
+
+# Partial KPI snapshots, streamed while "running" (ref. early abort of simulations in the README)
+stream_dummy_partial_kpis() {
+  SIM_ID=$1
+
+  SIM_OUT_ROOT="${OPT_OUT_DIR}/r${SIM_ID}"
+  mkdir -p "${SIM_OUT_ROOT}"
+  PARTIAL_KPIS_FILE="${SIM_OUT_ROOT}/partial_kpis_${SIM_ID}.csv"
+
+  echo "Events;GlobNormWeight;EnergyEfficiency;EnergyEfficiencyErr;ProtectionEfficiency;ProtectionEfficiencyErr" > "${PARTIAL_KPIS_FILE}"
+  for EVENTS in 2500 5000 7500; do
+    sleep 0.5
+    echo "${EVENTS};1870.400000;0.505040;0.020000;0.665954;0.020000" >> "${PARTIAL_KPIS_FILE}"
+  done
+}
+
+if [ "$1" == "--manifest" ]; then
+  # Multi-geometry manifest: one "<run ID> <geometry configuration file> [<fidelity>]" line per shield, the startup cost is paid once
+  while read -r MAN_SIM_ID MAN_GEOM_PATH MAN_FIDELITY; do
+    if [ -n "${MAN_SIM_ID}" ]; then
+      create_dummy_kpis "${MAN_SIM_ID}" "${MAN_FIDELITY}"
+    fi
+  done < "$2"
+else
+  stream_dummy_partial_kpis "$1"
+  create_dummy_kpis "$1" "$2"
+fi
 
 sleep 2
 
-echo "(INSIDE DUMMY SIM) Results created: ${TARGET_KPIS_FILE}"
 echo "(INSIDE DUMMY SIM) Processing complete."
 
@@ -0,0 +1,63 @@
+import os
+import sys
+import signal
+import threading
+import time
+
+py_root='./src'
+py_util=py_root + '/util'
+sys.path.append(py_root)
+sys.path.append(py_util)
+
+from cmdline_parsing import ParametersHolder
+from logging_utils import init_logger
+from css_metadata import create_kpi_filepath
+from sim_server import SimServerBase
+
+# -------------------------------------
+# Stand-in for a persistent simulator server, following the same contract as dummy_simulation.sh
+# (fixed KPIs, written in <out dir>/r<id>/glob_kpis_<id>.csv), useful to develop and test the server mode without CSS.
+# -------------------------------------
+
+DUMMY_KPIS_HEADER = "GlobThickness;GlobNormWeight;EnergyEfficiency;ProtectionEfficiency"
+DUMMY_KPIS_ROW = "270.000000;1870.400000;0.505040;0.665954"
+
+class DummySimServer(SimServerBase):
+    def __init__(self, out_dir, run_secs):
+        super().__init__()
+        self._out_dir = out_dir
+        self._run_secs = run_secs
+
+    def runSimulation(self, sim_id, geometry_path, geometry, fidelity):
+        logger = init_logger()
+        logger.info("[dummysrv][" + sim_id + "] Processing (geometry: " + str(geometry_path) + ", layers: " + str(len(geometry.get("layers", []))) + ", fidelity: " + str(fidelity) + ") ...")
+        time.sleep(self._run_secs)
+        kpi_path, _ = create_kpi_filepath(self._out_dir, sim_id)
+        os.makedirs(os.path.dirname(kpi_path), exist_ok=True)
+        kpis_csv = DUMMY_KPIS_HEADER + "\n" + DUMMY_KPIS_ROW + "\n"
+        with open(kpi_path, "w") as f:
+            f.write(kpis_csv)
+        logger.info("[dummysrv][" + sim_id + "] Results created: " + kpi_path)
+        return kpis_csv
+
+def main(args=None):
+    logger = init_logger()
+    paramsHolder = ParametersHolder("Dummy simulator server", args, "--pr")
+    paramsHolder.dump(logger)
+
+    # the startup cost (environment, physics/geometry initialization) is paid only once, here
+    time.sleep(paramsHolder.get("startup_secs", 2))
+    dummyServer = DummySimServer(paramsHolder.get("optimizer_out_dir"), paramsHolder.get("run_secs", 0.5))
+    server_thread = threading.Thread(target=dummyServer.serveForever, args=(paramsHolder.get("sim_server_socket"),), name="simserver")
+    server_thread.start()
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+    while (server_thread.is_alive() and not stop_event.wait(0.5)):
+        pass
+    dummyServer.shutdown()
+    server_thread.join()
+
+if __name__ == '__main__':
+    main()
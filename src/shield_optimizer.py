@@ -2,7 +2,6 @@ import sys
 import signal
 
 from datetime import datetime
-from skopt import gp_minimize
 #fxrom skopt.space import Space
 from functools import partial
 
@@ -32,6 +31,26 @@ from feasibility import is_problem_well_posed
 from sw_metadata import SoftwareMetadata
 from objfunction_wrap import objective
 from post_simulation import post_sim_logic
+from batch_driver import run_batch_optimization
+from async_driver import run_async_optimization
+from multifidelity_driver import run_multifidelity_optimization
+from turbo_driver import run_turbo_optimization
+from bandit_driver import run_bandit_optimization
+from pipeline_driver import run_pipelined_optimization
+from sim_queue import SimQueueCoordinator
+from sim_server import SimServerClient
+from sim_manifest import SimManifestBatcher
+from early_abort import EarlyAbortMonitor
+from pareto import ParetoArchive
+from pareto_driver import run_pareto_optimization
+from engine_factory import run_sequential_optimization
+from sim_cache import SimResultCache
+from island import IslandExchange
+from feasible_sampler import FeasibleRegionSampler
+from feasibility_classifier import FailureRegistry
+from runtime_model import RuntimeRegistry
+from pre_screening import PreScreener
+from optimizer_checkpoint import CHECKPOINT_RUN_MODES, get_checkpoint_mismatch
 
 from searchsp_adv250814 import SearchSpaceBuilderAdv250814
 from objfun_base250801 import ObjFEval_Base250801
@@ -79,7 +98,6 @@ def main(args=None):
 
     optimizerConf = OptimizerConfig()
     optimizerConf.init(OPTIM_CFG_FILE)
-    INITIAL_POINTS = optimizerConf.getParam("n_initial_points")
 
     irqMgr = IRQManager()
     irqMgr.init(STOP_FILE)
@@ -127,45 +145,163 @@ def main(args=None):
     targetEvaluator = objFactory.createObject("target evaluator", TRG_MODULE, TRG_CLASSNAME, TargetEval_Base250801())
     targetEvaluator.setTargets(objTargets)
 
-    objective_fn = partial(objective, inParamsHolder=paramsHolder, search_sp_bldr=searchSpBuilder, materials_set=matSet, constr_par=constrPar, objf_evaluator=objFunEvaluator, trg_evaluator=targetEvaluator)
+    # Simulation backend: local launch of the simulation script (default), dispatch to remote workers through a shared queue directory,
+    # persistent (warm) simulator server(s), or multi-geometry manifests (many simulations per simulator invocation)
+    SIM_BACKEND = paramsHolder.get("sim_backend", "local")
+    simBackend = None
+    if (SIM_BACKEND == "queue"):
+        simBackend = SimQueueCoordinator()
+        simBackend.init(paramsHolder)
+    elif (SIM_BACKEND == "server"):
+        simBackend = SimServerClient()
+        simBackend.init(paramsHolder)
+    elif (SIM_BACKEND == "manifest"):
+        simBackend = SimManifestBatcher()
+        # simulations in flight at once (the batch run mode dispatches the initial design in rounds of 'initial_batch_size')
+        if (optimizerConf.getParam("run_mode") in ["sequential", "pipelined"]):
+            simSlots = 1
+        else:
+            simSlots = max(optimizerConf.getParam("sim_slots"), optimizerConf.getParam("initial_batch_size") if (optimizerConf.getParam("run_mode") == "batch") else 0)
+        simBackend.init(paramsHolder, simSlots)
+    elif (SIM_BACKEND != "local"):
+        raise ValueError("[driver] ERROR. Unknown simulation backend: " + str(SIM_BACKEND))
+    logger.info("[driver] Simulation backend: " + SIM_BACKEND)
+
+    # Simulation results cache (optional): physically identical shields are simulated only once
+    SIM_CACHE_FILE = paramsHolder.get("sim_cache_file", "")
+    simCache = None
+    if SIM_CACHE_FILE:
+        simCache = SimResultCache()
+        simCache.init(SIM_CACHE_FILE)
+
+    # Early abort (optional) of the simulations which, according to their partial KPIs, cannot be competitive
+    EARLY_ABORT = paramsHolder.get("early_abort", False)
+    earlyAbort = None
+    if EARLY_ABORT:
+        if (simBackend is not None):
+            logger.warning("[driver] Early abort of simulations is supported only with the local simulation backend, it will be ignored")
+        else:
+            earlyAbort = EarlyAbortMonitor()
+            earlyAbort.init(paramsHolder)
+
+    # Pareto archive (optional, required by the pareto run mode): objectives of all the simulated shields, whatever the run mode
+    PARETO_ARCHIVE_FILE = paramsHolder.get("pareto_archive_file", "")
+    paretoArchive = None
+    if PARETO_ARCHIVE_FILE:
+        paretoArchive = ParetoArchive()
+        paretoArchive.init(PARETO_ARCHIVE_FILE)
+
+    # Feasible region sampling (optional): the acquisition is optimized over the candidates passing the pre-simulation constraints check
+    feasibleSampler = None
+    if optimizerConf.getParam("feasible_sampling"):
+        feasibleSampler = FeasibleRegionSampler()
+        feasibleSampler.init(search_space, searchSpBuilder, matSet, constrPar)
+
     histManager = HistoryManager()
-    x0, y0, prev_attempts = histManager.getHistory(HISTORY_FILE, HISTORY_SLICING_DIR)
+    # with optimizer checkpoints, the history points of a checkpoint which can be resumed are its own ones plus the ones evaluated after them
+    checkpointCheck = None
+    if (optimizerConf.getParam("optimizer_checkpoint") and (optimizerConf.getParam("run_mode") in CHECKPOINT_RUN_MODES)):
+        checkpointCheck = partial(get_checkpoint_mismatch, search_space=search_space, optimizerConf=optimizerConf)
+    x0, y0, prev_attempts = histManager.getHistory(HISTORY_FILE, HISTORY_SLICING_DIR, checkpointCheck)
+    # the history file gets the points (and their metadata) only: the last 'history_models' surrogate models (default: 1) and the
+    # specifications are saved aside, as heavy artifacts loaded upon request only
+    histManager.setPersistedModels(paramsHolder.get("history_models", 1))
+
+    # Failed evaluations (pre/post-simulation constraints check, simulation error): their categories are saved in the history, and with
+    # the 'feasibility_classifier' optimizer parameter they are kept out of the surrogate
+    failureRegistry = FailureRegistry()
+    failureRegistry.init(paramsHolder.get("penalization_value"), x0 if (y0 is not None) else None, histManager.getFailureCategories())
+    histManager.setFailureRegistry(failureRegistry)
+
+    # Simulation run times: saved in the history, and with a cost-aware acquisition function ('acq_func': EIps, PIps) learned by a run time model
+    runtimeRegistry = RuntimeRegistry()
+    runtimeRegistry.init(x0 if (y0 is not None) else None, histManager.getSimTimes())
+    histManager.setRuntimeRegistry(runtimeRegistry)
+
+    # History journal (default: enabled): each evaluation is journaled as soon as it completes, so that a crash (or the exit upon the target met)
+    # does not lose the evaluations since the last history update
+    historyJournal = histManager.openJournal() if paramsHolder.get("history_journal", True) else None
+
+    objective_fn = partial(objective, inParamsHolder=paramsHolder, search_sp_bldr=searchSpBuilder, materials_set=matSet, constr_par=constrPar, objf_evaluator=objFunEvaluator, trg_evaluator=targetEvaluator, sim_backend=simBackend, sim_cache=simCache, early_abort=earlyAbort, pareto_archive=paretoArchive, feasible_sampler=feasibleSampler, failure_registry=failureRegistry, runtime_registry=runtimeRegistry, history_journal=historyJournal)
+    if (earlyAbort is not None):
+        earlyAbort.initIncumbent(y0)
     x0 = process_retrieved_history(x0, MATERIALS, searchSpBuilder, prev_attempts, paramsHolder, optimizerConf)
 
     wrapped_post_callback = partial(post_sim_logic, prv_attempts=prev_attempts, irq_Manager=irqMgr, hist_Manager=histManager)
 
     x0isValid, reduced_x0 = histManager.checkX0(x0, search_space)
+    RUN_MODE = optimizerConf.getParam("run_mode")
+
+    # Pre-simulation screening (optional): the proposed points failing the pre-simulation constraints check are rejected (and told
+    # to the optimizer) before being evaluated, without consuming runs
+    preScreener = None
+    if optimizerConf.getParam("pre_screening"):
+        if (RUN_MODE not in ["sequential", "batch", "async", "pipelined"]):
+            logger.warning("[driver] Pre-simulation screening is supported only with the sequential, batch, async and pipelined run modes, it will be ignored")
+        else:
+            preScreener = PreScreener()
+            preScreener.init(paramsHolder, searchSpBuilder, matSet, constrPar, optimizerConf.getParam("pre_screening_max_asks"), failureRegistry)
+
+    # Optimizer checkpoint (optional): the ask/tell optimizer is saved along with the history (heavy artifacts), and resumed from it
+    # (with no refit) if it matches the configuration, the search space and the stored history (ref. getHistory above)
+    checkpoint = None
+    if optimizerConf.getParam("optimizer_checkpoint"):
+        if (RUN_MODE not in CHECKPOINT_RUN_MODES):
+            logger.warning("[driver] Optimizer checkpoints are supported only with the sequential, batch, async and pipelined run modes, they will be ignored")
+        elif (y0 is not None):
+            checkpoint = histManager.getCheckpoint()
+
+    # Island model (optional): observations exchanged with other optimizer instances through a shared store
+    ISLAND_STORE_DIR = paramsHolder.get("island_store_dir", "")
+    islandExchange = None
+    if ISLAND_STORE_DIR:
+        if (RUN_MODE not in ["batch", "async"]):
+            raise ValueError("[driver] ERROR. The island model ('island_store_dir') requires the batch or async run mode, got: " + str(RUN_MODE))
+        islandExchange = IslandExchange()
+        islandExchange.init(paramsHolder, search_space, x0 if (y0 is not None) else None)
+
     logger.info("[driver] Optimization loop BEGIN")
     t_begin = datetime.now()
-    result = gp_minimize(
-        objective_fn,
-        search_space,
-        n_calls=MAX_RUNS,
-        n_initial_points=INITIAL_POINTS,
-        x0=x0,
-        y0=y0,
-        callback=[wrapped_post_callback],
-        initial_point_generator=optimizerConf.getParam("initial_point_generator"),
-        acq_func=optimizerConf.getParam("acq_func"),
-        acq_optimizer=optimizerConf.getParam("acq_optimizer"),
-        random_state=optimizerConf.getParam("random_state"),
-        n_points=optimizerConf.getParam("n_points"),
-        n_restarts_optimizer=optimizerConf.getParam("n_restarts_optimizer"),
-        kappa=optimizerConf.getParam("kappa"),
-        xi=optimizerConf.getParam("xi"),
-        noise=optimizerConf.getParam("noise"),
-        n_jobs=optimizerConf.getParam("n_jobs"),
-        model_queue_size=optimizerConf.getParam("model_queue_size"),
-        verbose=OPTIM_VERBOSE
-    )
+    if (RUN_MODE == "batch"):
+        result = run_batch_optimization(objective_fn, search_space, x0, y0, MAX_RUNS, optimizerConf, wrapped_post_callback, islandExchange, feasibleSampler, failureRegistry, preScreener, runtimeRegistry, checkpoint)
+    elif (RUN_MODE == "async"):
+        result = run_async_optimization(objective_fn, search_space, x0, y0, MAX_RUNS, optimizerConf, wrapped_post_callback, islandExchange, feasibleSampler, failureRegistry, preScreener, runtimeRegistry, checkpoint)
+    elif (RUN_MODE == "pareto"):
+        result = run_pareto_optimization(objective_fn, search_space, x0, y0, MAX_RUNS, optimizerConf, wrapped_post_callback, paretoArchive, paramsHolder.get("penalization_value"), feasibleSampler, failureRegistry, runtimeRegistry)
+    elif (RUN_MODE == "multifidelity"):
+        result = run_multifidelity_optimization(objective_fn, search_space, x0, y0, MAX_RUNS, optimizerConf, wrapped_post_callback, paramsHolder.get("penalization_value"), feasibleSampler, failureRegistry, runtimeRegistry)
+    elif (RUN_MODE == "turbo"):
+        result = run_turbo_optimization(objective_fn, search_space, x0, y0, MAX_RUNS, optimizerConf, wrapped_post_callback, paramsHolder.get("penalization_value"), feasibleSampler, failureRegistry, runtimeRegistry)
+    elif (RUN_MODE == "bandit"):
+        result = run_bandit_optimization(objective_fn, search_space, x0, y0, MAX_RUNS, optimizerConf, wrapped_post_callback, feasibleSampler, failureRegistry, runtimeRegistry)
+    elif (RUN_MODE == "pipelined"):
+        result = run_pipelined_optimization(objective_fn, search_space, x0, y0, MAX_RUNS, optimizerConf, wrapped_post_callback, feasibleSampler, failureRegistry, preScreener, runtimeRegistry, checkpoint)
+    elif (RUN_MODE == "sequential"):
+        result = run_sequential_optimization(objective_fn, search_space, x0, y0, MAX_RUNS, optimizerConf, [wrapped_post_callback], OPTIM_VERBOSE, feasibleSampler, failureRegistry, preScreener, runtimeRegistry, checkpoint)
+    else:
+        raise ValueError("[driver] ERROR. Unknown run mode: " + str(RUN_MODE))
     mins, time_formatted = get_elapsed_time(t_begin, datetime.now())
     logger.info("[opttrace][driver] Optimization loop completed. Elapsed: " + time_formatted + " (mins: " + str(mins) + ")")
+    if (simCache is not None):
+        simCache.logStats()
+    if (earlyAbort is not None):
+        earlyAbort.logStats()
+    if (paretoArchive is not None):
+        paretoArchive.logFront(paramsHolder.get("pareto_front_file", ""))
+    if (islandExchange is not None):
+        islandExchange.publish()
+    if (feasibleSampler is not None):
+        feasibleSampler.logStats()
+    if (preScreener is not None):
+        preScreener.logStats()
+    failureRegistry.logStats()
+    runtimeRegistry.logStats()
     histManager.logBestSolution(result, searchSpBuilder)
     histManager.introspectResult(result, searchSpBuilder, "Optimization Summary")
     # Save state at the end
     histManager.updateHistory(result)
 
-    logger.debug("[driver] gp_minimize result full dump:")
+    logger.debug("[driver] Optimization result full dump:")
     logger.debug("[driver] " + str(result))
 
 if __name__ == '__main__':
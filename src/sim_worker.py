@@ -0,0 +1,119 @@
+import os
+import sys
+import signal
+import subprocess
+import threading
+import time
+
+py_root='./src'
+py_util=py_root + '/util'
+sys.path.append(py_root)
+sys.path.append(py_util)
+
+from cmdline_parsing import ParametersHolder
+from logging_utils import init_logger
+from css_metadata import build_geomconf_path, create_kpi_filepath
+from sim_queue import SimJobQueue, create_worker_id, write_json_atomic, JOB_STATUS_OK, JOB_STATUS_ERROR
+from sw_metadata import SoftwareMetadata
+
+# -------------------------------------
+# Simulation worker daemon: pulls simulation jobs from the shared queue directory (ref. sim_queue.py),
+# runs them on this node with the usual simulation script and returns the KPIs file contents.
+# -------------------------------------
+
+_stop_requested = threading.Event()
+
+def graceful_exit(signum, frame):
+    _stop_requested.set()
+
+signal.signal(signal.SIGTERM, graceful_exit)
+signal.signal(signal.SIGINT, graceful_exit)
+
+# Keeps the worker heartbeat and the lease on the current job alive, while the (long) simulation runs
+class LeaseKeeper(threading.Thread):
+    def __init__(self, simQueue, worker_id, interval):
+        super().__init__(name="leasekeeper", daemon=True)
+        self._sim_queue = simQueue
+        self._worker_id = worker_id
+        self._interval = interval
+        self._current_job = None
+        self._jobs_done = 0
+        self._lock = threading.Lock()
+
+    # 'job': the job being run (None once done)
+    def setCurrentJob(self, job):
+        with self._lock:
+            if ((job is None) and (self._current_job is not None)):
+                self._jobs_done = self._jobs_done + 1
+            self._current_job = job
+        self.beat()
+
+    def beat(self):
+        with self._lock:
+            job = self._current_job
+            info = {"worker": self._worker_id, "pid": os.getpid(), "current_job": job["sim_id"] if (job is not None) else None, "jobs_done": self._jobs_done, "heartbeat_at": time.time()}
+        self._sim_queue.heartbeat(self._worker_id, info)
+        if ((job is not None) and (not job.get("lease_revoked")) and (not self._sim_queue.renewLease(job["sim_id"], job["lease_token"]))):
+            job["lease_revoked"] = True
+            init_logger().warning("[worker][" + job["sim_id"] + "] Lease revoked (the job was resubmitted, or completed by another worker): its result will be discarded")
+
+    def run(self):
+        while (not _stop_requested.wait(self._interval)):
+            self.beat()
+
+def run_job(job, paramsHolder):
+    logger = init_logger()
+    sim_id = job["sim_id"]
+    geom_path = build_geomconf_path(paramsHolder.get("geom_config_files_dir"), sim_id)
+    write_json_atomic(geom_path, job["geometry"])
+    sim_script = paramsHolder.get("simulation_script")
+    fidelity = job.get("fidelity")
+    logger.info("[worker][" + sim_id + "] Calling simulation {script: " + sim_script + ", geometry: " + geom_path + ", fidelity: " + str(fidelity) + ", attempt: " + str(job.get("attempt")) + "} ..")
+    subprocess.run([sim_script] + [sim_id] + ([str(fidelity)] if (fidelity is not None) else []), check=True)
+    kpi_path, _ = create_kpi_filepath(paramsHolder.get("optimizer_out_dir"), sim_id)
+    with open(kpi_path, "r") as f:
+        return f.read()
+
+def main(args=None):
+    logger = init_logger()
+    swMetaData = SoftwareMetadata()
+    paramsHolder = ParametersHolder(swMetaData.getSWName() + " - Simulation worker", args, "--pr")
+    logger.info("[worker] " + swMetaData.getSWName() + " - Simulation worker, v. " + swMetaData.getSWVersion())
+    paramsHolder.dump(logger)
+
+    worker_id = paramsHolder.get("worker_id", create_worker_id())
+    poll_interval = paramsHolder.get("sim_poll_interval", 1.0)
+    simQueue = SimJobQueue()
+    simQueue.init(paramsHolder.get("sim_queue_dir"), paramsHolder.get("sim_lease_timeout", 60))
+
+    # heartbeat/lease renewal well within the lease timeout
+    leaseKeeper = LeaseKeeper(simQueue, worker_id, simQueue.getLeaseTimeout() / 4.0)
+    leaseKeeper.beat()
+    leaseKeeper.start()
+    logger.info("[worker] Worker " + worker_id + " started, waiting for simulation jobs")
+
+    while (not _stop_requested.is_set()):
+        job = simQueue.claim(worker_id)
+        if (job is None):
+            _stop_requested.wait(poll_interval)
+            continue
+
+        sim_id = job["sim_id"]
+        leaseKeeper.setCurrentJob(job)
+        try:
+            kpis_csv = run_job(job, paramsHolder)
+            delivered = simQueue.complete(sim_id, job["lease_token"], worker_id, JOB_STATUS_OK, kpis_csv, None)
+        except Exception as e:
+            logger.error(f"[worker][{sim_id}] Simulation failed: {e}")
+            delivered = simQueue.complete(sim_id, job["lease_token"], worker_id, JOB_STATUS_ERROR, None, f"{e}")
+        if delivered:
+            logger.info("[worker][" + sim_id + "] Simulation results returned")
+        else:
+            logger.warning("[worker][" + sim_id + "] Lease revoked meanwhile, results discarded")
+        leaseKeeper.setCurrentJob(None)
+
+    simQueue.unregisterWorker(worker_id)
+    logger.info("[worker] Worker " + worker_id + " stopped")
+
+if __name__ == '__main__':
+    main()
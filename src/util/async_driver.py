@@ -0,0 +1,124 @@
+import threading
+import time
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from logging_utils import init_logger
+from engine_factory import create_optimizer, ask_conditioned
+from batch_driver import SIM_SLOT_THREAD_PFIX, tell_with_islands
+from optimizer_checkpoint import resume_optimizer, tell_history, attach_checkpoint
+
+#slot utilisation statistics are logged every this many completed simulations (and at the end of the loop)
+SLOT_STATS_LOG_EVERY = 50
+
+# -------------------------------------
+# Simulator slots utilisation statistics
+# -------------------------------------
+class SimSlotStats:
+    def __init__(self, num_slots):
+        self._num_slots = num_slots
+        self._t_begin = time.monotonic()
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def record(self, slot_name, busy_secs):
+        with self._lock:
+            runs, busy = self._slots.get(slot_name, (0, 0.0))
+            self._slots[slot_name] = (runs + 1, busy + busy_secs)
+
+    def log(self):
+        logger = init_logger()
+        with self._lock:
+            elapsed = max(time.monotonic() - self._t_begin, 1e-9)
+            tot_busy = 0.0
+            for slot_name in sorted(self._slots):
+                runs, busy = self._slots[slot_name]
+                tot_busy = tot_busy + busy
+                logger.info(f"[opttrace][async] Slot {slot_name}: runs: {runs}, busy: {busy:.1f}s, utilisation: {100.0 * busy / elapsed:.1f}%")
+            logger.info(f"[opttrace][async] Slots overall utilisation: {100.0 * tot_busy / (elapsed * self._num_slots):.1f}% (slots: {self._num_slots}, elapsed: {elapsed:.1f}s)")
+
+# Runs the objective function on the calling simulator slot, returning also the slot name and the time it was busy
+def timed_objective(objective_fn, x):
+    t0 = time.monotonic()
+    y = objective_fn(x)
+    return y, threading.current_thread().name, time.monotonic() - t0
+
+# -------------------------------------
+# Asynchronous optimization loop
+# -------------------------------------
+
+# Keeps 'sim_slots' simulations in flight: as soon as any of them completes, its result is told to the optimizer
+# and ONE new point is asked, conditioned on the points still being simulated (constant liar, ref. 'batch_strategy').
+# With the pre-simulation screening ('preScreener'), the point is asked again while it fails the pre-simulation check.
+# With a checkpoint ('checkpoint', ref. OptimizerCheckpoint), the optimizer is resumed from it, and the points in flight when it was taken submitted first.
+def run_async_optimization(objective_fn, search_space, x0, y0, max_runs, optimizerConf, post_callback, islandExchange=None, feasibleSampler=None, failureRegistry=None, preScreener=None, runtimeRegistry=None, checkpoint=None):
+    logger = init_logger()
+    sim_slots = optimizerConf.getParam("sim_slots")
+    strategy = optimizerConf.getParam("batch_strategy")
+    if ((not isinstance(sim_slots, int)) or (sim_slots < 1)):
+        raise ValueError("[async] ERROR. 'sim_slots' must be a positive integer, got: " + str(sim_slots))
+
+    x0 = x0 or []
+    optimizer, pending_points = resume_optimizer(checkpoint, search_space, optimizerConf, x0, y0, feasibleSampler, failureRegistry, runtimeRegistry)
+    resumed = (optimizer is not None)
+    if (not resumed):
+        optimizer = create_optimizer(search_space, optimizerConf, len(x0), feasible_sampler=feasibleSampler, failure_registry=failureRegistry, runtime_registry=runtimeRegistry)
+    specs = {"args": {"max_runs": max_runs, "sim_slots": sim_slots, "batch_strategy": strategy}, "function": "run_async_optimization"}
+    logger.info("[async] Asynchronous optimization loop (simulator slots: " + str(sim_slots) + ", strategy: " + strategy + ")")
+
+    result = None
+    # Same semantics as gp_minimize: X0 without Y0 gets evaluated (and counted as runs), X0 with Y0 is just told
+    preset_points = list(pending_points)
+    if (x0 and (y0 is None)):
+        preset_points = list(x0)
+    elif x0:
+        result = tell_history(optimizer, x0, y0, resumed)
+        result.specs = specs
+        attach_checkpoint(result, optimizer, optimizerConf, preset_points)
+        if post_callback(result):
+            return result
+
+    slotStats = SimSlotStats(sim_slots)
+    in_flight = {}
+    submitted = 0
+    completed = 0
+    stop_requested = False
+    with ThreadPoolExecutor(max_workers=sim_slots, thread_name_prefix=SIM_SLOT_THREAD_PFIX) as executor:
+        while (in_flight or ((not stop_requested) and (submitted < max_runs))):
+            # refill every free slot
+            while ((not stop_requested) and (submitted < max_runs) and (len(in_flight) < sim_slots)):
+                if preset_points:
+                    next_x = preset_points.pop(0)
+                elif (preScreener is None):
+                    next_x = ask_conditioned(optimizer, list(in_flight.values()), strategy)
+                else:
+                    pending_points = list(in_flight.values())
+                    # with pending points the conditioned ask fits its own copy of the optimizer (no refit needed upon rejections)
+                    next_x = preScreener.askScreened(optimizer, partial(ask_conditioned, optimizer, pending_points, strategy), fit=(not pending_points))
+                in_flight[executor.submit(timed_objective, objective_fn, next_x)] = next_x
+                submitted = submitted + 1
+                logger.debug("[async] Point submitted (in flight: " + str(len(in_flight)) + ", submitted: " + str(submitted) + "/" + str(max_runs) + ")")
+
+            done, _ = wait(list(in_flight.keys()), return_when=FIRST_COMPLETED)
+            x_done, y_done = [], []
+            for fut in done:
+                x = in_flight.pop(fut)
+                y, slot_name, busy_secs = fut.result()
+                slotStats.record(slot_name, busy_secs)
+                x_done.append(x)
+                y_done.append(y)
+
+            # the surrogate is refitted here only if nothing is pending, otherwise the conditioned ask will fit its own copy
+            result = tell_with_islands(optimizer, x_done, y_done, islandExchange, fit=(len(in_flight) == 0))
+            result.specs = specs
+            attach_checkpoint(result, optimizer, optimizerConf, list(in_flight.values()) + preset_points, fitted=(len(in_flight) == 0))
+            completed = completed + len(x_done)
+            if ((completed // SLOT_STATS_LOG_EVERY) != ((completed - len(x_done)) // SLOT_STATS_LOG_EVERY)):
+                slotStats.log()
+            if ((not stop_requested) and post_callback(result)):
+                stop_requested = True
+                if in_flight:
+                    logger.info("[opttrace][async] Waiting for the simulations in flight to complete (" + str(len(in_flight)) + ")")
+
+    slotStats.log()
+    return result
@@ -0,0 +1,191 @@
+import itertools
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.stats import rankdata
+from sklearn.utils import check_random_state
+from skopt.utils import create_result, normalize_dimensions
+
+from logging_utils import init_logger
+from engine_factory import create_optimizer
+from batch_driver import evaluate_points, SIM_SLOT_THREAD_PFIX
+
+# -------------------------------------
+# Two-level (material sequence bandit + thicknesses BO) optimization loop
+# -------------------------------------
+# The material sequences admissible in the search space (number of layers, and raw material index of each layer, as
+# encoded by the search space builder: with no adjacent duplicates, unless allowed) are few enough to be enumerated.
+# Each sequence is an arm of a bandit; upon each round, 'sim_slots' arms are chosen (optimistically, lower confidence
+# bound on the rank of their shields' objective values), and for each of them a small ask/tell optimizer on the layer
+# thicknesses only (as many dimensions as layers) is fitted on the shields of that sequence, and asked for a point.
+# Statistics are shared along the prefix tree of the sequences: the estimate of a sequence is shrunk towards the one of
+# its prefix (the same stack, without its last layer), with weight 'bandit_prior_strength', so a sequence never tried
+# inherits the standing of its relatives. Ranks (instead of values) make the statistics insensitive to the penalization.
+# It requires a search space made of 'num_layers', 'material_index_<i>' and 'thickness_<i>' dimensions (e.g. Adv250814).
+
+# Indices of the num. layers, material index and thickness dimensions (by name)
+def get_layout(search_space):
+    names = [dim.name for dim in search_space]
+    if ("num_layers" not in names):
+        raise ValueError("[bandit] ERROR. The bandit run mode requires a 'num_layers' dimension in the search space")
+    max_layers = search_space[names.index("num_layers")].high
+    try:
+        mat_idxs = [names.index("material_index_" + str(i + 1)) for i in range(max_layers)]
+        thick_idxs = [names.index("thickness_" + str(i + 1)) for i in range(max_layers)]
+    except ValueError:
+        raise ValueError("[bandit] ERROR. The bandit run mode requires 'material_index_<i>' and 'thickness_<i>' dimensions for each layer in the search space")
+    return names.index("num_layers"), mat_idxs, thick_idxs
+
+# All the admissible sequences (arms), as tuples of raw material indexes (the number of layers being their length)
+def enumerate_sequences(search_space, layout, max_arms):
+    nl_idx, mat_idxs, _ = layout
+    nl_dim = search_space[nl_idx]
+    sequences = []
+    for num_layers in range(nl_dim.low, nl_dim.high + 1):
+        ranges = [range(search_space[mat_idxs[i]].low, search_space[mat_idxs[i]].high + 1) for i in range(num_layers)]
+        if (len(sequences) + math.prod(len(r) for r in ranges) > max_arms):
+            raise ValueError("[bandit] ERROR. Too many material sequences (more than 'bandit_max_arms': " + str(max_arms) + "), reduce the number of materials or layers")
+        sequences.extend(itertools.product(*ranges))
+    return sequences
+
+def get_sequence(x, layout):
+    nl_idx, mat_idxs, _ = layout
+    return tuple(int(x[mat_idxs[i]]) for i in range(int(x[nl_idx])))
+
+# Search space point for the given sequence and thicknesses (unused layers, ignored by the builders, at their lower bound)
+def build_point(search_space, layout, sequence, thicknesses):
+    nl_idx, mat_idxs, thick_idxs = layout
+    x = [dim.low for dim in search_space]
+    x[nl_idx] = len(sequence)
+    for i, (mat, thick) in enumerate(zip(sequence, thicknesses)):
+        x[mat_idxs[i]] = mat
+        x[thick_idxs[i]] = thick
+    return x
+
+# Shrunk estimates (mean rank, lower is better) and observations count of every sequence and prefix
+def get_estimates(sequences, x_iters, func_vals, layout, prior_strength):
+    ranks = (rankdata(func_vals) - 1.0) / max(1, len(func_vals) - 1) if func_vals else []
+    sums, counts = {}, {}
+    for xi, ri in zip(x_iters, ranks):
+        seq = get_sequence(xi, layout)
+        for plen in range(len(seq) + 1):
+            sums[seq[:plen]] = sums.get(seq[:plen], 0.0) + ri
+            counts[seq[:plen]] = counts.get(seq[:plen], 0) + 1
+
+    estimates = {}
+    def estimate(node):
+        if (node not in estimates):
+            prior = 0.5 if (len(node) == 0) else estimate(node[:-1])
+            estimates[node] = (sums.get(node, 0.0) + prior_strength * prior) / (counts.get(node, 0) + prior_strength)
+        return estimates[node]
+    for seq in sequences:
+        estimate(seq)
+    return estimates, counts
+
+def validate_bandit_params(exploration, prior_strength, arm_initial_points, max_arms):
+    if ((not isinstance(exploration, (int, float))) or (exploration < 0.0)):
+        raise ValueError("[bandit] ERROR. 'bandit_exploration' must be a non-negative number, got: " + str(exploration))
+    if ((not isinstance(prior_strength, (int, float))) or (prior_strength <= 0.0)):
+        raise ValueError("[bandit] ERROR. 'bandit_prior_strength' must be a positive number, got: " + str(prior_strength))
+    if ((not isinstance(arm_initial_points, int)) or (arm_initial_points < 1)):
+        raise ValueError("[bandit] ERROR. 'bandit_arm_initial_points' must be a positive integer, got: " + str(arm_initial_points))
+    if ((not isinstance(max_arms, int)) or (max_arms < 1)):
+        raise ValueError("[bandit] ERROR. 'bandit_max_arms' must be a positive integer, got: " + str(max_arms))
+
+def run_bandit_optimization(objective_fn, search_space, x0, y0, max_runs, optimizerConf, post_callback, feasibleSampler=None, failureRegistry=None, runtimeRegistry=None):
+    logger = init_logger()
+    sim_slots = optimizerConf.getParam("sim_slots")
+    strategy = optimizerConf.getParam("batch_strategy")
+    exploration = optimizerConf.getParam("bandit_exploration")
+    prior_strength = optimizerConf.getParam("bandit_prior_strength")
+    arm_initial_points = optimizerConf.getParam("bandit_arm_initial_points")
+    max_arms = optimizerConf.getParam("bandit_max_arms")
+    if ((not isinstance(sim_slots, int)) or (sim_slots < 1)):
+        raise ValueError("[bandit] ERROR. 'sim_slots' must be a positive integer, got: " + str(sim_slots))
+    validate_bandit_params(exploration, prior_strength, arm_initial_points, max_arms)
+
+    layout = get_layout(search_space)
+    sequences = enumerate_sequences(search_space, layout, max_arms)
+    rng = check_random_state(optimizerConf.getParam("random_state"))
+    space = normalize_dimensions(search_space)
+    specs = {"args": {"max_runs": max_runs, "sim_slots": sim_slots, "batch_strategy": strategy, "bandit_exploration": exploration, "bandit_prior_strength": prior_strength,
+                      "bandit_arm_initial_points": arm_initial_points}, "function": "run_bandit_optimization"}
+    logger.info("[bandit] Material sequences bandit optimization loop (sequences: " + str(len(sequences)) + ", exploration: " + str(exploration) + ", prior strength: " + str(prior_strength) +
+                ", initial points per sequence: " + str(arm_initial_points) + ", simulator slots: " + str(sim_slots) + ")")
+
+    x_iters = []
+    func_vals = []
+    result = None
+    remaining_runs = max_runs
+    x0 = x0 or []
+    # initial design on the whole search space (its points are random, so this optimizer is never fitted). The thicknesses optimizers
+    # work on the thicknesses only, hence they do not sample the feasible region (if 'feasibleSampler' is specified, only the design does),
+    # nor they weight the acquisition by the run time (the run times are recorded for the whole points)
+    design_opt = create_optimizer(search_space, optimizerConf, len(x0), rng.randint(0, np.iinfo(np.int32).max), feasible_sampler=feasibleSampler, failure_registry=failureRegistry, runtime_registry=runtimeRegistry)
+    with ThreadPoolExecutor(max_workers=sim_slots, thread_name_prefix=SIM_SLOT_THREAD_PFIX) as executor:
+        # Same semantics as gp_minimize: X0 without Y0 gets evaluated (and counted as runs), X0 with Y0 is just taken as is
+        if (x0 and (y0 is None)):
+            logger.info("[opttrace][bandit] Evaluating X0 points (" + str(len(x0)) + ")")
+            y0 = evaluate_points(executor, objective_fn, x0)
+            remaining_runs = remaining_runs - len(x0)
+        if x0:
+            x_iters, func_vals = list(x0), list(y0)
+            design_opt.tell(x_iters, func_vals, fit=False)
+            result = create_result(x_iters, func_vals, space, rng, specs)
+            if post_callback(result):
+                return result
+
+        # X0 already told: what is left of the initial design is the configured number of initial points
+        init_points_left = optimizerConf.getParam("n_initial_points")
+        round_nbr = 0
+        while ((remaining_runs > 0) and (init_points_left > 0)):
+            round_nbr = round_nbr + 1
+            batch_sz = min(sim_slots, init_points_left, remaining_runs)
+            x_batch = design_opt.ask(n_points=batch_sz, strategy=strategy)
+            logger.info("[opttrace][bandit] Round " + str(round_nbr) + ": dispatching " + str(batch_sz) + " points to the simulator slots (initial design)")
+            y_batch = evaluate_points(executor, objective_fn, x_batch)
+            design_opt.tell(x_batch, y_batch, fit=False)
+            x_iters = x_iters + list(x_batch)
+            func_vals = func_vals + list(y_batch)
+            remaining_runs = remaining_runs - batch_sz
+            init_points_left = init_points_left - batch_sz
+            result = create_result(x_iters, func_vals, space, rng, specs)
+            if post_callback(result):
+                return result
+
+        while (remaining_runs > 0):
+            round_nbr = round_nbr + 1
+            batch_sz = min(sim_slots, remaining_runs)
+            estimates, counts = get_estimates(sequences, x_iters, func_vals, layout, prior_strength)
+            # arms chosen one at a time, the ones already chosen in this round counting as observed (to spread the batch)
+            pending = {}
+            log_total = math.log(1.0 + len(x_iters))
+            for _ in range(batch_sz):
+                scores = [estimates[seq] - exploration * math.sqrt(log_total / (1.0 + counts.get(seq, 0) + pending.get(seq, 0))) for seq in sequences]
+                best_score = min(scores)
+                chosen = [seq for seq, score in zip(sequences, scores) if (score <= best_score + 1e-12)]
+                seq = chosen[rng.randint(0, len(chosen))]
+                pending[seq] = pending.get(seq, 0) + 1
+
+            x_batch = []
+            _, _, thick_idxs = layout
+            for seq, num_points in pending.items():
+                seq_data = [(xi, yi) for xi, yi in zip(x_iters, func_vals) if (get_sequence(xi, layout) == seq)]
+                thick_dims = [search_space[thick_idxs[i]] for i in range(len(seq))]
+                opt = create_optimizer(thick_dims, optimizerConf, 0, rng.randint(0, np.iinfo(np.int32).max), n_initial_points=arm_initial_points, failure_registry=failureRegistry)
+                if seq_data:
+                    opt.tell([[xi[thick_idxs[i]] for i in range(len(seq))] for xi, _ in seq_data], [yi for _, yi in seq_data])
+                thicknesses = opt.ask(n_points=num_points, strategy=strategy)
+                x_batch = x_batch + [build_point(search_space, layout, seq, th) for th in thicknesses]
+                logger.info("[opttrace][bandit] Round " + str(round_nbr) + ": sequence " + str(list(seq)) + " (shields: " + str(len(seq_data)) + ", estimated rank: " + str(round(estimates[seq], 3)) + "), asking " + str(num_points) + " points")
+
+            y_batch = evaluate_points(executor, objective_fn, x_batch)
+            x_iters = x_iters + list(x_batch)
+            func_vals = func_vals + list(y_batch)
+            remaining_runs = remaining_runs - len(x_batch)
+            result = create_result(x_iters, func_vals, space, rng, specs)
+            if post_callback(result):
+                break
+
+    return result
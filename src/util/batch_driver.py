@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from logging_utils import init_logger
+from engine_factory import create_optimizer, get_initial_points_left
+from optimizer_checkpoint import resume_optimizer, tell_history, attach_checkpoint
+
+SIM_SLOT_THREAD_PFIX = "simslot"
+
+# -------------------------------------
+# Batch (synchronous, parallel) optimization loop
+# -------------------------------------
+
+# Evaluates the given points concurrently, one per simulator slot, and returns the objective values in the same order.
+# A SystemExit raised by the objective function (target met) is re-raised here, in the main thread.
+def evaluate_points(executor, objective_fn, points):
+    futures = [executor.submit(objective_fn, pt) for pt in points]
+    return [f.result() for f in futures]
+
+# Tells the optimizer the given points, plus the new points of the other islands (if any, with the island model)
+def tell_with_islands(optimizer, x, y, islandExchange, fit=True):
+    if (islandExchange is not None):
+        imported_x, imported_y = islandExchange.exchange(x, y)
+        x, y = list(x) + imported_x, list(y) + imported_y
+    return optimizer.tell(x, y, fit=fit)
+
+# With the island model ('islandExchange'), the points simulated by the other islands are told along with each round's ones.
+# With the pre-simulation screening ('preScreener'), the points of each round failing the pre-simulation check are replaced before dispatching.
+# With a checkpoint ('checkpoint', ref. OptimizerCheckpoint), the optimizer is resumed from it, and its pending points dispatched first
+def run_batch_optimization(objective_fn, search_space, x0, y0, max_runs, optimizerConf, post_callback, islandExchange=None, feasibleSampler=None, failureRegistry=None, preScreener=None, runtimeRegistry=None, checkpoint=None):
+    logger = init_logger()
+    sim_slots = optimizerConf.getParam("sim_slots")
+    strategy = optimizerConf.getParam("batch_strategy")
+    if ((not isinstance(sim_slots, int)) or (sim_slots < 1)):
+        raise ValueError("[batch] ERROR. 'sim_slots' must be a positive integer, got: " + str(sim_slots))
+    # initial design (X0 and random points): its points are independent, so they can be dispatched in larger rounds
+    # (e.g. many shields per simulator invocation, with the manifest simulation backend). 0 means: same as 'sim_slots'
+    init_batch_size = optimizerConf.getParam("initial_batch_size")
+    if ((not isinstance(init_batch_size, int)) or (init_batch_size < 0)):
+        raise ValueError("[batch] ERROR. 'initial_batch_size' must be a non-negative integer, got: " + str(init_batch_size))
+    init_batch_size = init_batch_size or sim_slots
+
+    x0 = x0 or []
+    optimizer, pending_points = resume_optimizer(checkpoint, search_space, optimizerConf, x0, y0, feasibleSampler, failureRegistry, runtimeRegistry)
+    resumed = (optimizer is not None)
+    if (not resumed):
+        optimizer = create_optimizer(search_space, optimizerConf, len(x0), feasible_sampler=feasibleSampler, failure_registry=failureRegistry, runtime_registry=runtimeRegistry)
+    specs = {"args": {"max_runs": max_runs, "sim_slots": sim_slots, "initial_batch_size": init_batch_size, "batch_strategy": strategy}, "function": "run_batch_optimization"}
+    logger.info("[batch] Batch optimization loop (simulator slots: " + str(sim_slots) + ", initial design batch size: " + str(init_batch_size) + ", strategy: " + strategy + ")")
+
+    result = None
+    remaining_runs = max_runs
+    with ThreadPoolExecutor(max_workers=max(sim_slots, init_batch_size), thread_name_prefix=SIM_SLOT_THREAD_PFIX) as executor:
+        # Same semantics as gp_minimize: X0 without Y0 gets evaluated (and counted as runs), X0 with Y0 is just told
+        if (x0 and (y0 is None)):
+            for i in range(0, len(x0), init_batch_size):
+                x_batch = x0[i:i + init_batch_size]
+                logger.info("[opttrace][batch] Evaluating X0 points (" + str(len(x_batch)) + ")")
+                y_batch = evaluate_points(executor, objective_fn, x_batch)
+                result = tell_with_islands(optimizer, x_batch, y_batch, islandExchange)
+                result.specs = specs
+                attach_checkpoint(result, optimizer, optimizerConf)
+                remaining_runs = remaining_runs - len(x_batch)
+                if post_callback(result):
+                    return result
+        elif x0:
+            result = tell_history(optimizer, x0, y0, resumed)
+            result.specs = specs
+            attach_checkpoint(result, optimizer, optimizerConf)
+            if post_callback(result):
+                return result
+
+        round_nbr = 0
+        while (remaining_runs > 0):
+            round_nbr = round_nbr + 1
+            # the optimizer keeps proposing random points until the initial design is complete
+            init_points_left = get_initial_points_left(optimizer)
+            if (init_points_left > 0):
+                batch_sz = min(max(sim_slots, min(init_batch_size, init_points_left)), remaining_runs)
+            else:
+                batch_sz = min(sim_slots, remaining_runs)
+            if pending_points:
+                batch_sz = min(len(pending_points), sim_slots, remaining_runs)
+                x_batch, pending_points = pending_points[:batch_sz], pending_points[batch_sz:]
+            elif (preScreener is None):
+                x_batch = optimizer.ask(n_points=batch_sz, strategy=strategy)
+            else:
+                x_batch = preScreener.askBatchScreened(optimizer, batch_sz, strategy)
+            logger.info("[opttrace][batch] Round " + str(round_nbr) + ": dispatching " + str(batch_sz) + " points to the simulator slots" + (" (initial design)" if (init_points_left > 0) else ""))
+            y_batch = evaluate_points(executor, objective_fn, x_batch)
+            result = tell_with_islands(optimizer, x_batch, y_batch, islandExchange)
+            result.specs = specs
+            attach_checkpoint(result, optimizer, optimizerConf, pending_points)
+            remaining_runs = remaining_runs - batch_sz
+            if post_callback(result):
+                break
+
+    return result
@@ -11,7 +11,7 @@ def parse_args(args=None):
     #parser.add_argument("-ip", "--initial-points", type=int, help="Number of random initial points", default=200)
     parser.add_argument("-hf", "--history-file", type=str, help="Attempts history file path", default="./state/css_optimizer_state.pkl")
     #parser.add_argument("-hc", "--history-clip", type=int, help="Latest slice to consider, of the history", default=0)
-    parser.add_argument("-hs", "--history-slice", type=str, help="History slicing directive ('a:b' -> from a-th element, length b, 'a:'  -> from a-th element to end, ':b'  -> first b elements, '-:b'  -> last b elements)", default=None)
+    parser.add_argument("-hs", "--history-slice", type=str, help="History slicing directive ('a:b' -> from a-th element, length b, 'a:'  -> from a-th element to end, ':b'  -> first b elements, '-:b'  -> last b elements, coresets: 'best:k' -> k best, 'diverse:k' -> best of k clusters, 'strata:k' -> k best across material sequences, combined with '+')", default=None)
     parser.add_argument("-ee", "--energy-efficiency", type=float, help="Target energy efficiency", default=0.9)
     parser.add_argument("-pe", "--protection-efficiency", type=float, help="Target protection efficiency", default=0.9)
     parser.add_argument("-pv", "--penalize-value", type=float, help="Value for penalization", default=1e6)
@@ -1,28 +1,84 @@
-
+import hashlib
+import os
+import socket
+import threading
 from datetime import datetime
 
 #useful to build the ID of the optimization run
 RUNTIMESTAMP_FMT = "%y%m%d%H%M%S"
+RUN_ID_SEQ_MOD = 10000
+RUN_ID_MAX_ALLOC_ATTEMPTS = 20
 
 #useful for geometry file creation
 GEOM_FILENAME_PFIX = "geometry_"
 GEOM_FILENAME_EXT = "json"
 
+#useful for multi-geometry manifest file creation
+MANIFEST_FILENAME_PFIX = "manifest_"
+MANIFEST_FILENAME_EXT = "txt"
+
 #useful for KPIs filename definition
 KPI_FILE_DELIM = ";"
 OUT_DIR_PFIX = "r"
 KPI_FILE_PFIX = "glob_kpis_"
 KPI_FILE_EXT = "csv"
+PARTIAL_KPI_FILE_PFIX = "partial_kpis_"
+
+_run_id_lock = threading.Lock()
+_run_id_seq = 0
+
+# short, stable tag identifying this host in the run IDs
+def get_node_tag():
+    return hashlib.sha1(socket.gethostname().encode("utf-8")).hexdigest()[:6]
 
+# Run ID format: <yymmddHHMMSS><microseconds>-<node tag><pid><sequence>
+# The timestamp prefix keeps the IDs lexically sortable, the suffix makes them unique across threads, processes and hosts.
 def create_run_id():
-    run_idf = datetime.now().strftime(RUNTIMESTAMP_FMT)
+    global _run_id_seq
+    with _run_id_lock:
+        _run_id_seq = (_run_id_seq + 1) % RUN_ID_SEQ_MOD
+        seq = _run_id_seq
+    now = datetime.now()
+    run_idf = now.strftime(RUNTIMESTAMP_FMT) + f"{now.microsecond:06d}-{get_node_tag()}{os.getpid():07d}{seq:04d}"
     return run_idf
 
+# Allocates a new run ID, atomically reserving its output directory and its geometry configuration file
+# (they are created exclusively, so a run can never overwrite the workspace of another one, whatever process or host created it).
+# Returns the run ID, the geometry configuration file path and the output directory path.
+def allocate_run_workspace(conf_dir, out_root_dir):
+    os.makedirs(out_root_dir, exist_ok=True)
+    os.makedirs(conf_dir, exist_ok=True)
+    for _ in range(RUN_ID_MAX_ALLOC_ATTEMPTS):
+        run_id = create_run_id()
+        out_dir = build_outdir_path(out_root_dir, run_id)
+        try:
+            os.mkdir(out_dir)
+        except FileExistsError:
+            continue
+        gconf_path = build_geomconf_path(conf_dir, run_id)
+        try:
+            os.close(os.open(gconf_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            os.rmdir(out_dir)
+            continue
+        return run_id, gconf_path, out_dir
+    raise RuntimeError("[metadata] ERROR. Could not allocate a unique run ID (attempts: " + str(RUN_ID_MAX_ALLOC_ATTEMPTS) + ")")
+
 def build_geomconf_path(conf_dir, run_id):
     gconf_path = conf_dir + "/" + GEOM_FILENAME_PFIX + run_id + '.' + GEOM_FILENAME_EXT
     return gconf_path
 
+def build_manifest_path(conf_dir, batch_id):
+    return conf_dir + "/" + MANIFEST_FILENAME_PFIX + batch_id + '.' + MANIFEST_FILENAME_EXT
+
+def build_outdir_path(out_root_dir, run_id):
+    return out_root_dir + "/" + OUT_DIR_PFIX + run_id
+
 def create_kpi_filepath(out_root_dir, run_id):
-    k_path = out_root_dir + "/" + OUT_DIR_PFIX + run_id + "/" + KPI_FILE_PFIX + run_id + "." + KPI_FILE_EXT
+    k_path = build_outdir_path(out_root_dir, run_id) + "/" + KPI_FILE_PFIX + run_id + "." + KPI_FILE_EXT
     return k_path, KPI_FILE_DELIM
 
+# partial KPI snapshots, streamed by the simulator while running (ref. early_abort.py)
+def create_partial_kpi_filepath(out_root_dir, run_id):
+    pk_path = build_outdir_path(out_root_dir, run_id) + "/" + PARTIAL_KPI_FILE_PFIX + run_id + "." + KPI_FILE_EXT
+    return pk_path, KPI_FILE_DELIM
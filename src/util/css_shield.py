@@ -9,6 +9,7 @@ class CssShield:
         self._tot_thickness = 0
         self._stiffness = 0
         self._max_eff_layer_thick = 0
+        self._merged_layers = []
         self._tot_weight = None
         self._nbr_of_layers = 0
         self._tco = 0
@@ -79,6 +80,7 @@ class CssShield:
                 foundConsecSameMats = foundConsecSameMats + 1
             else:
                 merged_layers.append((material, thickness))
+        self._merged_layers = merged_layers
         self._max_eff_layer_thick = max(thickness for _, thickness in merged_layers)
         logger.debug("[shield] Shield init. Max layer effective thickness: " + str(self._max_eff_layer_thick))
 
@@ -111,6 +113,12 @@ class CssShield:
             raise RuntimeError("[shield] ERROR. Bad Sequence: 'getLayersGeomInfo' cannot be called here, as the shield has not been initialized!")
         return self._layers_geom
 
+    #returns the layers with the consecutive layers made of the same material merged together, i.e. the shield as the simulator actually sees it
+    def getMergedLayers(self):
+        if (not self._is_initialized):
+            raise RuntimeError("[shield] ERROR. Bad Sequence: 'getMergedLayers' cannot be called here, as the shield has not been initialized!")
+        return self._merged_layers
+
     def getNumOfLayers(self):
         if (not self._is_initialized):
             raise RuntimeError("[shield] ERROR. Bad Sequence: 'getNumOfLayers' cannot be called here, as the shield has not been initialized!")
@@ -0,0 +1,140 @@
+import csv
+import os
+import signal
+import subprocess
+import threading
+
+from logging_utils import init_logger
+from pickling_utils import TransientStateMixin
+from kpis_utils import KPIHolder
+from css_metadata import create_partial_kpi_filepath
+
+# -------------------------------------
+# Early abort of running simulations, from streamed partial KPIs
+# -------------------------------------
+# While running, the simulator can append periodic partial KPI snapshots to <out dir>/r<id>/partial_kpis_<id>.csv:
+#   Events;GlobNormWeight;EnergyEfficiency;EnergyEfficiencyErr;ProtectionEfficiency;ProtectionEfficiencyErr
+# (running estimates, with their statistical errors). The run is killed as soon as, with the efficiencies at their upper
+# confidence bound (estimate + z * error), the shield could neither meet the targets, nor beat the incumbent (best objective
+# function value so far). The objective function evaluators reward higher efficiencies, so this bound is optimistic.
+PARTIAL_KPIS_HEADER = ["Events", "GlobNormWeight", "EnergyEfficiency", "EnergyEfficiencyErr", "ProtectionEfficiency", "ProtectionEfficiencyErr"]
+
+# Returns the most recent complete snapshot as a dictionary, or None
+def read_last_partial_kpis(partial_kpis_path, delim):
+    try:
+        with open(partial_kpis_path, "r") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return None
+    # the last line may be still being written by the simulator
+    rows = [row for row in csv.reader(lines[1:], delimiter=delim) if (len(row) == len(PARTIAL_KPIS_HEADER))]
+    if (not rows):
+        return None
+    try:
+        values = [float(v) for v in rows[-1]]
+    except ValueError:
+        return None
+    snapshot = dict(zip(PARTIAL_KPIS_HEADER, values))
+    snapshot["snapshots"] = len(rows)
+    return snapshot
+
+class EarlyAbortMonitor(TransientStateMixin):
+    def __init__(self):
+        self._ucb_z = None
+        self._min_snapshots = None
+        self._monitor_interval = None
+        self._pn_value = None
+        self._incumbent = None
+        self._num_aborted = 0
+        self._lock = threading.Lock()
+        self._is_initialized = False
+
+    def init(self, paramsHolder):
+        logger = init_logger()
+        self._ucb_z = paramsHolder.get("early_abort_ucb_z", 2.0)
+        self._min_snapshots = paramsHolder.get("early_abort_min_snapshots", 2)
+        self._monitor_interval = paramsHolder.get("sim_monitor_interval", 5.0)
+        self._pn_value = paramsHolder.get("penalization_value")
+        self._is_initialized = True
+        logger.info("[abort] Early abort of simulations enabled (UCB z: " + str(self._ucb_z) + ", min. snapshots: " + str(self._min_snapshots) + ", monitoring interval: " + str(self._monitor_interval) + "s)")
+
+    # The incumbent is initialized from the history, and then kept up to date with each complete (i.e. not aborted) evaluation
+    def initIncumbent(self, y0):
+        for yi in (y0 or []):
+            self.updateIncumbent(yi)
+
+    def updateIncumbent(self, obj_fun_val):
+        if ((obj_fun_val is None) or (obj_fun_val >= self._pn_value)):
+            return
+        with self._lock:
+            if ((self._incumbent is None) or (obj_fun_val < self._incumbent)):
+                self._incumbent = obj_fun_val
+
+    def getIncumbent(self):
+        with self._lock:
+            return self._incumbent
+
+    def _shouldAbort(self, sim_id, snapshot, shield, objFunEvaluator, trgReachedEvaluator):
+        logger = init_logger()
+        incumbent = self.getIncumbent()
+        if ((incumbent is None) or (snapshot["snapshots"] < self._min_snapshots)):
+            return False
+        ucb_kpis = KPIHolder()
+        ucb_kpis.initFromDict(sim_id, {
+            "shield_weight": snapshot["GlobNormWeight"],
+            "energy_efficiency": min(snapshot["EnergyEfficiency"] + self._ucb_z * snapshot["EnergyEfficiencyErr"], 1.0),
+            "protection_efficiency": min(snapshot["ProtectionEfficiency"] + self._ucb_z * snapshot["ProtectionEfficiencyErr"], 1.0)
+        }, objFunEvaluator, trgReachedEvaluator)
+        if ucb_kpis.targetIsMet():
+            return False
+        ucb_obj_fun = ucb_kpis.evalObjFunction(shield)
+        logger.debug(f"[abort][{sim_id}] Events: {snapshot['Events']:.0f}, optimistic obj. function: {ucb_obj_fun}, incumbent: {incumbent}")
+        return (ucb_obj_fun >= incumbent)
+
+    def _kill(self, proc):
+        try:
+            os.killpg(proc.pid, signal.SIGTERM)
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+            proc.wait()
+        except ProcessLookupError:
+            pass
+
+    # Runs the simulation script, monitoring its partial KPIs. Returns None if the simulation completed, or the KPIs
+    # dictionary of its partial estimate if it was aborted. A simulation failure raises CalledProcessError, as with check=True.
+    def runSimulation(self, sim_cmd, sim_id, out_data_dir, shield, objFunEvaluator, trgReachedEvaluator):
+        logger = init_logger()
+        if (not self._is_initialized):
+            raise RuntimeError("[abort] ERROR. Bad Sequence. 'runSimulation' cannot be called here, as the early abort monitor has not been initialized")
+        partial_kpis_path, delim = create_partial_kpi_filepath(out_data_dir, sim_id)
+        # own process group, so the whole simulator process tree can be killed
+        proc = subprocess.Popen(sim_cmd, start_new_session=True)
+        try:
+            while True:
+                try:
+                    retcode = proc.wait(timeout=self._monitor_interval)
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+                snapshot = read_last_partial_kpis(partial_kpis_path, delim)
+                if ((snapshot is not None) and self._shouldAbort(sim_id, snapshot, shield, objFunEvaluator, trgReachedEvaluator)):
+                    self._kill(proc)
+                    with self._lock:
+                        self._num_aborted = self._num_aborted + 1
+                    logger.info(f"[opttrace][abort][{sim_id}] Simulation ABORTED after {snapshot['Events']:.0f} events: it can neither meet the targets nor beat the incumbent ({self.getIncumbent()})")
+                    return {"shield_weight": snapshot["GlobNormWeight"], "energy_efficiency": snapshot["EnergyEfficiency"], "protection_efficiency": snapshot["ProtectionEfficiency"]}
+        except BaseException:
+            # e.g. SystemExit/KeyboardInterrupt: the simulator must not be left running
+            if (proc.poll() is None):
+                self._kill(proc)
+            raise
+        if (retcode != 0):
+            raise subprocess.CalledProcessError(retcode, sim_cmd)
+        return None
+
+    def logStats(self):
+        logger = init_logger()
+        with self._lock:
+            num_aborted = self._num_aborted
+        logger.info("[opttrace][abort] Simulations aborted early: " + str(num_aborted) + " (incumbent: " + str(self.getIncumbent()) + ")")
@@ -0,0 +1,215 @@
+from functools import partial
+
+import numpy as np
+
+from sklearn.utils import check_random_state
+from sklearn.ensemble import GradientBoostingRegressor
+from skopt import gp_minimize, forest_minimize, gbrt_minimize
+from skopt.callbacks import VerboseCallback
+from skopt.utils import cook_estimator, normalize_dimensions, eval_callbacks
+
+from logging_utils import init_logger
+from surrogates import TimedGaussianProcessRegressor, LocalGPRegressor, LocalGPStateCache, QuantileGBRTRegressor
+from feasible_sampler import FeasibleOptimizer
+from feasibility_classifier import FeasibilityAwareOptimizer
+from runtime_model import CostAwareOptimizer, COST_AWARE_ACQ_FUNCS
+from optimizer_checkpoint import resume_optimizer, tell_history, attach_checkpoint
+
+# -------------------------------------
+# Optimization engines
+# -------------------------------------
+# The engine ('engine' parameter) is the surrogate model family, each one with its skopt sequential minimizer:
+# - gp: Gaussian process (gp_minimize), the exact one or the local GP partition ('surrogate' parameter)
+# - forest: random forest or extremely randomized trees (forest_minimize, 'forest_base_estimator': RF, ET)
+# - gbrt: gradient boosted quantile regression trees (gbrt_minimize)
+# Tree ensembles cope with the integer (material index) dimensions better than a GP with a stationary kernel, and
+# their fit cost is much lower. They provide no gradients, so the acquisition function is optimized by sampling.
+SEQUENTIAL_MINIMIZERS = {"gp": gp_minimize, "forest": forest_minimize, "gbrt": gbrt_minimize}
+
+# Builds the surrogate model (regressor) of the configured engine. For the GP engine, ref. the 'surrogate' parameter:
+# - gp: exact GP, same as the one gp_minimize builds (fit cost growing as O(n^3) with the number of points)
+# - local_gp: local GP partition, with exact GPs on regions of at most 'local_gp_partition_size' points, incrementally updated
+# Both report the time spent in each fit.
+def create_surrogate(search_space, optimizerConf, random_state=None):
+    engine = optimizerConf.getParam("engine")
+    rng = check_random_state(random_state)
+    if (engine == "forest"):
+        return cook_estimator(optimizerConf.getParam("forest_base_estimator"), random_state=rng.randint(0, np.iinfo(np.int32).max), n_jobs=optimizerConf.getParam("n_jobs"),
+                              n_estimators=optimizerConf.getParam("forest_n_estimators"), min_samples_leaf=optimizerConf.getParam("forest_min_samples_leaf"))
+    elif (engine == "gbrt"):
+        gbrt = GradientBoostingRegressor(n_estimators=optimizerConf.getParam("gbrt_n_estimators"), loss="quantile")
+        return QuantileGBRTRegressor(base_estimator=gbrt, random_state=rng.randint(0, np.iinfo(np.int32).max), n_jobs=optimizerConf.getParam("n_jobs"))
+
+    space = normalize_dimensions(search_space)
+    gp = cook_estimator("GP", space=space, random_state=rng.randint(0, np.iinfo(np.int32).max), noise=optimizerConf.getParam("noise"))
+    if (optimizerConf.getParam("surrogate") == "gp"):
+        return TimedGaussianProcessRegressor(**gp.get_params(deep=False))
+    return LocalGPRegressor(base_estimator=gp, partition_size=optimizerConf.getParam("local_gp_partition_size"), random_state=rng.randint(0, np.iinfo(np.int32).max), state_cache=LocalGPStateCache())
+
+# Acquisition function optimizer for the configured engine (tree ensembles have no gradients: sampling only).
+# Sampling only also with the feasible region sampling, the acquisition being optimized over the feasible candidates, and with
+# the feasibility classifier or a cost-aware acquisition function, the acquisition being weighted by the probability of feasibility
+# or by the expected inverse run time.
+def get_acq_optimizer(optimizerConf):
+    if ((optimizerConf.getParam("engine") != "gp") or optimizerConf.getParam("feasible_sampling") or optimizerConf.getParam("feasibility_classifier") or
+        is_cost_aware(optimizerConf)):
+        return "sampling"
+    return optimizerConf.getParam("acq_optimizer")
+
+# Whether the failed evaluations are kept out of the surrogate, and handled by a feasibility classifier (ref. FeasibilityAwareOptimizer)
+def uses_feasibility_classifier(optimizerConf, failure_registry):
+    return ((failure_registry is not None) and optimizerConf.getParam("feasibility_classifier"))
+
+# Whether the configured acquisition function is a cost-aware one (EIps, PIps), weighted by the expected run time (ref. CostAwareOptimizer)
+def is_cost_aware(optimizerConf):
+    return (optimizerConf.getParam("acq_func") in COST_AWARE_ACQ_FUNCS)
+
+# Same loop as the skopt sequential minimizers (base_minimize), on an ask/tell optimizer: used when the optimizer must be built
+# here (e.g. sampling the feasible region, with the feasibility classifier or a cost-aware acquisition function), the minimizers building their own one, or when
+# the proposed points are screened before being evaluated ('pre_screener', PreScreener: the rejected ones consume no runs), or when the
+# optimizer is checkpointed ('checkpoint', OptimizerCheckpoint, if any: the optimizer is resumed from it)
+def run_ask_tell_minimization(objective_fn, search_space, x0, y0, max_runs, optimizerConf, callbacks, verbose, feasible_sampler, failure_registry, pre_screener=None, runtime_registry=None, checkpoint=None):
+    x0 = x0 or []
+    optimizer, pending_points = resume_optimizer(checkpoint, search_space, optimizerConf, x0, y0, feasible_sampler, failure_registry, runtime_registry)
+    resumed = (optimizer is not None)
+    if (not resumed):
+        optimizer = create_optimizer(search_space, optimizerConf, len(x0), feasible_sampler=feasible_sampler, failure_registry=failure_registry, runtime_registry=runtime_registry)
+    callbacks = list(callbacks)
+    if verbose:
+        callbacks.append(VerboseCallback(n_init=len(x0) if (y0 is None) else 0, n_random=optimizerConf.getParam("n_initial_points"), n_total=max_runs))
+    specs = {"args": {"n_calls": max_runs, "n_initial_points": optimizerConf.getParam("n_initial_points"), "acq_func": optimizerConf.getParam("acq_func"),
+                      "random_state": optimizerConf.getParam("random_state")}, "function": "run_ask_tell_minimization"}
+    result = None
+    n_calls = max_runs
+    if (x0 and (y0 is None)):
+        y0 = [objective_fn(xi) for xi in x0]
+        n_calls = n_calls - len(y0)
+    if x0:
+        result = tell_history(optimizer, x0, list(y0), resumed)
+        result.specs = specs
+        attach_checkpoint(result, optimizer, optimizerConf)
+        if eval_callbacks(callbacks, result):
+            return result
+    for _ in range(n_calls):
+        if pending_points:
+            next_x = pending_points.pop(0)
+        else:
+            next_x = optimizer.ask() if (pre_screener is None) else pre_screener.askScreened(optimizer, partial(optimizer.ask, strategy=optimizerConf.getParam("batch_strategy")))
+        result = optimizer.tell(next_x, objective_fn(next_x))
+        result.specs = specs
+        attach_checkpoint(result, optimizer, optimizerConf)
+        if eval_callbacks(callbacks, result):
+            break
+    return result
+
+# Sequential optimization loop (one simulation at a time), with the skopt minimizer of the configured engine
+# ('feasibleSampler', if specified: the acquisition is optimized over the feasible region, ref. FeasibleRegionSampler;
+# 'failureRegistry', if specified along with the 'feasibility_classifier' parameter: the failed evaluations are kept out of the surrogate;
+# 'preScreener', if specified: the proposed points failing the pre-simulation check are rejected without consuming runs, ref. PreScreener;
+# 'runtimeRegistry': simulation run times, for the cost-aware acquisition functions, ref. CostAwareOptimizer;
+# 'checkpoint', with the 'optimizer_checkpoint' parameter: the optimizer is resumed from it, ref. OptimizerCheckpoint)
+def run_sequential_optimization(objective_fn, search_space, x0, y0, max_runs, optimizerConf, callbacks, verbose, feasibleSampler=None, failureRegistry=None, preScreener=None, runtimeRegistry=None, checkpoint=None):
+    logger = init_logger()
+    engine = optimizerConf.getParam("engine")
+    if ((feasibleSampler is not None) or uses_feasibility_classifier(optimizerConf, failureRegistry) or (preScreener is not None) or is_cost_aware(optimizerConf) or
+        optimizerConf.getParam("optimizer_checkpoint")):
+        logger.info("[engine] Sequential optimization loop (engine: " + engine + ", ask/tell optimizer, feasible region sampling: " + str(feasibleSampler is not None) +
+                    ", feasibility classifier: " + str(uses_feasibility_classifier(optimizerConf, failureRegistry)) + ", pre-simulation screening: " + str(preScreener is not None) +
+                    ", cost-aware acquisition: " + str(is_cost_aware(optimizerConf)) + ", checkpoint: " + str(optimizerConf.getParam("optimizer_checkpoint")) + ")")
+        return run_ask_tell_minimization(objective_fn, search_space, x0, y0, max_runs, optimizerConf, callbacks, verbose, feasibleSampler, failureRegistry, preScreener, runtimeRegistry, checkpoint)
+    random_state = optimizerConf.getParam("random_state")
+    minimizer_kwargs = {
+        "n_calls": max_runs,
+        "n_initial_points": optimizerConf.getParam("n_initial_points"),
+        "x0": x0,
+        "y0": y0,
+        "callback": callbacks,
+        "initial_point_generator": optimizerConf.getParam("initial_point_generator"),
+        "acq_func": optimizerConf.getParam("acq_func"),
+        "random_state": random_state,
+        "n_points": optimizerConf.getParam("n_points"),
+        "kappa": optimizerConf.getParam("kappa"),
+        "xi": optimizerConf.getParam("xi"),
+        "n_jobs": optimizerConf.getParam("n_jobs"),
+        "model_queue_size": optimizerConf.getParam("model_queue_size"),
+        "base_estimator": create_surrogate(search_space, optimizerConf, random_state),
+        "verbose": verbose
+    }
+    if (engine == "gp"):
+        minimizer_kwargs.update({"acq_optimizer": optimizerConf.getParam("acq_optimizer"), "n_restarts_optimizer": optimizerConf.getParam("n_restarts_optimizer"), "noise": optimizerConf.getParam("noise")})
+    elif (engine == "gbrt"):
+        minimizer_kwargs["acq_optimizer"] = "sampling"
+    minimizer = SEQUENTIAL_MINIMIZERS[engine]
+    logger.info("[engine] Sequential optimization loop (engine: " + engine + ", minimizer: " + minimizer.__name__ + ")")
+    return minimizer(objective_fn, search_space, **minimizer_kwargs)
+
+# -------------------------------------
+# Ask/tell optimizer creation
+# -------------------------------------
+
+# Builds a skopt ask/tell Optimizer configured exactly like the one the sequential minimizer builds internally, so that
+# the ask/tell based run modes behave like the sequential one (same surrogate, same acquisition, same initial design).
+# 'num_x0' is the number of points of X0 that will be told (or evaluated) before the first 'ask', as gp_minimize
+# adds them to the initial points count. 'random_state', if specified, overrides the configured one (e.g. for
+# run modes creating many optimizers, which must not all draw the same initial points). 'n_initial_points', if specified,
+# overrides the configured initial design size (e.g. 0 for optimizers working on an already sampled region: with no initial
+# design, the initial point generator is the random one, as skopt sizes the other ones on the initial points count).
+# 'feasible_sampler' (FeasibleRegionSampler, optional): the random points (acquisition candidates included) are drawn from the feasible region.
+# 'failure_registry' (FailureRegistry, optional): with the 'feasibility_classifier' parameter, the failed evaluations are kept out of the surrogate.
+# 'runtime_registry' (RuntimeRegistry, optional): with a cost-aware acquisition function, the run times the run time model is fitted on
+# (without it, e.g. for optimizers on a subspace, whose points have no recorded run time, the acquisition is not weighted).
+def create_optimizer(search_space, optimizerConf, num_x0, random_state=None, n_initial_points=None, feasible_sampler=None, failure_registry=None, runtime_registry=None):
+    logger = init_logger()
+    rng = check_random_state(optimizerConf.getParam("random_state") if (random_state is None) else random_state)
+    space = normalize_dimensions(search_space)
+    base_estimator = create_surrogate(search_space, optimizerConf, rng.randint(0, np.iinfo(np.int32).max))
+    n_initial_points = (optimizerConf.getParam("n_initial_points") if (n_initial_points is None) else n_initial_points) + num_x0
+    logger.info("[engine] Creating ask/tell optimizer (engine: " + optimizerConf.getParam("engine") + ", initial points: " + str(n_initial_points) + ")")
+    acq_func = optimizerConf.getParam("acq_func")
+    # (a FeasibleOptimizer with no sampler is a plain skopt Optimizer, whose copies can skip the fit, ref. ask_conditioned)
+    optimizer_class, optimizer_kwargs = FeasibleOptimizer, {"feasible_sampler": feasible_sampler}
+    if is_cost_aware(optimizerConf):
+        # skopt's own EIps/PIps expect (value, time) objective values: the base acquisition function is weighted here instead
+        acq_func = COST_AWARE_ACQ_FUNCS[acq_func]
+        optimizer_class, optimizer_kwargs = CostAwareOptimizer, {"feasible_sampler": feasible_sampler, "runtime_registry": runtime_registry,
+                                                                 "failure_registry": failure_registry if uses_feasibility_classifier(optimizerConf, failure_registry) else None}
+    elif uses_feasibility_classifier(optimizerConf, failure_registry):
+        optimizer_class, optimizer_kwargs = FeasibilityAwareOptimizer, {"feasible_sampler": feasible_sampler, "failure_registry": failure_registry}
+    optimizer = optimizer_class(
+        space,
+        base_estimator,
+        n_initial_points=n_initial_points,
+        initial_point_generator=optimizerConf.getParam("initial_point_generator") if (n_initial_points > 0) else "random",
+        n_jobs=optimizerConf.getParam("n_jobs"),
+        acq_func=acq_func,
+        acq_optimizer=get_acq_optimizer(optimizerConf),
+        random_state=rng,
+        model_queue_size=optimizerConf.getParam("model_queue_size"),
+        acq_optimizer_kwargs={
+            "n_points": optimizerConf.getParam("n_points"),
+            "n_restarts_optimizer": optimizerConf.getParam("n_restarts_optimizer"),
+            "n_jobs": optimizerConf.getParam("n_jobs")
+        },
+        acq_func_kwargs={
+            "xi": optimizerConf.getParam("xi"),
+            "kappa": optimizerConf.getParam("kappa")
+        },
+        **optimizer_kwargs
+    )
+    return optimizer
+
+# Number of initial design points the optimizer still proposes at random (each point told counts as one of them, as in skopt)
+def get_initial_points_left(optimizer):
+    return max(optimizer.n_initial_points_ - len(optimizer.yi), 0)
+
+# Asks for ONE new point ('n_points' new points, if specified, ref. Optimizer.ask), conditioned on the points which are still being
+# evaluated ('pending_points'): a copy of the optimizer is told the pending points with a constant liar objective value, then asked
+# (the copy is fitted once, on the points of the optimizer and the pending ones together; a batch ask fits its own copy of it).
+# With no pending points this is a plain 'ask' on the optimizer itself.
+def ask_conditioned(optimizer, pending_points, strategy, n_points=None):
+    if (not pending_points):
+        return optimizer.ask(n_points=n_points, strategy=strategy)
+    opt = optimizer.copy(random_state=optimizer.rng.randint(0, np.iinfo(np.int32).max), fit=False)
+    y_lie = opt.getLieValue(strategy)
+    opt._tell(list(pending_points), [y_lie] * len(pending_points), fit=(n_points is None))
+    return opt.ask(n_points=n_points, strategy=strategy)
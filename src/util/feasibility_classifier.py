@@ -0,0 +1,173 @@
+import threading
+import warnings
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.ensemble import ExtraTreesClassifier
+from skopt.acquisition import _gaussian_acquisition
+from skopt.utils import create_result
+
+from logging_utils import init_logger
+from pickling_utils import TransientStateMixin
+from pareto import get_point_key
+from feasible_sampler import FeasibleOptimizer
+
+# Failure categories of the evaluations (ref. objective): pre-simulation constraints check, post-simulation constraints check, simulation error.
+# Penalized points whose category is not known (e.g. history saved by older versions, or imported from other islands): unknown.
+FAILURE_PRE_CHECK = "pre"
+FAILURE_POST_CHECK = "post"
+FAILURE_SIM_ERROR = "sim_error"
+FAILURE_UNKNOWN = "unknown"
+FAILURE_CATEGORIES = [FAILURE_PRE_CHECK, FAILURE_POST_CHECK, FAILURE_SIM_ERROR, FAILURE_UNKNOWN]
+
+#feasibility classifier: extremely randomized trees (cheap to fit, probabilistic, cope with the integer dimensions)
+FEASIBILITY_CLF_N_ESTIMATORS = 100
+FEASIBILITY_CLF_MIN_SAMPLES_LEAF = 2
+
+# -------------------------------------
+# Failed evaluations: registry and feasibility classifier
+# -------------------------------------
+
+# Failure category of each failed evaluation (point), to be saved in the history along with the points
+class FailureRegistry(TransientStateMixin):
+    def __init__(self):
+        self._failure_value = None
+        self._categories = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._is_initialized = False
+
+    # 'failure_value': objective function value of the failed evaluations (penalization value). 'x0', 'categories0': history points
+    # and their failure categories, as saved in the history (None for the successful evaluations; None at all if not saved)
+    def init(self, failure_value, x0=None, categories0=None):
+        logger = init_logger()
+        self._failure_value = failure_value
+        for xi, ci in zip(x0 or [], categories0 or []):
+            if ci:
+                self._categories[get_point_key(xi)] = ci
+        self._is_initialized = True
+        logger.info("[failures] Failure registry ready (failure categories from history: " + str(len(self._categories)) + ")")
+
+    def record(self, x, category):
+        if (not self._is_initialized):
+            raise RuntimeError("[failures] ERROR. Bad Sequence. 'record' cannot be called here, as the failure registry has not been initialized")
+        with self._lock:
+            self._categories[get_point_key(x)] = category
+            self._counts[category] = self._counts.get(category, 0) + 1
+
+    def isFailure(self, y):
+        return (y >= self._failure_value)
+
+    # Failure category of each point (None for the successful ones), e.g. for the history
+    def getCategories(self, x_iters, func_vals):
+        with self._lock:
+            return [(self._categories.get(get_point_key(xi), FAILURE_UNKNOWN) if self.isFailure(yi) else None) for xi, yi in zip(x_iters, func_vals)]
+
+    def logStats(self):
+        logger = init_logger()
+        with self._lock:
+            counts = dict(self._counts)
+        logger.info("[opttrace][failures] Failed evaluations in this run - " + ", ".join(cat + ": " + str(counts.get(cat, 0)) for cat in FAILURE_CATEGORIES if (cat != FAILURE_UNKNOWN)))
+
+# Probabilistic classifier of the feasibility (labels: True for the successful evaluations), on the transformed points.
+# None if all the points have the same label (nothing to learn: the probability of feasibility is the same everywhere)
+def fit_feasibility_classifier(Xt, feasible, random_state):
+    if (len(np.unique(feasible)) < 2):
+        return None
+    clf = ExtraTreesClassifier(n_estimators=FEASIBILITY_CLF_N_ESTIMATORS, min_samples_leaf=FEASIBILITY_CLF_MIN_SAMPLES_LEAF, random_state=random_state)
+    return clf.fit(Xt, feasible)
+
+# skopt ask/tell Optimizer keeping the failed evaluations (ref. FailureRegistry) out of the surrogate: the surrogate is fitted on the
+# successful evaluations only, so that the penalization value does not flatten it, and a separate classifier, fitted on all of them,
+# gives the probability of feasibility. The acquisition function is optimized by sampling (as FeasibleOptimizer, feasible region
+# sampling included), each candidate's acquisition value being weighted by its probability of feasibility. As the acquisition
+# functions (to be minimized) are not all negative, the weighted value is: (value - max. value over the candidates) * probability.
+# With no failure registry, all the evaluations count as successful ones, and the candidates are not weighted (base class of the
+# optimizers weighting the acquisition function otherwise, e.g. CostAwareOptimizer).
+class FeasibilityAwareOptimizer(FeasibleOptimizer):
+    def __init__(self, *args, failure_registry=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failure_registry = failure_registry
+
+    def _getCopyKwargs(self):
+        copy_kwargs = super()._getCopyKwargs()
+        copy_kwargs["failure_registry"] = self.failure_registry
+        return copy_kwargs
+
+    # until at least two evaluations succeed, no surrogate gets fitted (ref. _tell): random point, instead of skopt's error
+    def _ask(self):
+        if ((self._n_initial_points <= 0) and (self.base_estimator_ is not None) and (not self.models)):
+            return self.space.rvs(random_state=self.rng)[0]
+        return super()._ask()
+
+    # successful evaluations (the training points of the surrogate)
+    def _getFeasibleMask(self, yi):
+        if (self.failure_registry is None):
+            return np.ones(len(yi), dtype=bool)
+        return np.array([(not self.failure_registry.isFailure(v)) for v in yi])
+
+    # weight of the acquisition value of each candidate ('X', transformed): its probability of feasibility
+    def _getCandidateWeights(self, X, Xt, feasible):
+        logger = init_logger()
+        if (self.failure_registry is None):
+            return np.ones(len(X))
+        clf = fit_feasibility_classifier(Xt, feasible, self.rng.randint(0, np.iinfo(np.int32).max))
+        prob_feasible = clf.predict_proba(X)[:, list(clf.classes_).index(True)] if (clf is not None) else np.ones(len(X))
+        logger.info(f"[opttrace][failures] Surrogate fitted on {np.count_nonzero(feasible)} successful evaluations (failed ones kept out: {np.count_nonzero(~feasible)}), " +
+                    f"probability of feasibility: mean over the candidates {np.mean(prob_feasible):.3f}, max. {np.max(prob_feasible):.3f}")
+        return prob_feasible
+
+    # the lie is computed over the successful evaluations (the penalization value would make cl_mean and cl_max lies of failure),
+    # over all of them if none succeeded yet
+    def _getLieBasis(self):
+        yi = np.asarray(self.yi, dtype=float)
+        feasible = self._getFeasibleMask(yi)
+        return yi[feasible] if np.any(feasible) else yi
+
+    # same as Optimizer._tell (sampling acquisition optimizer), with the failed evaluations handled as described above
+    def _tell(self, x, y, fit=True):
+        logger = init_logger()
+        result = super()._tell(x, y, fit=False)
+        if (not (fit and (self._n_initial_points <= 0) and (self.base_estimator_ is not None))):
+            return result
+
+        Xt = self.space.transform(self.Xi)
+        yi = np.asarray(self.yi, dtype=float)
+        feasible = self._getFeasibleMask(yi)
+        if (np.count_nonzero(feasible) < 2):
+            # nothing to fit the surrogate on yet: random point
+            logger.info("[opttrace][failures] Successful evaluations: " + str(np.count_nonzero(feasible)) + " (of " + str(len(yi)) + "), asking a random point")
+            self._next_x = self.space.rvs(random_state=self.rng)[0]
+            return result
+
+        est = clone(self.base_estimator_)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            est.fit(Xt[feasible], yi[feasible])
+
+        if (hasattr(self, "next_xs_") and (self.acq_func == "gp_hedge")):
+            self.gains_ -= est.predict(np.vstack(self.next_xs_))
+        if ((self.max_model_queue_size is not None) and (len(self.models) >= self.max_model_queue_size)):
+            self.models.pop(0)
+        self.models.append(est)
+
+        X = self.space.transform(self.space.rvs(n_samples=self.n_points, random_state=self.rng))
+        weights = self._getCandidateWeights(X, Xt, feasible)
+        next_idxs = []
+        for cand_acq_func in self.cand_acq_funcs_:
+            values = _gaussian_acquisition(X=X, model=est, y_opt=np.min(yi[feasible]), acq_func=cand_acq_func, acq_func_kwargs=self.acq_func_kwargs)
+            next_idxs.append(int(np.argmin((values - np.max(values)) * weights)))
+        self.next_xs_ = [X[idx] for idx in next_idxs]
+        if (self.acq_func == "gp_hedge"):
+            logits = np.array(self.gains_)
+            logits -= np.max(logits)
+            exp_logits = np.exp(self.eta * logits)
+            probs = exp_logits / np.sum(exp_logits)
+            next_idx = next_idxs[np.argmax(self.rng.multinomial(1, probs))]
+        else:
+            next_idx = next_idxs[0]
+        self._next_x = self.space.inverse_transform(X[next_idx].reshape((1, -1)))[0]
+
+        result = create_result(self.Xi, self.yi, self.space, self.rng, models=self.models)
+        result.specs = self.specs
+        return result
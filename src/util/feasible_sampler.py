@@ -0,0 +1,273 @@
+import threading
+
+import numpy as np
+from sklearn.utils import check_random_state
+from skopt import Optimizer
+from skopt.space import Space
+
+from logging_utils import init_logger
+from pickling_utils import TransientStateMixin
+
+#candidates are drawn in blocks of at least this size (also when a single random point is asked), at most this many times per request
+FEASIBLE_SAMPLING_MIN_BLOCK = 256
+FEASIBLE_SAMPLING_MAX_DRAWS = 20
+
+#constant liar strategies (same as skopt's Optimizer.ask)
+CONSTANT_LIAR_STRATEGIES = ["cl_min", "cl_mean", "cl_max"]
+
+# -------------------------------------
+# Feasible region sampler
+# -------------------------------------
+# The acquisition function is optimized over random candidates (n_points per iteration), many of which would not pass the
+# pre-simulation constraints check (total thickness range, weight, largest effective layer, TCO), i.e. would be penalized
+# without being simulated. The sampler evaluates the same checks on whole blocks of candidates at once (numpy, one pass per layer),
+# on the shield as the search space builder builds it (decoded materials, and trimmed if trimming is enabled), and keeps only
+# the feasible candidates: the acquisition is optimized over the feasible region only, by sampling.
+# It requires a search space made of 'num_layers', 'material_<i>' (or 'material_index_<i>') and 'thickness_<i>' dimensions.
+class FeasibleRegionSampler(TransientStateMixin):
+    def __init__(self):
+        self._num_layers_idx = None
+        self._mat_idxs = None
+        self._thick_idxs = None
+        self._materials = None
+        self._densities = None
+        self._materials_by_index = None
+        self._allow_adj_same_mats = None
+        self._trimming_enabled = None
+        self._max_layer_thick = None
+        self._min_tot_thick = None
+        self._max_tot_thick = None
+        self._max_wgt = None
+        self._max_cost = None
+        self._num_candidates = 0
+        self._num_infeasible_candidates = 0
+        self._num_proposals = 0
+        self._num_infeasible_proposals = 0
+        self._lock = threading.Lock()
+        self._is_initialized = False
+
+    def init(self, search_space, searchSpBuilder, materialsSet, constrPar):
+        logger = init_logger()
+        names = [dim.name for dim in search_space]
+        if ("num_layers" not in names):
+            raise ValueError("[feasible] ERROR. The feasible region sampler requires a 'num_layers' dimension in the search space")
+        max_layers = search_space[names.index("num_layers")].high
+        mat_pfix = "material_index_" if searchSpBuilder.materialsByIndex() else "material_"
+        try:
+            self._mat_idxs = [names.index(mat_pfix + str(i + 1)) for i in range(max_layers)]
+            self._thick_idxs = [names.index("thickness_" + str(i + 1)) for i in range(max_layers)]
+        except ValueError:
+            raise ValueError("[feasible] ERROR. The feasible region sampler requires '" + mat_pfix + "<i>' and 'thickness_<i>' dimensions for each layer in the search space")
+        self._num_layers_idx = names.index("num_layers")
+
+        _, _, self._materials = materialsSet.getMaterialsList()
+        self._materials_by_index = searchSpBuilder.materialsByIndex()
+        self._allow_adj_same_mats = searchSpBuilder.adjacentSameMaterialAllowed()
+        self._trimming_enabled = (searchSpBuilder.hasShieldTrimming() or searchSpBuilder.hasShieldTrimming_Wgt())
+        isDbInitialized = (materialsSet.GetParentDb() and materialsSet.GetParentDb().isInitialized())
+        if isDbInitialized:
+            self._densities = np.array([materialsSet.getDensity(mat) for mat in self._materials], dtype=float)
+        elif self._trimming_enabled:
+            raise ValueError("[feasible] ERROR. The feasible region sampler requires the materials database when shield trimming is enabled")
+        self._max_layer_thick, self._min_tot_thick, self._max_tot_thick, self._max_wgt, _, _, self._max_cost = constrPar.getPRE().getParams()
+        self._is_initialized = True
+        logger.info("[feasible] Feasible region sampler ready (layers: " + str(max_layers) + ", materials: " + str(len(self._materials)) + ", trimming: " + str(self._trimming_enabled) +
+                    ", weight check: " + str(isDbInitialized) + ")")
+
+    # Materials (indexes into the materials list) and thicknesses of the layers of each point, as the search space builder decodes them
+    # (unused layers: zero thickness)
+    def _decodeLayers(self, P):
+        num_layers = P[:, self._num_layers_idx].astype(int)
+        num_mats = len(self._materials)
+        mats = np.zeros((len(P), len(self._mat_idxs)), dtype=int)
+        thicks = np.zeros((len(P), len(self._mat_idxs)), dtype=float)
+        for i, (mi, ti) in enumerate(zip(self._mat_idxs, self._thick_idxs)):
+            if (not self._materials_by_index):
+                names, inverse = np.unique(P[:, mi].astype(str), return_inverse=True)
+                mats[:, i] = np.array([self._materials.index(name) for name in names])[inverse]
+            elif (self._allow_adj_same_mats or (i == 0)):
+                mats[:, i] = P[:, mi].astype(int)
+            else:
+                # rotated index, ref. decode_raw_material_indexes
+                mats[:, i] = (mats[:, i - 1] + 1 + P[:, mi].astype(int)) % num_mats
+            thicks[:, i] = np.where(i < num_layers, P[:, ti].astype(float), 0.0)
+        return mats, thicks
+
+    # Layers thicknesses after the trimming (ref. get_trimmed_layers): the tail of the shield is cut at the max thickness and weight
+    def _trimLayers(self, mats, thicks):
+        accum_th = np.zeros(len(mats))
+        accum_wgt = np.zeros(len(mats))
+        active = np.ones(len(mats), dtype=bool)
+        trimmed = np.zeros_like(thicks)
+        for i in range(mats.shape[1]):
+            allowed_th = self._max_tot_thick - accum_th
+            allowed_wgt = self._max_wgt - accum_wgt
+            active = active & (allowed_th > 0) & (allowed_wgt > 0)
+            density = self._densities[mats[:, i]]
+            cur = np.minimum(np.minimum(thicks[:, i], allowed_th), np.minimum(thicks[:, i] * density, allowed_wgt) / density)
+            cur = np.where(active & (cur > 0.0), cur, 0.0)
+            trimmed[:, i] = cur
+            accum_th = accum_th + cur
+            accum_wgt = accum_wgt + cur * density
+            active = active & (accum_th < self._max_tot_thick) & (accum_wgt < self._max_wgt)
+        return trimmed
+
+    # Pre-simulation constraints check (ref. check_constraints_pre) of many points at once: boolean mask of the feasible ones
+    def getFeasibleMask(self, points):
+        if (not self._is_initialized):
+            raise RuntimeError("[feasible] ERROR. Bad Sequence. 'getFeasibleMask' cannot be called here, as the feasible region sampler has not been initialized")
+        P = np.asarray(points, dtype=object)
+        mats, thicks = self._decodeLayers(P)
+        if self._trimming_enabled:
+            thicks = self._trimLayers(mats, thicks)
+
+        # accumulated layer by layer (same order as the shield), as well as the effective layers (consecutive layers of the same material merged)
+        tot_thick = np.zeros(len(P))
+        tot_wgt = np.zeros(len(P))
+        eff_layer = np.zeros(len(P))
+        max_eff_layer = np.zeros(len(P))
+        prev_mat = np.full(len(P), -1)
+        for i in range(mats.shape[1]):
+            present = (thicks[:, i] > 0.0)
+            tot_thick = tot_thick + thicks[:, i]
+            if (self._densities is not None):
+                tot_wgt = tot_wgt + thicks[:, i] * self._densities[mats[:, i]]
+            eff_layer = np.where(present, np.where(mats[:, i] == prev_mat, eff_layer + thicks[:, i], thicks[:, i]), eff_layer)
+            prev_mat = np.where(present, mats[:, i], prev_mat)
+            max_eff_layer = np.maximum(max_eff_layer, eff_layer)
+        # the shield TCO is not evaluated yet (ref. CssShield.getTCO): zero, as in the pre-simulation check
+        tco = np.zeros(len(P))
+
+        feasible = (tot_thick >= self._min_tot_thick) & (tot_thick <= self._max_tot_thick)
+        if (self._densities is not None):
+            feasible = feasible & (tot_wgt <= self._max_wgt)
+        feasible = feasible & (max_eff_layer <= self._max_layer_thick) & (tco <= self._max_cost)
+        return feasible
+
+    # Draws 'n_samples' feasible points from the space (fewer if the feasible ones are rare, the raw ones if there are none at all)
+    def sample(self, space, n_samples, random_state=None):
+        logger = init_logger()
+        rng = check_random_state(random_state)
+        block_sz = max(n_samples, FEASIBLE_SAMPLING_MIN_BLOCK)
+        points = []
+        num_drawn, num_infeasible = 0, 0
+        for _ in range(FEASIBLE_SAMPLING_MAX_DRAWS):
+            candidates = Space.rvs(space, n_samples=block_sz, random_state=rng)
+            mask = self.getFeasibleMask(candidates)
+            points.extend(pt for pt, ok in zip(candidates, mask) if ok)
+            num_drawn = num_drawn + len(candidates)
+            num_infeasible = num_infeasible + int(np.count_nonzero(~mask))
+            if (len(points) >= n_samples):
+                break
+        with self._lock:
+            self._num_candidates = self._num_candidates + num_drawn
+            self._num_infeasible_candidates = self._num_infeasible_candidates + num_infeasible
+        if (not points):
+            logger.warning("[feasible] No feasible point found among " + str(num_drawn) + " candidates: sampling from the whole space")
+            return candidates[:n_samples]
+        if (len(points) < n_samples):
+            logger.debug("[feasible] Feasible candidates: " + str(len(points)) + " (requested: " + str(n_samples) + ", drawn: " + str(num_drawn) + ")")
+        return points[:n_samples]
+
+    # Records the outcome of the pre-simulation constraints check of a point proposed by the optimizer (ref. objective)
+    def recordProposal(self, is_feasible):
+        with self._lock:
+            self._num_proposals = self._num_proposals + 1
+            if (not is_feasible):
+                self._num_infeasible_proposals = self._num_infeasible_proposals + 1
+
+    def logStats(self):
+        logger = init_logger()
+        with self._lock:
+            num_cand, num_inf_cand = self._num_candidates, self._num_infeasible_candidates
+            num_prop, num_inf_prop = self._num_proposals, self._num_infeasible_proposals
+        inf_cand_ratio = (100.0 * num_inf_cand / num_cand) if (num_cand > 0) else 0.0
+        inf_prop_ratio = (100.0 * num_inf_prop / num_prop) if (num_prop > 0) else 0.0
+        logger.info(f"[opttrace][feasible] Random candidates drawn: {num_cand}, infeasible: {num_inf_cand} ({inf_cand_ratio:.1f}%, excluded from the acquisition) - " +
+                    f"proposed points: {num_prop}, infeasible: {num_inf_prop} ({inf_prop_ratio:.1f}%)")
+
+# Constant liar value for the given strategy (same definitions as skopt's Optimizer.ask)
+def get_lie_value(yi, strategy):
+    if (strategy not in CONSTANT_LIAR_STRATEGIES):
+        raise ValueError("[feasible] ERROR. Unknown constant liar strategy: " + str(strategy))
+    if (len(yi) == 0):
+        return 0.0
+    if (strategy == "cl_min"):
+        return float(np.min(yi))
+    elif (strategy == "cl_mean"):
+        return float(np.mean(yi))
+    return float(np.max(yi))
+
+# Search space whose random points (acquisition candidates, random initial points) are drawn from the feasible region
+class FeasibleSpace(Space):
+    def __init__(self, dimensions, feasible_sampler):
+        super().__init__(dimensions)
+        self.feasible_sampler = feasible_sampler
+
+    def rvs(self, n_samples=1, random_state=None):
+        return self.feasible_sampler.sample(self, n_samples, random_state)
+
+# skopt ask/tell Optimizer sampling the feasible region (if 'feasible_sampler' is specified). Unlike skopt's 'space_constraint',
+# the points told to the optimizer (e.g. the infeasible shields of the history, penalized) are not required to be feasible.
+class FeasibleOptimizer(Optimizer):
+    def __init__(self, *args, feasible_sampler=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.feasible_sampler = feasible_sampler
+        if (feasible_sampler is not None):
+            self.space = FeasibleSpace(self.space.dimensions, feasible_sampler)
+
+    # arguments of this class (on top of the Optimizer ones) for its copies
+    def _getCopyKwargs(self):
+        return {"feasible_sampler": self.feasible_sampler}
+
+    # same as Optimizer.copy (e.g. for the constant liar), keeping the class and its arguments. 'fit': whether the copy is fitted on
+    # the points told (False e.g. if more points are going to be told to it before asking)
+    def copy(self, random_state=None, fit=True):
+        optimizer = type(self)(
+            dimensions=self.space.dimensions,
+            base_estimator=self.base_estimator_,
+            n_initial_points=self.n_initial_points_,
+            initial_point_generator=self._initial_point_generator,
+            acq_func=self.acq_func,
+            acq_optimizer=self.acq_optimizer,
+            acq_func_kwargs=self.acq_func_kwargs,
+            acq_optimizer_kwargs=self.acq_optimizer_kwargs,
+            random_state=random_state,
+            **self._getCopyKwargs()
+        )
+        optimizer._initial_samples = self._initial_samples
+        if hasattr(self, "gains_"):
+            optimizer.gains_ = np.copy(self.gains_)
+        if self.Xi:
+            optimizer._tell(self.Xi, self.yi, fit=fit)
+        return optimizer
+
+    # objective values the constant liar value is computed over (here, all the points told)
+    def _getLieBasis(self):
+        return self.yi
+
+    def getLieValue(self, strategy):
+        return get_lie_value(self._getLieBasis(), strategy)
+
+    # same as Optimizer.ask, with the constant liar value of 'getLieValue' (the cost-aware 'ps' acquisition functions of skopt,
+    # whose lies are pairs of values, are left to Optimizer.ask)
+    def ask(self, n_points=None, strategy="cl_min"):
+        if ((n_points is None) or ("ps" in self.acq_func)):
+            return super().ask(n_points=n_points, strategy=strategy)
+        if (not (isinstance(n_points, int) and (n_points > 0))):
+            raise ValueError("n_points should be int > 0, got " + str(n_points))
+        if (strategy not in CONSTANT_LIAR_STRATEGIES):
+            raise ValueError("Expected parallel_strategy to be one of " + str(CONSTANT_LIAR_STRATEGIES) + ", got " + str(strategy))
+        if ((n_points, strategy) in self.cache_):
+            return self.cache_[(n_points, strategy)]
+
+        # the copy is told the points asked so far with the lie (but the last one, asking nothing more), then discarded
+        opt = self.copy(random_state=self.rng.randint(0, np.iinfo(np.int32).max))
+        X = []
+        for _ in range(n_points):
+            x = opt.ask()
+            X.append(x)
+            if (len(X) < n_points):
+                opt._tell(x, opt.getLieValue(strategy))
+        self.cache_ = {(n_points, strategy): X}
+        return X
@@ -0,0 +1,70 @@
+import os
+import pickle
+
+from scipy.optimize import OptimizeResult
+
+from logging_utils import init_logger
+
+# the heavy artifacts live next to the history file: <history file><ext>
+ARTIFACTS_FILE_EXT = ".artifacts"
+
+# entries of the optimization result persisted as heavy artifacts instead of in the history file: the fitted surrogate models (one
+# more per iteration, unless 'model_queue_size' is set), the specifications (arguments, objective function included) and the
+# optimizer checkpoint (ref. OptimizerCheckpoint)
+HEAVY_RESULT_KEYS = ["models", "specs", "checkpoint"]
+
+# -------------------------------------
+# Heavy artifacts of the history
+# -------------------------------------
+# Resuming an optimization only needs the history points and their objective values (and the metadata saved along with them, e.g.
+# the failure categories), while the pickled optimization result holds the fitted surrogate models and the specifications too: the
+# history file grows with every iteration, and every resume deserializes objects it throws away. The history file gets the lightweight
+# result, and the heavy artifacts (the last 'history_models' surrogate models, and the specifications) are pickled aside, to be loaded
+# lazily, upon request only (ref. HistoryArtifacts). Histories saved by older versions (full results) are still loaded as they are.
+
+# Lightweight result (the optimization result without its heavy entries) and heavy artifacts ('num_models': number of the most
+# recent surrogate models kept). The given result is not modified
+def split_result(oResult, num_models):
+    light_result = OptimizeResult({key: value for key, value in oResult.items() if (key not in HEAVY_RESULT_KEYS)})
+    models = list(oResult.get("models") or [])
+    artifacts = {"models": models[-num_models:] if (num_models > 0) else [], "specs": oResult.get("specs"), "checkpoint": oResult.get("checkpoint")}
+    return light_result, artifacts
+
+# Pickles the object aside and then renames the file, so that it is never found half written (e.g. by other islands)
+def dump_atomically(obj, file):
+    tmp_file = os.path.join(os.path.dirname(file), "." + os.path.basename(file) + ".tmp")
+    with open(tmp_file, 'wb') as f:
+        pickle.dump(obj, f)
+    os.replace(tmp_file, file)
+
+class HistoryArtifacts:
+    def __init__(self):
+        self._artifacts_file = None
+        self._artifacts = None
+        self._is_initialized = False
+
+    def init(self, artifacts_file):
+        self._artifacts_file = artifacts_file
+        self._is_initialized = True
+
+    def exists(self):
+        return os.path.exists(self._artifacts_file)
+
+    # The artifact ('models', 'specs', 'checkpoint'), the file being loaded upon the first request only. None if not saved
+    def get(self, name):
+        logger = init_logger()
+        if (not self._is_initialized):
+            raise RuntimeError("[history] ERROR. Bad Sequence. 'get' cannot be called here, as the history artifacts have not been initialized")
+        if (self._artifacts is None):
+            if (not self.exists()):
+                return None
+            with open(self._artifacts_file, 'rb') as f:
+                self._artifacts = pickle.load(f)
+            logger.info("[history] Heavy artifacts loaded (" + self._artifacts_file + ", size: " + str(os.path.getsize(self._artifacts_file)) + " bytes)")
+        return self._artifacts.get(name)
+
+    def save(self, artifacts):
+        if (not self._is_initialized):
+            raise RuntimeError("[history] ERROR. Bad Sequence. 'save' cannot be called here, as the history artifacts have not been initialized")
+        dump_atomically(artifacts, self._artifacts_file)
+        self._artifacts = artifacts
@@ -0,0 +1,86 @@
+import numbers
+
+import numpy as np
+from sklearn.cluster import KMeans
+
+from logging_utils import init_logger
+from history_store import get_material_sequence
+
+# separator of the components of a combined slicing directive, e.g. "_:5+best:10+diverse:20"
+CORESET_SEPARATOR = "+"
+
+# coreset selection strategies ('<strategy>:<k>'):
+# - best: the k points with the lowest objective values
+# - diverse: k clusters of the points in the encoded space, the best point of each one
+# - strata: the points stratified by material sequence, the best one of each sequence first (best sequences first), then the second best, ...
+CORESET_STRATEGIES = ["best", "diverse", "strata"]
+
+# -------------------------------------
+# History coresets
+# -------------------------------------
+# A positional slicing directive (e.g. "_:5", the last 5 points) keeps the surrogate fit affordable on long histories, but throws away
+# what the other points taught. A coreset directive selects a bounded number of points for their information instead: the best ones,
+# a diverse set (one per cluster), or the best ones of each material sequence. The components of a combined directive (positional ones
+# included) select, in order, among the points not selected yet: the coreset size is at most the sum of their sizes. The selected points
+# keep their history order.
+
+def is_coreset_directive(selection):
+    if (not isinstance(selection, str)):
+        return False
+    return any(comp.split(":", 1)[0].strip() in CORESET_STRATEGIES for comp in selection.split(CORESET_SEPARATOR))
+
+# Points as rows of a matrix, each numeric dimension scaled to [0, 1] over the given points, the other ones (categorical) one-hot encoded
+def encode_points(x_iters):
+    columns = []
+    for values in zip(*x_iters):
+        if all(isinstance(v, numbers.Number) for v in values):
+            col = np.asarray(values, dtype=float)
+            span = col.max() - col.min()
+            columns.append((col - col.min()) / span if (span > 0) else np.zeros(len(col)))
+        else:
+            keys = [str(v) for v in values]
+            for cat in sorted(set(keys)):
+                columns.append(np.asarray([float(k == cat) for k in keys]))
+    return np.column_stack(columns)
+
+def _select_best(candidates, y, k):
+    return sorted(candidates, key=lambda i: (y[i], i))[:k]
+
+def _select_diverse(candidates, x_iters, y, k):
+    if (len(candidates) <= k):
+        return list(candidates)
+    encoded = encode_points([x_iters[i] for i in candidates])
+    labels = KMeans(n_clusters=k, n_init=4, random_state=0).fit_predict(encoded)
+    best_of_cluster = {}
+    for i, label in zip(candidates, labels):
+        if ((label not in best_of_cluster) or (y[i] < y[best_of_cluster[label]])):
+            best_of_cluster[label] = i
+    return list(best_of_cluster.values())
+
+def _select_strata(candidates, x_iters, y, k, dim_names):
+    strata = {}
+    for i in sorted(candidates, key=lambda i: (y[i], i)):
+        strata.setdefault(get_material_sequence(x_iters[i], dim_names), []).append(i)
+    # round robin over the sequences, the best ones first
+    selected = []
+    rank = 0
+    while ((len(selected) < k) and any(len(members) > rank for members in strata.values())):
+        for members in strata.values():
+            if ((len(members) > rank) and (len(selected) < k)):
+                selected.append(members[rank])
+        rank = rank + 1
+    return selected
+
+# Positions of the points selected by the strategy ('best', 'diverse', 'strata'), at most 'k', among the candidate positions
+# ('dim_names': search space dimension names, for the material sequences)
+def select_coreset(strategy, k, candidates, x_iters, func_vals, dim_names=None):
+    y = [float(yi) for yi in func_vals]
+    if (strategy == "best"):
+        return _select_best(candidates, y, k)
+    elif (strategy == "diverse"):
+        return _select_diverse(candidates, x_iters, y, k)
+    elif (strategy == "strata"):
+        if (x_iters and (get_material_sequence(x_iters[0], dim_names) is None)):
+            init_logger().warning("[history] Coreset: the history points have no material sequence, 'strata' selects the best points")
+        return _select_strata(candidates, x_iters, y, k, dim_names)
+    raise ValueError("Unknown coreset strategy: " + str(strategy))
@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+from logging_utils import init_logger
+from pickling_utils import TransientStateMixin
+from pareto import get_point_key
+
+# the journal lives next to the history file (the snapshot): <history file><ext>
+JOURNAL_FILE_EXT = ".journal"
+
+# Status of a journaled evaluation: successful, successful on partial KPIs (aborted simulation), or its failure category (ref. FailureRegistry)
+JOURNAL_STATUS_OK = "ok"
+JOURNAL_STATUS_PARTIAL = "partial"
+
+# key of the header line of a compacted journal (ID of the snapshot it was compacted against, saved in the history as well)
+JOURNAL_SNAPSHOT_KEY = "snapshot_id"
+
+# -------------------------------------
+# History journal
+# -------------------------------------
+# The history file (pickled optimization result, or history store) is a snapshot, written at the end of the loop or upon an interrupt
+# request: the evaluations since the last snapshot would be lost upon a crash (OOM kill, node reboot) or upon the exit when the target is met.
+# The journal gets one JSON line per evaluation (point, objective value, status, simulation ID, KPIs, timings), appended and fsync'd
+# as soon as the evaluation completes (O(1) per evaluation, instead of rewriting the whole snapshot). Upon loading, the history is
+# rebuilt from the snapshot (if any) plus the journaled evaluations; upon each snapshot, the journal is compacted to the evaluations
+# the snapshot does not contain (e.g. the ones still in flight upon an interrupt request), and headed by the snapshot's ID. If the
+# header does not match the snapshot (crash between the snapshot and the compaction), the journaled evaluations already in the
+# snapshot are matched by their points and skipped.
+
+# ID of the snapshot the journal was compacted against (None if never compacted), and the journaled evaluations, in order
+# (a truncated last line, e.g. upon a crash while appending, is skipped)
+def read_journal(journal_file):
+    logger = init_logger()
+    snapshot_id = None
+    records = []
+    if (not os.path.exists(journal_file)):
+        return snapshot_id, records
+    with open(journal_file, "r") as f:
+        for line_nbr, line in enumerate(f, start=1):
+            if (not line.strip()):
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                logger.warning("[journal] Skipping unreadable record (line " + str(line_nbr) + ") of " + journal_file)
+                continue
+            if (JOURNAL_SNAPSHOT_KEY in rec):
+                snapshot_id = rec[JOURNAL_SNAPSHOT_KEY]
+            else:
+                records.append(rec)
+    return snapshot_id, records
+
+# The records whose points are not among 'x_iters' (e.g. the points of the snapshot), each point of 'x_iters' matching at most one record
+def get_records_not_in(records, x_iters):
+    counts = {}
+    for xi in x_iters or []:
+        key = get_point_key(xi)
+        counts[key] = counts.get(key, 0) + 1
+    new_records = []
+    for rec in records:
+        key = get_point_key(rec["x"])
+        if (counts.get(key, 0) > 0):
+            counts[key] = counts[key] - 1
+        else:
+            new_records.append(rec)
+    return new_records
+
+# Failure category of a journaled evaluation (None for the successful ones), ref. FailureRegistry
+def get_record_category(rec):
+    return None if (rec["status"] in [JOURNAL_STATUS_OK, JOURNAL_STATUS_PARTIAL]) else rec["status"]
+
+# Rewrites the journal (aside, then renamed), headed by the ID of the snapshot it is compacted against, with the given records
+def write_journal(journal_file, snapshot_id, records):
+    tmp_file = os.path.join(os.path.dirname(journal_file), "." + os.path.basename(journal_file) + ".tmp")
+    with open(tmp_file, "w") as f:
+        f.write(json.dumps({JOURNAL_SNAPSHOT_KEY: snapshot_id}) + "\n")
+        for rec in records:
+            f.write(json.dumps(rec) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, journal_file)
+
+# numpy scalars (e.g. in the points, or in the KPIs) as plain numbers
+def _json_default(o):
+    if hasattr(o, "item"):
+        return o.item()
+    raise TypeError("Object of type " + type(o).__name__ + " is not JSON serializable")
+
+class HistoryJournal(TransientStateMixin):
+    def __init__(self):
+        self._journal_file = None
+        self._records = []
+        self._lock = threading.Lock()
+        self._is_initialized = False
+
+    def init(self, journal_file):
+        logger = init_logger()
+        self._journal_file = journal_file
+        self._is_initialized = True
+        logger.info("[journal] History journal ready (" + self._journal_file + ")")
+
+    # Appends (and syncs to disk) the record of one evaluation. 'final': False for the evaluations which are not part of the history
+    # as such (e.g. the low fidelity ones of the multi-fidelity run mode), which are not used when rebuilding the history
+    def append(self, x, y, status, sim_id=None, kpis=None, sim_secs=None, fidelity=None, final=True):
+        if (not self._is_initialized):
+            raise RuntimeError("[journal] ERROR. Bad Sequence. 'append' cannot be called here, as the history journal has not been initialized")
+        record = {"x": list(x), "y": y, "status": status, "sim_id": sim_id, "kpis": kpis, "sim_secs": sim_secs, "fidelity": fidelity, "final": final,
+                  "time": datetime.now().isoformat(timespec="seconds")}
+        line = json.dumps(record, default=_json_default) + "\n"
+        with self._lock:
+            with open(self._journal_file, "a") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            if final:
+                self._records.append(json.loads(line))
+
+    # Upon a snapshot of the history ('snapshot_id'; 'x_iters' being its points evaluated in this run, i.e. not loaded from the history),
+    # the journal is rewritten (aside, then renamed) with the evaluations of this run the snapshot does not contain, headed by the snapshot's
+    # ID. The ones journaled by previous runs were loaded into this run's history, and the non final ones are not used to rebuild it, so
+    # they are dropped.
+    def compact(self, x_iters, snapshot_id):
+        logger = init_logger()
+        if (not self._is_initialized):
+            raise RuntimeError("[journal] ERROR. Bad Sequence. 'compact' cannot be called here, as the history journal has not been initialized")
+        with self._lock:
+            kept_records = get_records_not_in(self._records, x_iters)
+            write_journal(self._journal_file, snapshot_id, kept_records)
+            logger.info("[journal] History journal compacted (records kept: " + str(len(kept_records)) + ")")
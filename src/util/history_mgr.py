@@ -1,5 +1,7 @@
 import os
 import pickle
+import uuid
+from datetime import datetime
 
 #from pprint import pprint
 from skopt.space import Space, Integer, Real, Categorical
@@ -8,6 +10,11 @@ import numpy as np
 
 from logging_utils import init_logger
 from x0_builder import X0Builder
+from history_journal import HistoryJournal, JOURNAL_FILE_EXT, JOURNAL_SNAPSHOT_KEY, read_journal, write_journal, get_records_not_in, get_record_category
+from history_store import HistoryStore, is_history_store
+from history_artifacts import HistoryArtifacts, ARTIFACTS_FILE_EXT, split_result, dump_atomically
+from history_coreset import CORESET_SEPARATOR, CORESET_STRATEGIES, is_coreset_directive, select_coreset
+from optimizer_checkpoint import get_checkpoint_indexes
 
 # handling retrieved history
 def process_retrieved_history(x0_orig, materials_list, searchSpBuilder, prev_attempts, paramsHolder, optimizerConf):
@@ -176,8 +183,8 @@ def introspect_X0(x0, search_sp_raw):
 
             elif isinstance(dim_def, Integer):
                 lo, hi = dim_def.bounds
-                if isinstance(dim, Integer):
-                    if not float(val).is_integer() or val < dim.low or val > dim.high:
+                if isinstance(dim_def, Integer):
+                    if not float(val).is_integer() or val < dim_def.low or val > dim_def.high:
                         errors.append(f"Point {i}, dim {j}: value {val} not integer in {lo}..{hi}")
                         invalid_indices.add(i)
 
@@ -193,7 +200,7 @@ def introspect_X0(x0, search_sp_raw):
 
     if errors:
         if (itot - len(invalid_indices) > 0):
-            logger.error("[history] X0 validation PARTIALLY failed, as some data points were valid: " + str(i_good))
+            logger.error("[history] X0 validation PARTIALLY failed, as some data points were valid: " + str(itot - len(invalid_indices)))
         for errormsg in errors:
             logger.error("[history] X0 validation error: " + errormsg) 
         #raise ValueError("[history] X0 validation failed")
@@ -213,6 +220,7 @@ def get_list_fragment(lst, selection):
       - 'a:'   -> from a-th element to end
       - ':b'   -> first b elements
       - '_:b'  -> last b elements
+    (coreset directives, e.g. 'best:b', are selected on the history points, ref. get_coreset_indexes)
     Overshoots handled gracefully like Python slicing.
     If selection is None or malformed, returns the full list with a warning.
     If lst is None, returns [] with a warning.
@@ -225,50 +233,108 @@ def get_list_fragment(lst, selection):
         logger.warning("[history] Slicing process: the specified history list is empty. Returning [].")
         return []
 
+    start, stop = get_fragment_range(len(lst), selection)
+    return lst[start:stop]
+
+def get_fragment_range(num_items, selection):
+    logger = init_logger()
+    """
+    Returns the positional range [start, stop) of the items selected by the selection string (ref. get_list_fragment)
+    out of num_items items, e.g. for the history store to read those rows only.
+    If selection is None or malformed, returns the full range with a warning.
+    """
     if selection is None:
         logger.warning("[history] Slicing process: the specified history  is None. Returning full list.")
-        return lst
+        return 0, num_items
 
     try:
-        if ":" not in selection:
-            raise ValueError("Missing ':' separator.")
-
-        a_str, b_str = selection.split(":", 1)
-
-        if a_str == "_" and b_str:  # format "_:b" (last b elements)
-            b = int(b_str)
-            if b <= 0:
-                raise ValueError("Invalid length.")
-            return lst[-b:]
-
-        elif a_str and b_str:  # format "a:b"
-            a, b = int(a_str), int(b_str)
-            if a < 0 or b <= 0:
-                raise ValueError("Invalid indices.")
-            return lst[a:a+b]
-
-        elif a_str and not b_str:  # format "a:"
-            a = int(a_str)
-            if a < 0:
-                raise ValueError("Invalid index.")
-            return lst[a:]
-
-        elif not a_str and b_str:  # format ":b"
-            b = int(b_str)
-            if b <= 0:
-                raise ValueError("Invalid length.")
-            return lst[:b]
+        return parse_fragment_range(num_items, selection)
+    except Exception as e:
+        logger.warning(f"[history] Slicing process error: invalid slicing directive '{selection}' ({e}). Returning full list.")
+        return 0, num_items
+
+# Same as get_fragment_range, raising ValueError if the selection string is malformed
+def parse_fragment_range(num_items, selection):
+    if ":" not in selection:
+        raise ValueError("Missing ':' separator.")
+
+    a_str, b_str = selection.split(":", 1)
+
+    if a_str == "_" and b_str:  # format "_:b" (last b elements)
+        b = int(b_str)
+        if b <= 0:
+            raise ValueError("Invalid length.")
+        return slice(-b, None).indices(num_items)[:2]
+
+    elif a_str and b_str:  # format "a:b"
+        a, b = int(a_str), int(b_str)
+        if a < 0 or b <= 0:
+            raise ValueError("Invalid indices.")
+        return slice(a, a+b).indices(num_items)[:2]
+
+    elif a_str and not b_str:  # format "a:"
+        a = int(a_str)
+        if a < 0:
+            raise ValueError("Invalid index.")
+        return slice(a, None).indices(num_items)[:2]
+
+    elif not a_str and b_str:  # format ":b"
+        b = int(b_str)
+        if b <= 0:
+            raise ValueError("Invalid length.")
+        return slice(None, b).indices(num_items)[:2]
 
-        else:
-            raise ValueError("Empty selection string.")
+    else:
+        raise ValueError("Empty selection string.")
 
+# Positions (in history order) of the items selected by the coreset directive (ref. history_coreset), out of the history points and
+# their objective values ('dim_names': search space dimension names, if known). Each component (e.g. 'best:10', or a positional one,
+# e.g. '_:5') selects among the items not selected yet.
+# If the directive is malformed, returns all the positions with a warning.
+def get_coreset_indexes(x_iters, func_vals, selection, dim_names=None):
+    logger = init_logger()
+    num_items = len(x_iters)
+    try:
+        selected = set()
+        counts = []
+        for comp in selection.split(CORESET_SEPARATOR):
+            comp = comp.strip()
+            candidates = [i for i in range(num_items) if (i not in selected)]
+            strategy, _, size = comp.partition(":")
+            if (strategy in CORESET_STRATEGIES):
+                k = int(size)
+                if k <= 0:
+                    raise ValueError("Invalid length.")
+                chosen = select_coreset(strategy, k, candidates, x_iters, func_vals, dim_names)
+            else:
+                start, stop = parse_fragment_range(num_items, comp)
+                chosen = [i for i in range(start, stop) if (i not in selected)]
+            selected.update(chosen)
+            counts.append(comp + " -> " + str(len(chosen)))
     except Exception as e:
         logger.warning(f"[history] Slicing process error: invalid slicing directive '{selection}' ({e}). Returning full list.")
-        return lst
+        return list(range(num_items))
+    logger.info("[history] History coreset selected (" + ", ".join(counts) + ")")
+    return sorted(selected)
+
+# The items of the list at the given positions (None if the list is None)
+def get_list_items(lst, indexes):
+    return [lst[i] for i in indexes] if (lst is not None) else None
 
 class HistoryManager:
     def __init__(self):
         self._hist_file = None
+        self._failure_categories = None
+        self._failureRegistry = None
+        self._sim_times = None
+        self._runtimeRegistry = None
+        self._journal = None
+        self._num_hist_points = 0
+        self._store = None
+        self._num_stored = 0
+        self._artifacts = None
+        self._num_models = 1
+        self._checkpoint = None
         self._is_initialized = False
         #self._num_items = 0
         #self._desc = "n.a."
@@ -286,8 +352,11 @@ class HistoryManager:
     def checkX0(self, x0, search_sp):
         return introspect_X0(x0, search_sp)
 
+    # 'checkpoint_check' (optional): with optimizer checkpoints, returns the reason why the given checkpoint cannot be resumed (None if
+    # it can, ref. get_checkpoint_mismatch). If the saved checkpoint can be resumed and its points are in the history, the history points
+    # retrieved are its own ones plus the ones evaluated after them, instead of the slice (ref. getCheckpoint)
     #def getHistory(self, hist_file: str, last_slice_sz: int):
-    def getHistory(self, hist_file: str, slicing_directive: str):
+    def getHistory(self, hist_file: str, slicing_directive: str, checkpoint_check=None):
         num_items = 0
         x0 = None
         y0 = None
@@ -299,21 +368,36 @@ class HistoryManager:
 
         self._hist_file = hist_file
         logger = init_logger()
-        if os.path.exists(hist_file):
-            logger.debug("[history] Resuming optimization loop (loading history from: " + hist_file + ")...")
-            with open(hist_file, 'rb') as f:
-                res = pickle.load(f)
-            x0 = res.x_iters
+        self._artifacts = HistoryArtifacts()
+        self._artifacts.init(hist_file + ARTIFACTS_FILE_EXT)
+        checkpoint = None
+        if (checkpoint_check is not None):
+            checkpoint = self._artifacts.get("checkpoint")
+            reason = checkpoint_check(checkpoint) if (checkpoint is not None) else None
+            if (reason is not None):
+                logger.warning("[history] Optimizer checkpoint ignored, as " + reason + ": the history is sliced as usual, and told to a new optimizer")
+                checkpoint = None
+        if is_history_store(hist_file):
+            loaded = self._loadStore(hist_file, slicing_directive, checkpoint)
+        else:
+            loaded = self._loadPickle(hist_file, slicing_directive, checkpoint)
+        if (loaded is not None):
+            x0, y0, failure_categories, sim_times, num_items, num_from_journal, _ = loaded
             #if x0 is not None:
             #    #debug_history(x0)
             #    #validate_x0(sspace, x0)
-            num_items = len(x0 or [])
-            logger.info("[history] History retrieved (" + hist_file + "). History points: " + str(num_items))
-            y0 = res.func_vals.tolist()
-
-            x0, y0 = get_list_fragment(x0, slicing_directive), get_list_fragment(y0, slicing_directive)
+            logger.info("[history] History retrieved (" + hist_file + "). History points: " + str(num_items) + " (from the journal: " + str(num_from_journal) + ")")
+            if (failure_categories is not None):
+                self._failure_categories = failure_categories
+            if (sim_times is not None):
+                self._sim_times = sim_times
             slice_sz = len(x0 or [])
-            if (num_items > 0) and (num_items > slice_sz):
+            self._num_hist_points = slice_sz
+            if (self._checkpoint is not None):
+                logger.info("[history] History points selected by the optimizer checkpoint (orig sz: " + str(num_items) + ", checkpoint points plus the ones evaluated after them: " + str(slice_sz) +
+                            "), the slicing directive is not applied")
+                num_items = slice_sz
+            elif (num_items > 0) and (num_items > slice_sz):
                 old_hist_sz = num_items
                 num_items = slice_sz
                 logger.info("[history] History has been sliced [orig sz: " + str(old_hist_sz) + ", optimizer will consider only the selected slice (slicing directive: " + slicing_directive + " , sz: " + str(num_items) + ")]")
@@ -331,6 +415,147 @@ class HistoryManager:
         self._is_initialized = True
         return x0, y0, num_items
 
+    # History from the pickled optimization result (if any) plus the journaled evaluations it does not contain, sliced: points, objective
+    # values, failure categories and simulation run times (None if not saved), number of points (before slicing), number of points from
+    # the journal, search space dimension names (None if not saved). None if there is no history. With a checkpoint (OptimizerCheckpoint)
+    # whose points are in the history, the points selected are its own ones plus the ones after them (ref. _getSelectedIndexes)
+    def _loadPickle(self, hist_file, slicing_directive, checkpoint=None):
+        logger = init_logger()
+        # evaluations journaled after the last snapshot (e.g. before a crash), ref. HistoryJournal
+        journal_snapshot_id, journal_records = read_journal(hist_file + JOURNAL_FILE_EXT)
+        journal_records = [rec for rec in journal_records if rec["final"]]
+        if ((not os.path.exists(hist_file)) and (not journal_records)):
+            return None
+        res = None
+        if os.path.exists(hist_file):
+            logger.debug("[history] Resuming optimization loop (loading history from: " + hist_file + ")...")
+            with open(hist_file, 'rb') as f:
+                res = pickle.load(f)
+        x0 = list(res.x_iters) if (res is not None) else []
+        y0 = res.func_vals.tolist() if (res is not None) else []
+        # failure category of each history point (None for the successful ones), and simulation run time (None for the ones not simulated), if saved
+        failure_categories = getattr(res, "failure_categories", None)
+        sim_times = getattr(res, "sim_times", None)
+        dim_names = res.space.dimension_names if (res is not None) else None
+        if ((res is not None) and (getattr(res, "journal_snapshot_id", None) != journal_snapshot_id)):
+            # journal not compacted against this snapshot
+            journal_records = get_records_not_in(journal_records, x0)
+        if journal_records:
+            failure_categories = (failure_categories or [None] * len(x0)) + [get_record_category(rec) for rec in journal_records]
+            sim_times = (sim_times or [None] * len(x0)) + [rec["sim_secs"] for rec in journal_records]
+            x0 = x0 + [rec["x"] for rec in journal_records]
+            y0 = y0 + [rec["y"] for rec in journal_records]
+        num_items = len(x0)
+
+        indexes = self._getSelectedIndexes(x0, y0, slicing_directive, dim_names, checkpoint)
+        if (indexes is not None):
+            x0, y0 = get_list_items(x0, indexes), get_list_items(y0, indexes)
+            failure_categories, sim_times = get_list_items(failure_categories, indexes), get_list_items(sim_times, indexes)
+            return x0, y0, failure_categories, sim_times, num_items, len(journal_records), dim_names
+        x0, y0 = get_list_fragment(x0, slicing_directive), get_list_fragment(y0, slicing_directive)
+        if (failure_categories is not None):
+            failure_categories = get_list_fragment(failure_categories, slicing_directive)
+        if (sim_times is not None):
+            sim_times = get_list_fragment(sim_times, slicing_directive)
+        return x0, y0, failure_categories, sim_times, num_items, len(journal_records), dim_names
+
+    # Same as '_loadPickle', from the history store (ref. HistoryStore): a pickled history with the same name (.pkl) is imported into the
+    # store when it is still empty, and the journaled evaluations the store does not contain are appended to it. Only the sliced points
+    # are read, if the slicing directive is positional (the coreset ones, and the checkpoint's ones, are selected on all the points)
+    def _loadStore(self, hist_file, slicing_directive, checkpoint=None):
+        logger = init_logger()
+        self._store = HistoryStore()
+        self._store.init(hist_file)
+        legacy_file = os.path.splitext(hist_file)[0] + ".pkl"
+        if ((self._store.count() == 0) and os.path.exists(legacy_file)):
+            logger.info("[history] Importing the pickled history " + legacy_file + " into the history store " + hist_file)
+            lx0, ly0, lcategories, ltimes, _, _, ldim_names = self._loadPickle(legacy_file, "0:")
+            self._store.append(lx0, ly0, lcategories, ltimes, dim_names=ldim_names, meta={"dim_names": ldim_names})
+
+        num_from_journal = 0
+        journal_file = hist_file + JOURNAL_FILE_EXT
+        journal_snapshot_id, journal_records = read_journal(journal_file)
+        journal_records = [rec for rec in journal_records if rec["final"]]
+        if journal_records:
+            if (self._store.getMeta(JOURNAL_SNAPSHOT_KEY) != journal_snapshot_id):
+                # journal not compacted against the store
+                journal_records = get_records_not_in(journal_records, self._store.fetchRange(0, self._store.count(), ["x"])[0])
+            # appended to the store along with a new snapshot ID, then the journal is emptied
+            snapshot_id = uuid.uuid4().hex
+            self._store.append([rec["x"] for rec in journal_records], [rec["y"] for rec in journal_records], [get_record_category(rec) for rec in journal_records],
+                               [rec["sim_secs"] for rec in journal_records], [datetime.fromisoformat(rec["time"]).timestamp() for rec in journal_records],
+                               self._store.getMeta("dim_names"), {JOURNAL_SNAPSHOT_KEY: snapshot_id})
+            write_journal(journal_file, snapshot_id, [])
+            num_from_journal = len(journal_records)
+
+        num_items = self._store.count()
+        if (num_items == 0):
+            return None
+        if ((checkpoint is not None) or is_coreset_directive(slicing_directive)):
+            columns = self._store.fetchRange(0, num_items, ["x", "y", "failure_category", "sim_time"])
+            indexes = self._getSelectedIndexes(columns[0], columns[1], slicing_directive, self._store.getMeta("dim_names"), checkpoint)
+            if (indexes is None):
+                indexes = list(range(*get_fragment_range(num_items, slicing_directive)))
+            x0, y0, failure_categories, sim_times = [get_list_items(col, indexes) for col in columns]
+        else:
+            start, stop = get_fragment_range(num_items, slicing_directive)
+            x0, y0, failure_categories, sim_times = self._store.fetchRange(start, stop, ["x", "y", "failure_category", "sim_time"])
+        best_y, best_seq = self._store.fetchBest(1, ["y", "mat_seq"])
+        logger.info("[history] Best history point: objective function value " + str(best_y[0]) + " (material sequence: " + str(best_seq[0]) + ")")
+        return x0, y0, failure_categories, sim_times, num_items, num_from_journal, self._store.getMeta("dim_names")
+
+    # Positions of the history points to be retrieved, if not selected by the positional slicing directive (None): the checkpoint's
+    # points plus the ones evaluated after them, if the checkpoint (if any) has its points in the history, else the coreset ones
+    def _getSelectedIndexes(self, x_iters, func_vals, slicing_directive, dim_names, checkpoint):
+        if (checkpoint is not None):
+            indexes = get_checkpoint_indexes(checkpoint, x_iters, func_vals)
+            if (indexes is not None):
+                self._checkpoint = checkpoint
+                return indexes
+            init_logger().warning("[history] Optimizer checkpoint ignored, as its points are not in the history: the history is sliced as usual, and told to a new optimizer")
+        if is_coreset_directive(slicing_directive):
+            return get_coreset_indexes(x_iters, func_vals, slicing_directive, dim_names)
+        return None
+
+    # Optimizer checkpoint to resume, whose points (plus the ones evaluated after them) are the history points retrieved by 'getHistory'
+    # (None if there is none, or if it cannot be resumed)
+    def getCheckpoint(self):
+        return self._checkpoint
+
+    # Failure categories of the (sliced) history points retrieved by 'getHistory' (None if the history did not save them)
+    def getFailureCategories(self):
+        return self._failure_categories
+
+    # Failure categories of the points, from the given registry, are saved in the history along with the points
+    def setFailureRegistry(self, failureRegistry):
+        self._failureRegistry = failureRegistry
+
+    # Simulation run times of the (sliced) history points retrieved by 'getHistory' (None if the history did not save them)
+    def getSimTimes(self):
+        return self._sim_times
+
+    # Simulation run times of the points, from the given registry, are saved in the history along with the points
+    def setRuntimeRegistry(self, runtimeRegistry):
+        self._runtimeRegistry = runtimeRegistry
+
+    # Opens the history journal (next to the history file), to be fed by the objective function: upon each history update, it gets compacted
+    def openJournal(self):
+        if (self._hist_file is None):
+            return None
+        self._journal = HistoryJournal()
+        self._journal.init(self._hist_file + JOURNAL_FILE_EXT)
+        return self._journal
+
+    # Number of the most recent surrogate models persisted among the heavy artifacts (ref. HistoryArtifacts) upon each history update
+    def setPersistedModels(self, numModels):
+        if ((not isinstance(numModels, int)) or isinstance(numModels, bool) or (numModels < 0)):
+            raise ValueError("[history] ERROR. 'history_models' must be a non-negative integer, got: " + str(numModels))
+        self._num_models = numModels
+
+    # Heavy artifacts (surrogate models, specifications) of the history, loaded lazily upon request (None if no history file was specified)
+    def getArtifacts(self):
+        return self._artifacts
+
     def updateHistory(self, oResult):
         if (not self._is_initialized):
             raise RuntimeError("[history] Error. Bad Sequence. 'updateHistory' cannot be called here, as the history manager has not been initialized")
@@ -339,8 +564,33 @@ class HistoryManager:
             logger.info("[history] History is not being saved or updated, as no history file was specified.")
         else:
             logger.info("[history] Updating history (" + self._hist_file + ")")
-            with open(self._hist_file, 'wb') as f:
-                pickle.dump(oResult, f)
+            snapshot_id = uuid.uuid4().hex if (self._journal is not None) else None
+            light_result, artifacts = split_result(oResult, self._num_models)
+            if (artifacts["models"] or (artifacts["specs"] is not None) or (artifacts["checkpoint"] is not None)):
+                self._artifacts.save(artifacts)
+            if (self._store is not None):
+                # the history points loaded by 'getHistory' come first: only the points not stored yet are appended
+                start = self._num_hist_points + self._num_stored
+                new_x, new_y = oResult.x_iters[start:], list(oResult.func_vals[start:])
+                failure_categories = self._failureRegistry.getCategories(new_x, new_y) if (self._failureRegistry is not None) else None
+                sim_times = self._runtimeRegistry.getTimes(new_x) if (self._runtimeRegistry is not None) else None
+                meta = {"dim_names": oResult.space.dimension_names}
+                if (snapshot_id is not None):
+                    meta[JOURNAL_SNAPSHOT_KEY] = snapshot_id
+                self._store.append(new_x, new_y, failure_categories, sim_times, dim_names=meta["dim_names"], meta=meta)
+                self._num_stored = self._num_stored + len(new_x)
+            else:
+                if (self._failureRegistry is not None):
+                    light_result.failure_categories = self._failureRegistry.getCategories(oResult.x_iters, oResult.func_vals)
+                if (self._runtimeRegistry is not None):
+                    light_result.sim_times = self._runtimeRegistry.getTimes(oResult.x_iters)
+                if (snapshot_id is not None):
+                    light_result.journal_snapshot_id = snapshot_id
+                # lightweight result only (the heavy artifacts are saved aside)
+                dump_atomically(light_result, self._hist_file)
             logger.info("[history] History updated")
+            if (self._journal is not None):
+                # the history points loaded by 'getHistory' come first
+                self._journal.compact(oResult.x_iters[self._num_hist_points:], snapshot_id)
 
 
@@ -0,0 +1,110 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from logging_utils import init_logger
+
+# history files with these extensions are history stores (ref. HistoryStore), the other ones pickled optimization results
+HISTORY_STORE_EXTS = [".sqlite", ".db"]
+
+# columns of each history point (besides its position, 'idx')
+HISTORY_STORE_COLUMNS = ["x", "y", "mat_seq", "failure_category", "sim_time", "created_at"]
+
+def is_history_store(hist_file):
+    return (os.path.splitext(hist_file)[1].lower() in HISTORY_STORE_EXTS)
+
+# Material sequence of a point (raw material indexes of its layers, e.g. "2-0-1"), for the search spaces made of 'num_layers' and
+# 'material_index_<i>' dimensions (e.g. Adv250814). None for the other ones
+def get_material_sequence(x, dim_names):
+    if ((not dim_names) or ("num_layers" not in dim_names)):
+        return None
+    try:
+        num_layers = int(x[dim_names.index("num_layers")])
+        return "-".join(str(int(x[dim_names.index("material_index_" + str(i + 1))])) for i in range(num_layers))
+    except (ValueError, IndexError):
+        return None
+
+# -------------------------------------
+# History store
+# -------------------------------------
+# SQLite alternative to the pickled optimization result as the history file: one row per history point (point, objective value,
+# material sequence, failure category, simulation run time, timestamp), indexed by material sequence, objective value and
+# timestamp. Loading reads the needed columns of the selected rows only (e.g. the positional slice of the history), instead of
+# unpickling the whole result (fitted models included), and each history update appends the new points only, in one transaction.
+# The whole history is kept, whatever the slicing directive.
+class HistoryStore:
+    def __init__(self):
+        self._db_path = None
+        self._is_initialized = False
+
+    def init(self, db_path):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._db_path = db_path
+        with closing(self._connect()) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS points (idx INTEGER PRIMARY KEY, x TEXT NOT NULL, y REAL NOT NULL, mat_seq TEXT, failure_category TEXT, sim_time REAL, created_at REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS points_mat_seq ON points (mat_seq)")
+            conn.execute("CREATE INDEX IF NOT EXISTS points_y ON points (y)")
+            conn.execute("CREATE INDEX IF NOT EXISTS points_created_at ON points (created_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._is_initialized = True
+
+    def _connect(self):
+        return sqlite3.connect(self._db_path, timeout=30)
+
+    def _checkInitialized(self, method):
+        if (not self._is_initialized):
+            raise RuntimeError("[histstore] ERROR. Bad Sequence. '" + method + "' cannot be called here, as the history store has not been initialized")
+
+    def getMeta(self, key):
+        self._checkInitialized("getMeta")
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if (row is not None) else None
+
+    def count(self):
+        self._checkInitialized("count")
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM points").fetchone()[0]
+
+    def _select(self, columns, tail_sql="", params=()):
+        for col in columns:
+            if (col not in HISTORY_STORE_COLUMNS):
+                raise ValueError("[histstore] ERROR. Unknown history store column: " + str(col))
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT " + ", ".join(columns) + " FROM points " + tail_sql, params).fetchall()
+        # one list per column
+        cols = [list(c) for c in zip(*rows)] if rows else [[] for _ in columns]
+        if ("x" in columns):
+            cols[columns.index("x")] = [json.loads(xi) for xi in cols[columns.index("x")]]
+        return cols
+
+    # The given columns (one list each) of the points in the positional range [start, stop), in order
+    def fetchRange(self, start, stop, columns):
+        self._checkInitialized("fetchRange")
+        return self._select(columns, "ORDER BY idx LIMIT ? OFFSET ?", (max(stop - start, 0), start))
+
+    # The given columns of the 'k' best points (lowest objective values), best first
+    def fetchBest(self, k, columns):
+        self._checkInitialized("fetchBest")
+        return self._select(columns, "ORDER BY y, idx LIMIT ?", (k,))
+
+    # Appends the given points (with their metadata: lists aligned with 'x_iters', None if not known) in one transaction, along with
+    # the given metadata ('meta': key -> JSON serializable value), e.g. the ID of the snapshot, or the search space dimension names
+    def append(self, x_iters, func_vals, failure_categories=None, sim_times=None, created_ats=None, dim_names=None, meta=None):
+        self._checkInitialized("append")
+        num_points = len(x_iters)
+        failure_categories = failure_categories or [None] * num_points
+        sim_times = sim_times or [None] * num_points
+        now = time.time()
+        created_ats = created_ats or [now] * num_points
+        rows = [(json.dumps([(v.item() if hasattr(v, "item") else v) for v in xi]), float(yi), get_material_sequence(xi, dim_names), ci, ti, tsi)
+                for xi, yi, ci, ti, tsi in zip(x_iters, func_vals, failure_categories, sim_times, created_ats)]
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("INSERT INTO points (x, y, mat_seq, failure_category, sim_time, created_at) VALUES (?, ?, ?, ?, ?, ?)", rows)
+            for key, value in (meta or {}).items():
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+        init_logger().info("[histstore] History points appended to " + self._db_path + ": " + str(num_points))
@@ -0,0 +1,107 @@
+import glob
+import os
+import time
+
+from skopt.utils import create_result, normalize_dimensions
+
+from logging_utils import init_logger
+from history_mgr import HistoryManager
+from pareto import get_point_key
+from sim_queue import create_worker_id
+
+# -------------------------------------
+# Island model: optimizer instances exchanging their observations through a shared store
+# -------------------------------------
+# Each island (optimizer instance, on any host) publishes the shields it simulated into <store dir>/island_<id>.pkl,
+# in the same format as the history file (pickled optimization result, written atomically), and periodically imports
+# the other islands' ones. The imported points are validated against the local search space (as X0 is) and told to the
+# optimizer, without consuming runs. The islands must share the problem definition (search space, objective function,
+# targets), while they can differ in the optimizer settings (random_state, acq_func, etc.).
+ISLAND_FILENAME_PFIX = "island_"
+ISLAND_FILENAME_EXT = "pkl"
+
+class IslandExchange:
+    def __init__(self):
+        self._store_dir = None
+        self._island_id = None
+        self._island_file = None
+        self._ownHistManager = None
+        self._exchange_secs = None
+        self._search_space = None
+        self._own_x = []
+        self._own_y = []
+        self._known_points = set()
+        self._last_exchange = None
+        self._num_imported = 0
+        self._is_initialized = False
+
+    # 'x0' is the history of this optimizer instance: its points are never imported again
+    def init(self, paramsHolder, search_space, x0):
+        logger = init_logger()
+        self._store_dir = paramsHolder.get("island_store_dir")
+        # to be set when restarting an island, for it to go on with its own published observations
+        self._island_id = str(paramsHolder.get("island_id", create_worker_id()))
+        self._exchange_secs = paramsHolder.get("island_exchange_secs", 60.0)
+        self._search_space = search_space
+        os.makedirs(self._store_dir, exist_ok=True)
+        self._island_file = os.path.join(self._store_dir, ISLAND_FILENAME_PFIX + self._island_id + "." + ISLAND_FILENAME_EXT)
+        self._ownHistManager = HistoryManager()
+        own_x, own_y, _ = self._ownHistManager.getHistory(self._island_file, "0:")
+        self._own_x, self._own_y = list(own_x or []), list(own_y or [])
+        self._known_points = set(get_point_key(xi) for xi in (list(x0 or []) + self._own_x))
+        self._last_exchange = time.monotonic()
+        self._is_initialized = True
+        logger.info("[island] Island " + self._island_id + " ready (store: " + self._store_dir + ", own published points: " + str(len(self._own_x)) + ", exchange every " + str(self._exchange_secs) + "s)")
+
+    # Publishes the points simulated by this island so far (e.g. at the end of the optimization loop)
+    def publish(self):
+        if (not self._is_initialized):
+            raise RuntimeError("[island] ERROR. Bad Sequence. 'publish' cannot be called here, as the island exchange has not been initialized")
+        if self._own_x:
+            self._ownHistManager.updateHistory(create_result(self._own_x, self._own_y, normalize_dimensions(self._search_space)))
+
+    def _import(self):
+        logger = init_logger()
+        imported_x, imported_y = [], []
+        num_islands = 0
+        for island_file in sorted(glob.glob(os.path.join(self._store_dir, ISLAND_FILENAME_PFIX + "*." + ISLAND_FILENAME_EXT))):
+            if (os.path.abspath(island_file) == os.path.abspath(self._island_file)):
+                continue
+            try:
+                x_isl, y_isl, _ = HistoryManager().getHistory(island_file, "0:")
+            except Exception as e:
+                logger.warning("[island] Could not import from " + island_file + " (" + str(e) + "), it will be retried at the next exchange")
+                continue
+            num_islands = num_islands + 1
+            for xi, yi in zip(x_isl or [], y_isl or []):
+                if (get_point_key(xi) not in self._known_points):
+                    imported_x.append(xi)
+                    imported_y.append(yi)
+        if imported_x:
+            # same compatibility checks as X0: points not fitting the local search space are discarded
+            _, valid_x = HistoryManager().checkX0(imported_x, self._search_space)
+            valid_ids = set(id(xi) for xi in valid_x)
+            imported_y = [yi for xi, yi in zip(imported_x, imported_y) if (id(xi) in valid_ids)]
+            imported_x = valid_x
+        for xi in imported_x:
+            self._known_points.add(get_point_key(xi))
+        return imported_x, imported_y, num_islands
+
+    # Records the points just simulated by this island and, every 'island_exchange_secs' (or if forced), publishes them and
+    # returns the new points (and objective function values) of the other islands, to be told to the optimizer
+    def exchange(self, new_x, new_y, force=False):
+        logger = init_logger()
+        if (not self._is_initialized):
+            raise RuntimeError("[island] ERROR. Bad Sequence. 'exchange' cannot be called here, as the island exchange has not been initialized")
+        for xi, yi in zip(new_x, new_y):
+            self._own_x.append(list(xi))
+            self._own_y.append(yi)
+            self._known_points.add(get_point_key(xi))
+        if ((not force) and (time.monotonic() - self._last_exchange < self._exchange_secs)):
+            return [], []
+        self._last_exchange = time.monotonic()
+        self.publish()
+        imported_x, imported_y, num_islands = self._import()
+        self._num_imported = self._num_imported + len(imported_x)
+        logger.info("[opttrace][island] Exchange: published " + str(len(self._own_x)) + " points, imported " + str(len(imported_x)) + " new points from " + str(num_islands) + " other islands (imported so far: " + str(self._num_imported) + ")")
+        return imported_x, imported_y
@@ -47,13 +47,18 @@ class KPIHolder:
         self._kpis_dict = {}
         self._objf_evaluator = None
         self._target_met_assessor = None
+        self._fidelity = None
+        self._is_partial = False
         self._is_initialized = False
 
-    def load(self, sim_id: str, out_root_dir: str, objfu_evaluator, targetMetAssessor):
+    # 'fidelity': fidelity level (number of primary particles) the KPIs were produced with, None for the simulator default (full statistics)
+    def load(self, sim_id: str, out_root_dir: str, objfu_evaluator, targetMetAssessor, fidelity=None):
         logger = init_logger()
 
         kpi_file_path, kpi_file_delim = create_kpi_filepath(out_root_dir, sim_id)
         self._kpis_file = kpi_file_path
+        self._fidelity = fidelity
+        self._is_partial = False
         self._objf_evaluator = objfu_evaluator
         self._target_met_assessor = targetMetAssessor
 
@@ -78,6 +83,34 @@ class KPIHolder:
         self._is_initialized = True
         logger.info("[kpih] KPIs retrieved successfully")
 
+    # Initialization from KPIs already known (e.g. retrieved from the simulation results cache), instead of the KPIs file.
+    # 'is_partial': the KPIs are the partial estimate of a simulation which was aborted early
+    def initFromDict(self, sim_id: str, kpis_dict, objfu_evaluator, targetMetAssessor, fidelity=None, is_partial=False):
+        logger = init_logger()
+        self._kpis_file = None
+        self._fidelity = fidelity
+        self._is_partial = is_partial
+        self._objf_evaluator = objfu_evaluator
+        self._target_met_assessor = targetMetAssessor
+        self._kpis_dict = dict(kpis_dict)
+        self._is_initialized = True
+        logger.info("[kpih] KPIs initialized from known values (simulation: " + sim_id + ")")
+
+    def getKPIsDict(self):
+        if (not (self._is_initialized)):
+            raise RuntimeError("[kpih] ERROR. Bad Sequence. 'getKPIsDict' cannot be called here, as the KPI holder is not initialized")
+        return dict(self._kpis_dict)
+
+    def getFidelity(self):
+        if (not (self._is_initialized)):
+            raise RuntimeError("[kpih] ERROR. Bad Sequence. 'getFidelity' cannot be called here, as the KPI holder is not initialized")
+        return self._fidelity
+
+    def isPartial(self):
+        if (not (self._is_initialized)):
+            raise RuntimeError("[kpih] ERROR. Bad Sequence. 'isPartial' cannot be called here, as the KPI holder is not initialized")
+        return self._is_partial
+
     def getShieldWeight(self):
         if (not (self._is_initialized)):
             raise RuntimeError("[kpih] ERROR. Bad Sequence. 'getShieldWeight' cannot be called here, as the KPI holder is not initialized")
@@ -102,6 +135,11 @@ class KPIHolder:
     def toString(self):
         if (not (self._is_initialized)):
             raise RuntimeError("[kpih] ERROR. Bad Sequence. 'toString' cannot be called here, as the KPI holder is not initialized")
-        return ", ".join(f"{k}={v}" for k, v in self._kpis_dict.items())
+        kpis_desc = ", ".join(f"{k}={v}" for k, v in self._kpis_dict.items())
+        if (self._fidelity is not None):
+            kpis_desc = kpis_desc + ", fidelity=" + str(self._fidelity)
+        if self._is_partial:
+            kpis_desc = kpis_desc + ", partial=True"
+        return kpis_desc
 
 
@@ -0,0 +1,134 @@
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from logging_utils import init_logger
+from engine_factory import create_optimizer
+from batch_driver import evaluate_points, SIM_SLOT_THREAD_PFIX
+
+# -------------------------------------
+# Multi-fidelity (successive halving) optimization loop
+# -------------------------------------
+# Upon each bracket, 'mf_bracket_size' candidates are asked to the optimizer and simulated at the lowest fidelity level
+# (fewest primary particles); only the best 1/'mf_eta' of them (never the penalized ones) are promoted to the next level,
+# and so on up to the last level (full statistics). Each candidate is then told to the optimizer with the value obtained
+# at the highest fidelity it reached (so the poor shields still shape the surrogate, at a fraction of the cost), but never
+# better than the worst successful (i.e. not penalized) full-fidelity value of its bracket (it ranked below the promoted ones):
+# this way the best solution is always a full-fidelity one, and the failures at full fidelity do not turn the lower tier of
+# the bracket into (penalized) failures. If no candidate of the bracket succeeds at full fidelity (e.g. all the ones promoted
+# to an intermediate level fail), the cap is the worst successful full-fidelity value seen so far (X0 included); the values
+# are left as they are only until the first successful full-fidelity result.
+# 'max_runs' is accounted in full-fidelity-equivalent runs: a simulation at level L costs L / <last level>.
+# The last level is the full statistics, i.e. the simulator default: the full-fidelity simulations are run with no fidelity
+# specified (as in the other run modes), so that they share the simulation results cache entries of the other run modes.
+
+def get_level_cost(fidelity_levels, level_idx):
+    return float(fidelity_levels[level_idx]) / float(fidelity_levels[-1])
+
+def get_promoted_count(num_candidates, eta):
+    return max(1, num_candidates // eta)
+
+# Cost of a whole bracket, assuming that at each level the maximum number of candidates gets promoted
+def get_bracket_cost(bracket_size, fidelity_levels, eta):
+    cost = 0.0
+    num_candidates = bracket_size
+    for level_idx in range(len(fidelity_levels)):
+        cost = cost + num_candidates * get_level_cost(fidelity_levels, level_idx)
+        num_candidates = get_promoted_count(num_candidates, eta)
+    return cost
+
+def validate_mf_params(fidelity_levels, eta, bracket_size):
+    if ((not isinstance(fidelity_levels, list)) or (not fidelity_levels) or any((not isinstance(fl, int)) or (fl < 1) for fl in fidelity_levels)):
+        raise ValueError("[mf] ERROR. 'mf_fidelity_levels' must be a non-empty list of positive integers (numbers of primary particles), got: " + str(fidelity_levels))
+    if (sorted(set(fidelity_levels)) != fidelity_levels):
+        raise ValueError("[mf] ERROR. 'mf_fidelity_levels' must be strictly ascending (the last one being the full statistics), got: " + str(fidelity_levels))
+    if ((not isinstance(eta, int)) or (eta < 2)):
+        raise ValueError("[mf] ERROR. 'mf_eta' must be an integer greater than 1, got: " + str(eta))
+    if ((not isinstance(bracket_size, int)) or (bracket_size < 1)):
+        raise ValueError("[mf] ERROR. 'mf_bracket_size' must be a positive integer, got: " + str(bracket_size))
+
+def run_multifidelity_optimization(objective_fn, search_space, x0, y0, max_runs, optimizerConf, post_callback, pn_value, feasibleSampler=None, failureRegistry=None, runtimeRegistry=None):
+    logger = init_logger()
+    sim_slots = optimizerConf.getParam("sim_slots")
+    strategy = optimizerConf.getParam("batch_strategy")
+    fidelity_levels = optimizerConf.getParam("mf_fidelity_levels")
+    eta = optimizerConf.getParam("mf_eta")
+    bracket_size = optimizerConf.getParam("mf_bracket_size")
+    if ((not isinstance(sim_slots, int)) or (sim_slots < 1)):
+        raise ValueError("[mf] ERROR. 'sim_slots' must be a positive integer, got: " + str(sim_slots))
+    validate_mf_params(fidelity_levels, eta, bracket_size)
+
+    x0 = x0 or []
+    optimizer = create_optimizer(search_space, optimizerConf, len(x0), feasible_sampler=feasibleSampler, failure_registry=failureRegistry, runtime_registry=runtimeRegistry)
+    specs = {"args": {"max_runs": max_runs, "sim_slots": sim_slots, "batch_strategy": strategy, "mf_fidelity_levels": fidelity_levels, "mf_eta": eta, "mf_bracket_size": bracket_size},
+             "function": "run_multifidelity_optimization"}
+    logger.info("[mf] Multi-fidelity optimization loop (fidelity levels: " + str(fidelity_levels) + ", eta: " + str(eta) + ", bracket size: " + str(bracket_size) + ", simulator slots: " + str(sim_slots) + ")")
+
+    result = None
+    remaining_budget = float(max_runs)
+    seen_full_values = []
+    with ThreadPoolExecutor(max_workers=sim_slots, thread_name_prefix=SIM_SLOT_THREAD_PFIX) as executor:
+        # Same semantics as gp_minimize: X0 without Y0 gets evaluated (at full fidelity, counted as runs), X0 with Y0 is just told
+        if (x0 and (y0 is None)):
+            logger.info("[opttrace][mf] Evaluating X0 points (" + str(len(x0)) + ") at full fidelity")
+            y0 = evaluate_points(executor, objective_fn, x0)
+            remaining_budget = remaining_budget - len(x0)
+        if x0:
+            seen_full_values.extend(yi for yi in y0 if (yi < pn_value))
+            result = optimizer.tell(x0, y0)
+            result.specs = specs
+            if post_callback(result):
+                return result
+
+        bracket_nbr = 0
+        while True:
+            # the last brackets are shrunk, so to stay within the budget
+            curr_bracket_size = bracket_size
+            while ((curr_bracket_size > 1) and (get_bracket_cost(curr_bracket_size, fidelity_levels, eta) > remaining_budget + 1e-9)):
+                curr_bracket_size = curr_bracket_size - 1
+            if (get_bracket_cost(curr_bracket_size, fidelity_levels, eta) > remaining_budget + 1e-9):
+                break
+            bracket_nbr = bracket_nbr + 1
+
+            candidates = optimizer.ask(n_points=curr_bracket_size, strategy=strategy)
+            cand_values = [None] * len(candidates)
+            full_fidelity_idxs = []
+            promoted = list(range(len(candidates)))
+            for level_idx, fidelity in enumerate(fidelity_levels):
+                is_full_fidelity = (level_idx == len(fidelity_levels) - 1)
+                logger.info("[opttrace][mf] Bracket " + str(bracket_nbr) + ", level " + str(level_idx + 1) + "/" + str(len(fidelity_levels)) + " (fidelity: " + str(fidelity) + "): simulating " + str(len(promoted)) + " candidates")
+                level_fn = objective_fn if is_full_fidelity else partial(objective_fn, fidelity=fidelity, check_target=False)
+                level_values = evaluate_points(executor, level_fn, [candidates[ci] for ci in promoted])
+                for ci, yi in zip(promoted, level_values):
+                    cand_values[ci] = yi
+                remaining_budget = remaining_budget - len(promoted) * get_level_cost(fidelity_levels, level_idx)
+                if is_full_fidelity:
+                    full_fidelity_idxs = promoted
+                    break
+
+                # successive halving: the best candidates (penalized ones excluded) go on to the next fidelity level
+                ranked = sorted((ci for ci in promoted if (cand_values[ci] < pn_value)), key=lambda ci: cand_values[ci])
+                promoted = ranked[:get_promoted_count(len(promoted), eta)]
+                if (not promoted):
+                    logger.info("[opttrace][mf] Bracket " + str(bracket_nbr) + ": no candidate left to promote")
+                    break
+
+            full_fidelity_values = [cand_values[ci] for ci in full_fidelity_idxs]
+            successful_full_values = [yi for yi in full_fidelity_values if (yi < pn_value)]
+            seen_full_values.extend(successful_full_values)
+            cap_values = successful_full_values or seen_full_values
+            if cap_values:
+                worst_full_value = max(cap_values)
+                cand_values = [yi if (ci in full_fidelity_idxs) else max(yi, worst_full_value) for ci, yi in enumerate(cand_values)]
+            result = optimizer.tell(candidates, cand_values)
+            result.specs = specs
+            if successful_full_values:
+                logger.info(f"[opttrace][mf] Bracket {bracket_nbr} complete: best value {min(successful_full_values):.6f}, remaining budget: {max(remaining_budget, 0.0):.2f} full-fidelity runs")
+            else:
+                logger.info(f"[opttrace][mf] Bracket {bracket_nbr} complete: no successful full-fidelity result" + ("" if seen_full_values else " yet (low-fidelity values told as they are)") +
+                            f", remaining budget: {max(remaining_budget, 0.0):.2f} full-fidelity runs")
+            if post_callback(result):
+                break
+
+    if (result is None):
+        logger.warning("[mf] Budget too low for a multi-fidelity bracket (max. runs: " + str(max_runs) + ", single candidate bracket cost: " + str(round(get_bracket_cost(1, fidelity_levels, eta), 3)) + ")")
+    return result
@@ -1,4 +1,5 @@
 import subprocess
+import time
 from logging_utils import init_logger, format_iter_log
 
 from css_shield import CssShield
@@ -6,12 +7,27 @@ from kpis_utils import KPIHolder
 from geom_utils import create_geometry_conf, get_geom_config
 from simulator_wrap import run_simulation
 from constraint_utils import check_constraints_pre, check_constraints_post
+from feasibility_classifier import FAILURE_PRE_CHECK, FAILURE_POST_CHECK, FAILURE_SIM_ERROR
+from history_journal import JOURNAL_STATUS_OK, JOURNAL_STATUS_PARTIAL
 
 # -------------------------------------
 # Objective
 # -------------------------------------
 
-def objective(params, inParamsHolder, search_sp_bldr, materials_set, constr_par, objf_evaluator, trg_evaluator):
+# Journals the evaluation (if the history journal is enabled). The low fidelity evaluations ('check_target' False) are not part of the history as such
+def journal_evaluation(history_journal, params, obj_value, status, sim_id, kpis, sim_secs, fidelity, check_target):
+    if (history_journal is not None):
+        history_journal.append(params, float(obj_value), status, sim_id, kpis.getKPIsDict() if (kpis is not None) else None, sim_secs, fidelity, check_target)
+
+# 'fidelity': fidelity level of the simulation (None: full statistics). 'check_target': False for the low fidelity evaluations
+# (e.g. multi-fidelity run mode), whose KPIs are too noisy to stop the optimization upon.
+# 'early_abort' (EarlyAbortMonitor, optional): simulations which cannot be competitive are aborted, and evaluated on their partial KPIs.
+# 'pareto_archive' (ParetoArchive, optional): collects the objectives (KPIs, weight, thickness) of each shield simulated successfully
+# 'feasible_sampler' (FeasibleRegionSampler, optional): keeps track of the proposed shields failing the pre-simulation constraints check
+# 'failure_registry' (FailureRegistry, optional): records the category of each failed evaluation (pre/post-simulation check, simulation error)
+# 'runtime_registry' (RuntimeRegistry, optional): records the wall-clock time of each complete simulation (of the original one, for a cached shield)
+# 'history_journal' (HistoryJournal, optional): journals each evaluation as soon as it completes (crash-safe history)
+def objective(params, inParamsHolder, search_sp_bldr, materials_set, constr_par, objf_evaluator, trg_evaluator, sim_backend=None, sim_cache=None, fidelity=None, check_target=True, early_abort=None, pareto_archive=None, feasible_sampler=None, failure_registry=None, runtime_registry=None, history_journal=None):
     pn_value = inParamsHolder.get("penalization_value")
     sim_script = inParamsHolder.get("simulation_script")
     geom_trg_dir = inParamsHolder.get("geom_config_files_dir")
@@ -39,34 +55,68 @@ def objective(params, inParamsHolder, search_sp_bldr, materials_set, constr_par,
     #layers_desc = cShield.getLayersDesc()
 
     checkConstrPre = check_constraints_pre(cShield, constr_par.getPRE())
+    if (feasible_sampler is not None):
+        feasible_sampler.recordProposal(checkConstrPre)
     if not checkConstrPre:
         logger.info(format_iter_log(sim_id, cShield, num_repair_fun_warn, checkConstrPre, None, None, None, None, None))
+        if (failure_registry is not None):
+            failure_registry.record(params, FAILURE_PRE_CHECK)
+        journal_evaluation(history_journal, params, pn_value, FAILURE_PRE_CHECK, None, None, None, fidelity, check_target)
         return pn_value
 
     try:
-        sim_id, kpis = run_simulation(cShield, geom_trg_dir, config_templ_data, common_layer_data, sim_script, outdata_dir, objf_evaluator, trg_evaluator)
+        t_sim = time.monotonic()
+        # run time of the complete simulation only (the original one for a cached shield, None for an aborted simulation), and at full
+        # fidelity only (the registry keeps one run time per shield: a low fidelity one would make it look cheap to simulate)
+        sim_id, kpis, sim_secs = run_simulation(cShield, geom_trg_dir, config_templ_data, common_layer_data, sim_script, outdata_dir, objf_evaluator, trg_evaluator, sim_backend, sim_cache, fidelity, early_abort)
         logger.info(f"[driver][" + sim_id + "] KPIs retrieved after simulation: " + kpis.toString())
+        if ((runtime_registry is not None) and (sim_secs is not None) and (fidelity is None)):
+            runtime_registry.record(params, sim_secs)
     except subprocess.CalledProcessError as e:
         logger.error(f"[driver] Simulation failed. CalledProcessError: {e}")
         logger.info(format_iter_log(sim_id, cShield, num_repair_fun_warn,  checkConstrPre, checkConstrPost, None, None, None, f"{e}"))
+        if (failure_registry is not None):
+            failure_registry.record(params, FAILURE_SIM_ERROR)
+        journal_evaluation(history_journal, params, pn_value, FAILURE_SIM_ERROR, sim_id, None, time.monotonic() - t_sim, fidelity, check_target)
         return pn_value
     except Exception as ge:
         logger.error(f"[driver] Simulation failed. Generic error: {ge}")
         logger.info(format_iter_log(sim_id, cShield, num_repair_fun_warn, checkConstrPre, checkConstrPost, None, None, None, f"{ge}"))
+        if (failure_registry is not None):
+            failure_registry.record(params, FAILURE_SIM_ERROR)
+        journal_evaluation(history_journal, params, pn_value, FAILURE_SIM_ERROR, sim_id, None, time.monotonic() - t_sim, fidelity, check_target)
         return pn_value
 
     checkConstrPost = check_constraints_post(cShield, kpis, constr_par.getPOST())
     if not checkConstrPost:
         logger.info(format_iter_log(sim_id, cShield, num_repair_fun_warn, checkConstrPre, checkConstrPost, None, None, kpis.toString(), None))
+        if (failure_registry is not None):
+            failure_registry.record(params, FAILURE_POST_CHECK)
+        journal_evaluation(history_journal, params, pn_value, FAILURE_POST_CHECK, sim_id, kpis, sim_secs, fidelity, check_target)
         return pn_value
 
     #Eval objective function
     obj_fun = kpis.evalObjFunction(cShield)
 
+    # the partial estimate of an aborted simulation is reported as is: it is neither an incumbent, nor it can meet the target
+    if kpis.isPartial():
+        logger.info(format_iter_log(sim_id, cShield, num_repair_fun_warn, checkConstrPre, checkConstrPost, False, obj_fun, kpis.toString(), None))
+        journal_evaluation(history_journal, params, obj_fun, JOURNAL_STATUS_PARTIAL, sim_id, kpis, sim_secs, fidelity, check_target)
+        return (obj_fun)
+    if ((early_abort is not None) and check_target):
+        early_abort.updateIncumbent(obj_fun)
+    if ((pareto_archive is not None) and check_target):
+        kpis_dict = kpis.getKPIsDict()
+        shield_weight = cShield.getTotWeight() or kpis_dict["shield_weight"]
+        pareto_archive.add(sim_id, params, cShield.getLayersDesc(), {"energy_efficiency": kpis_dict["energy_efficiency"], "protection_efficiency": kpis_dict["protection_efficiency"],
+                                                                     "shield_weight": shield_weight, "shield_thickness": cShield.getTotThickness()})
+
     # Eval if target is met
     targetMet = kpis.targetIsMet()
     logger.info(format_iter_log(sim_id, cShield, num_repair_fun_warn, checkConstrPre, checkConstrPost, targetMet, obj_fun, kpis.toString(), None))
-    if (targetMet):
+    # journaled before the exit upon the target met, so that the history does not lose it
+    journal_evaluation(history_journal, params, obj_fun, JOURNAL_STATUS_OK, sim_id, kpis, sim_secs, fidelity, check_target)
+    if (targetMet and check_target):
         # Stop condition: target is met
         logger.info("[driver][" + sim_id + "] Target met! Exit.")
         exit(0)
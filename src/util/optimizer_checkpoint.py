@@ -0,0 +1,132 @@
+import copy
+import json
+
+from skopt.utils import create_result, normalize_dimensions
+
+from logging_utils import init_logger
+from pareto import get_point_key
+
+# run modes whose ask/tell optimizer can be checkpointed and resumed (the 'sequential' one through an ask/tell optimizer)
+CHECKPOINT_RUN_MODES = ["sequential", "batch", "async", "pipelined"]
+
+# -------------------------------------
+# Ask/tell optimizer checkpoints
+# -------------------------------------
+# Upon a restart, the history points are told to a brand new optimizer: the surrogate is refitted from scratch, the initial design
+# logic is evaluated again (its random points drawn again from the initial random state) and the random state of the interrupted run
+# is lost, so a resumed run is neither fast nor reproducible. With 'optimizer_checkpoint', the ask/tell optimizer itself is saved upon
+# each history update, among the heavy artifacts of the history (ref. HistoryArtifacts): its points, its random state, its remaining
+# initial points, its last fitted surrogate (kernel hyperparameters included), the gp_hedge gains, the next point to be asked, plus the
+# points which were still pending (being simulated, or already asked). Upon the restart, if the checkpoint matches the configuration,
+# the search space and the stored history, the optimizer is resumed as it was, with no refit (one, to tell the history points it does
+# not contain, e.g. journaled ones, or if it was checkpointed before being fitted on its last points), and the pending points are evaluated first.
+# The history points it resumes from are its own ones plus the ones evaluated after them (ref. HistoryManager): the slicing directive is
+# not applied again, as the optimizer points are the slice selected upon the first run plus all the points evaluated since.
+
+# Optimizer configuration the checkpoint is valid for
+def get_conf_fingerprint(optimizerConf):
+    return json.dumps(optimizerConf.getParams(), sort_keys=True, default=str)
+
+class OptimizerCheckpoint:
+    def __init__(self, optimizer, pending_points, conf_fingerprint, fitted=True):
+        self._optimizer = optimizer
+        self._pending_points = [list(xi) for xi in pending_points]
+        self._conf_fingerprint = conf_fingerprint
+        self._fitted = fitted
+
+    # pickled upon the history update: the optimizer as it is then, with its last fitted surrogate only
+    def __getstate__(self):
+        optimizer = copy.copy(self._optimizer)
+        optimizer.models = list(self._optimizer.models[-1:])
+        return {"_optimizer": optimizer, "_pending_points": self._pending_points, "_conf_fingerprint": self._conf_fingerprint, "_fitted": self._fitted}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def getOptimizer(self):
+        return self._optimizer
+
+    def getPendingPoints(self):
+        return self._pending_points
+
+    def getConfFingerprint(self):
+        return self._conf_fingerprint
+
+    # False if the optimizer was told its last points without being fitted on them (e.g. asynchronous and pipelined loops)
+    def isFitted(self):
+        return self._fitted
+
+# Attaches the checkpoint of the optimizer (and of the pending points) to the result, to be saved upon the history update (if enabled).
+# 'fitted': whether the optimizer was fitted upon its last tell
+def attach_checkpoint(result, optimizer, optimizerConf, pending_points=(), fitted=True):
+    if optimizerConf.getParam("optimizer_checkpoint"):
+        result.checkpoint = OptimizerCheckpoint(optimizer, pending_points, get_conf_fingerprint(optimizerConf), fitted)
+
+# Reason why the checkpoint cannot be resumed (the optimizer configuration or the search space changed), None if it can
+def get_checkpoint_mismatch(checkpoint, search_space, optimizerConf):
+    if (checkpoint.getConfFingerprint() != get_conf_fingerprint(optimizerConf)):
+        return "the optimizer configuration changed"
+    elif (checkpoint.getOptimizer().space != normalize_dimensions(search_space)):
+        return "the search space changed"
+    return None
+
+# Positions, in the whole history, of the checkpoint's points followed by the ones evaluated after them (e.g. journaled), which are
+# the history points the resumed optimizer considers, whatever the slicing directive. None if the checkpoint's points are not in the history
+def get_checkpoint_indexes(checkpoint, x_iters, func_vals):
+    optimizer = checkpoint.getOptimizer()
+    indexes = []
+    pos = 0
+    for xi, yi in zip(optimizer.Xi, optimizer.yi):
+        key = get_point_key(xi)
+        while ((pos < len(x_iters)) and ((get_point_key(x_iters[pos]) != key) or (func_vals[pos] != yi))):
+            pos = pos + 1
+        if (pos == len(x_iters)):
+            return None
+        indexes.append(pos)
+        pos = pos + 1
+    return indexes + list(range(pos, len(x_iters)))
+
+# The optimizer resumed from the checkpoint, and the points still to be evaluated first. (None, []) if there is no checkpoint, or if it
+# does not match the configuration, the search space, or the history (its points must be the first ones of X0/Y0, as selected by
+# the history manager, the other ones are told)
+def resume_optimizer(checkpoint, search_space, optimizerConf, x0, y0, feasible_sampler=None, failure_registry=None, runtime_registry=None):
+    logger = init_logger()
+    if ((checkpoint is None) or (not x0) or (y0 is None)):
+        return None, []
+    optimizer = checkpoint.getOptimizer()
+    reason = get_checkpoint_mismatch(checkpoint, search_space, optimizerConf)
+    if ((reason is None) and ((len(optimizer.Xi) > len(x0)) or any((get_point_key(xi) != get_point_key(xh)) or (yi != yh) for xi, yi, xh, yh in zip(optimizer.Xi, optimizer.yi, x0, y0)))):
+        reason = "its points are not the first ones of the history"
+    if (reason is not None):
+        logger.warning("[checkpoint] Optimizer checkpoint ignored, as " + reason + ": the history points are told to a new optimizer")
+        return None, []
+
+    # the registries (and the sampler) in use, instead of the checkpoint's copies
+    for attr, live_value in [("feasible_sampler", feasible_sampler), ("failure_registry", failure_registry), ("runtime_registry", runtime_registry)]:
+        if (getattr(optimizer, attr, None) is not None):
+            setattr(optimizer, attr, live_value)
+    num_resumed = len(optimizer.Xi)
+    new_x, new_y = list(x0[num_resumed:]), list(y0[num_resumed:])
+    if new_x:
+        optimizer.tell(new_x, new_y)
+    elif ((not checkpoint.isFitted()) and (len(optimizer.yi) >= optimizer.n_initial_points_)):
+        # fitted on its last point, told again
+        x_last, y_last = optimizer.Xi.pop(), optimizer.yi.pop()
+        optimizer.tell(x_last, y_last)
+    # the pending points evaluated meanwhile (e.g. journaled) are not evaluated again
+    new_keys = [get_point_key(xi) for xi in new_x]
+    pending_points = []
+    for xi in checkpoint.getPendingPoints():
+        if (get_point_key(xi) in new_keys):
+            new_keys.remove(get_point_key(xi))
+        else:
+            pending_points.append(xi)
+    logger.info("[checkpoint] Optimizer resumed from the checkpoint (points: " + str(num_resumed) + ", history points told since: " + str(len(new_x)) +
+                ", pending points: " + str(len(pending_points)) + ", initial points left: " + str(max(optimizer.n_initial_points_ - len(optimizer.yi), 0)) + ")")
+    return optimizer, pending_points
+
+# Tells the history (X0, Y0) to the optimizer, unless it was resumed from a checkpoint (it knows them already): the result
+def tell_history(optimizer, x0, y0, resumed):
+    if (not resumed):
+        return optimizer.tell(x0, y0)
+    return create_result(optimizer.Xi, optimizer.yi, optimizer.space, optimizer.rng, models=optimizer.models)
@@ -3,6 +3,13 @@ import os
 
 from logging_utils import init_logger
 
+# Optimization engines (surrogate model families) and GP engine surrogates, ref. engine_factory
+ENGINES = ["gp", "forest", "gbrt"]
+GP_SURROGATES = ["gp", "local_gp"]
+FOREST_BASE_ESTIMATORS = ["RF", "ET"]
+# Cost-aware acquisition functions (weighted by the expected simulation run time), ref. runtime_model.CostAwareOptimizer
+COST_AWARE_ACQ_FUNCS = ["EIps", "PIps"]
+
 class OptimizerConfig:
     def __init__(self):
         self._is_initialized = False
@@ -19,7 +26,38 @@ class OptimizerConfig:
             "xi": 0.01,
             "noise": "gaussian",
             "n_jobs": 1,
-            "model_queue_size": None
+            "model_queue_size": None,
+            "run_mode": "sequential",
+            "sim_slots": 1,
+            "initial_batch_size": 0,
+            "batch_strategy": "cl_min",
+            "mf_fidelity_levels": [10000, 100000],
+            "mf_eta": 3,
+            "mf_bracket_size": 9,
+            "mo_rho": 0.05,
+            "engine": "gp",
+            "surrogate": "gp",
+            "local_gp_partition_size": 200,
+            "forest_base_estimator": "ET",
+            "forest_n_estimators": 100,
+            "forest_min_samples_leaf": 3,
+            "gbrt_n_estimators": 30,
+            "turbo_regions": 1,
+            "turbo_length_init": 0.8,
+            "turbo_length_min": 0.0078125,
+            "turbo_length_max": 1.6,
+            "turbo_success_tol": 3,
+            "turbo_failure_tol": 0,
+            "bandit_exploration": 0.3,
+            "bandit_prior_strength": 2.0,
+            "bandit_arm_initial_points": 3,
+            "bandit_max_arms": 100000,
+            "feasible_sampling": False,
+            "feasibility_classifier": False,
+            "pre_screening": False,
+            "pre_screening_max_asks": 20,
+            "pipeline_refine": True,
+            "optimizer_checkpoint": False
         }
 
     def init(self, confFilePath: str):
@@ -59,12 +97,54 @@ class OptimizerConfig:
                     logger.warning(f"[optconf] Unrecognized parameter: {fpName}")
 
         self._is_initialized = True
+        self._validateEngineParams()
+        if ((self.getParam("feasible_sampling") or self.getParam("feasibility_classifier") or (self.getParam("acq_func") in COST_AWARE_ACQ_FUNCS)) and (self.getParam("engine") == "gp") and
+            (self.getParam("acq_optimizer") != "sampling")):
+            logger.warning(f"[optconf] Feasible region sampling / feasibility classifier / cost-aware acquisition: acquisition optimizer '{self.getParam('acq_optimizer')}' ignored, 'sampling' used instead")
+
+    def _isPositiveInt(self, paramName, minValue=1):
+        pValue = self.getParam(paramName)
+        return isinstance(pValue, int) and (not isinstance(pValue, bool)) and (pValue >= minValue)
+
+    # Engine specific parameters are validated upfront, not to find out about a bad one after the initial design
+    def _validateEngineParams(self):
+        logger = init_logger()
+        engine = self.getParam("engine")
+        if engine not in ENGINES:
+            raise ValueError(f"[optconf] ERROR. Unknown engine: {engine} (allowed: {ENGINES})")
+        if engine == "gp":
+            if self.getParam("surrogate") not in GP_SURROGATES:
+                raise ValueError(f"[optconf] ERROR. Unknown surrogate: {self.getParam('surrogate')} (allowed: {GP_SURROGATES})")
+            if not self._isPositiveInt("local_gp_partition_size", 2):
+                raise ValueError(f"[optconf] ERROR. 'local_gp_partition_size' must be an integer greater than 1, got: {self.getParam('local_gp_partition_size')}")
+            return
+
+        # tree ensembles
+        if self.getParam("surrogate") != "gp":
+            raise ValueError(f"[optconf] ERROR. Surrogate '{self.getParam('surrogate')}' is only supported by the 'gp' engine")
+        if self.getParam("acq_optimizer") != "sampling":
+            logger.warning(f"[optconf] Engine '{engine}' provides no gradients: acquisition optimizer '{self.getParam('acq_optimizer')}' ignored, 'sampling' used instead")
+        if engine == "forest":
+            if self.getParam("forest_base_estimator") not in FOREST_BASE_ESTIMATORS:
+                raise ValueError(f"[optconf] ERROR. Unknown forest base estimator: {self.getParam('forest_base_estimator')} (allowed: {FOREST_BASE_ESTIMATORS})")
+            for pName in ["forest_n_estimators", "forest_min_samples_leaf"]:
+                if not self._isPositiveInt(pName):
+                    raise ValueError(f"[optconf] ERROR. '{pName}' must be a positive integer, got: {self.getParam(pName)}")
+        elif engine == "gbrt":
+            if not self._isPositiveInt("gbrt_n_estimators"):
+                raise ValueError(f"[optconf] ERROR. 'gbrt_n_estimators' must be a positive integer, got: {self.getParam('gbrt_n_estimators')}")
 
     def toString(self):
         if not self._is_initialized:
             raise RuntimeError("[optconf] ERROR. Bad Sequence. 'toString' cannot be called before initialization")
         return json.dumps({n: f"{v} ({d})" for n, v, d in self._params}, indent=3)
 
+    # All the parameters (name -> value)
+    def getParams(self):
+        if not self._is_initialized:
+            raise RuntimeError("[optconf] ERROR. Bad Sequence. 'getParams' cannot be called before initialization")
+        return {n: v for n, v, _ in self._params}
+
     # Retrieve a parameter by name. Raises error if not found
     def getParam(self, paramName: str):
         if not self._is_initialized:
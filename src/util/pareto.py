@@ -0,0 +1,117 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from logging_utils import init_logger
+from pickling_utils import TransientStateMixin
+from sim_queue import write_json_atomic
+
+# -------------------------------------
+# Multi-objective: Pareto archive of the simulated shields
+# -------------------------------------
+# Objectives, with their sense: energy and protection efficiency are maximized, weight and thickness are minimized
+MO_OBJECTIVES = [("energy_efficiency", "max"), ("protection_efficiency", "max"), ("shield_weight", "min"), ("shield_thickness", "min")]
+
+# Objectives vector in minimization form (maximized objectives are negated)
+def to_min_vector(objectives):
+    return [(-objectives[name] if (sense == "max") else objectives[name]) for name, sense in MO_OBJECTIVES]
+
+def dominates(u, v):
+    return all(ui <= vi for ui, vi in zip(u, v)) and any(ui < vi for ui, vi in zip(u, v))
+
+# Indices of the non-dominated vectors (minimization)
+def get_non_dominated(vectors):
+    return [i for i, vi in enumerate(vectors) if not any(dominates(vj, vi) for j, vj in enumerate(vectors) if (j != i))]
+
+# JSON friendly (and hashable, as a string) representation of a point of the search space
+def get_point_key(x):
+    return json.dumps([(v.item() if hasattr(v, "item") else v) for v in x])
+
+class ParetoArchive(TransientStateMixin):
+    def __init__(self):
+        self._archive_file = None
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._is_initialized = False
+
+    # The archive is persisted (at each new entry), so it spans the whole campaign, across restarts
+    def init(self, archive_file):
+        logger = init_logger()
+        self._archive_file = archive_file
+        self._entries = {}
+        if os.path.isfile(archive_file):
+            with open(archive_file, "r") as f:
+                for entry in json.load(f):
+                    self._entries[get_point_key(entry["x"])] = entry
+        else:
+            archive_dir = os.path.dirname(archive_file)
+            if archive_dir:
+                os.makedirs(archive_dir, exist_ok=True)
+        self._is_initialized = True
+        logger.info("[pareto] Pareto archive ready (" + archive_file + ", entries: " + str(len(self._entries)) + ")")
+
+    def add(self, sim_id, x, layers_desc, objectives):
+        if (not self._is_initialized):
+            raise RuntimeError("[pareto] ERROR. Bad Sequence. 'add' cannot be called here, as the Pareto archive has not been initialized")
+        entry = {"sim_id": sim_id, "x": json.loads(get_point_key(x)), "layers": layers_desc, "objectives": dict(objectives)}
+        with self._lock:
+            self._entries[get_point_key(x)] = entry
+            write_json_atomic(self._archive_file, list(self._entries.values()))
+
+    # Objectives (dictionary) of the given point, or None if it was never simulated successfully
+    def getObjectives(self, x):
+        with self._lock:
+            entry = self._entries.get(get_point_key(x))
+        return dict(entry["objectives"]) if (entry is not None) else None
+
+    def getSize(self):
+        with self._lock:
+            return len(self._entries)
+
+    # Non-dominated entries, sorted by energy efficiency
+    def getFront(self):
+        with self._lock:
+            entries = list(self._entries.values())
+        front = [entries[i] for i in get_non_dominated([to_min_vector(e["objectives"]) for e in entries])]
+        return sorted(front, key=lambda e: -e["objectives"]["energy_efficiency"])
+
+    def logFront(self, front_file=None):
+        logger = init_logger()
+        front = self.getFront()
+        logger.info("[opttrace][pareto] Non-dominated front (shields: " + str(len(front)) + " out of " + str(self.getSize()) + " simulated):")
+        for entry in front:
+            objs_desc = ", ".join(f"{name}={entry['objectives'][name]:.6g}" for name, _ in MO_OBJECTIVES)
+            logger.info("[opttrace][pareto]   [" + entry["sim_id"] + "] " + objs_desc + " - layers: [" + entry["layers"] + "]")
+        if front_file:
+            write_json_atomic(front_file, front)
+            logger.info("[pareto] Non-dominated front saved (" + front_file + ")")
+
+# -------------------------------------
+# ParEGO scalarization
+# -------------------------------------
+# Augmented Chebyshev scalarization of the objectives (normalized to [0, 1] on the archive's ideal and nadir points),
+# with weights drawn at random on the simplex upon each round: minimizing it for different weights covers the front.
+class ParEGOScalarizer:
+    def __init__(self, rho):
+        self._rho = rho
+        self._ideal = None
+        self._span = None
+        self._weights = None
+
+    def update(self, min_vectors, rng):
+        vecs = np.array(min_vectors, dtype=float)
+        self._ideal = vecs.min(axis=0)
+        span = vecs.max(axis=0) - self._ideal
+        self._span = np.where(span > 0.0, span, 1.0)
+        self._weights = rng.dirichlet(np.ones(len(MO_OBJECTIVES)))
+        return self._weights
+
+    def scalarize(self, min_vector):
+        f = (np.array(min_vector, dtype=float) - self._ideal) / self._span
+        return float(np.max(self._weights * f) + self._rho * np.sum(self._weights * f))
+
+    # value for failed or penalized shields: the worst possible scalarized value
+    def getWorstValue(self):
+        return 1.0 + self._rho
@@ -0,0 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from sklearn.utils import check_random_state
+from skopt.utils import create_result, normalize_dimensions
+
+from logging_utils import init_logger
+from engine_factory import create_optimizer, uses_feasibility_classifier
+from batch_driver import evaluate_points, SIM_SLOT_THREAD_PFIX
+from pareto import ParEGOScalarizer, to_min_vector
+
+# -------------------------------------
+# Multi-objective (ParEGO) optimization loop
+# -------------------------------------
+# Upon each round, the objectives of all the shields simulated so far (ref. ParetoArchive) are scalarized with new random
+# weights (ParEGO), a fresh ask/tell optimizer is fitted on them and 'sim_slots' new points are asked (constant liar).
+# The result handed to the post-simulation logic (hence the history) keeps the usual objective function values, so the
+# history stays compatible with the other run modes; the multi-objective outcome is the non-dominated front of the archive.
+
+def run_pareto_optimization(objective_fn, search_space, x0, y0, max_runs, optimizerConf, post_callback, paretoArchive, pn_value, feasibleSampler=None, failureRegistry=None, runtimeRegistry=None):
+    logger = init_logger()
+    sim_slots = optimizerConf.getParam("sim_slots")
+    strategy = optimizerConf.getParam("batch_strategy")
+    rho = optimizerConf.getParam("mo_rho")
+    if ((not isinstance(sim_slots, int)) or (sim_slots < 1)):
+        raise ValueError("[pareto] ERROR. 'sim_slots' must be a positive integer, got: " + str(sim_slots))
+    if (paretoArchive is None):
+        raise ValueError("[pareto] ERROR. The pareto run mode requires the Pareto archive ('pareto_archive_file')")
+
+    rng = check_random_state(optimizerConf.getParam("random_state"))
+    space = normalize_dimensions(search_space)
+    scalarizer = ParEGOScalarizer(rho)
+    specs = {"args": {"max_runs": max_runs, "sim_slots": sim_slots, "batch_strategy": strategy, "mo_rho": rho}, "function": "run_pareto_optimization"}
+    logger.info("[pareto] Multi-objective (ParEGO) optimization loop (simulator slots: " + str(sim_slots) + ", rho: " + str(rho) + ")")
+
+    x_iters = []
+    func_vals = []
+    result = None
+    remaining_runs = max_runs
+    x0 = x0 or []
+    with ThreadPoolExecutor(max_workers=sim_slots, thread_name_prefix=SIM_SLOT_THREAD_PFIX) as executor:
+        # Same semantics as gp_minimize: X0 without Y0 gets evaluated (and counted as runs), X0 with Y0 is just taken as is
+        if (x0 and (y0 is None)):
+            logger.info("[opttrace][pareto] Evaluating X0 points (" + str(len(x0)) + ")")
+            y0 = evaluate_points(executor, objective_fn, x0)
+            remaining_runs = remaining_runs - len(x0)
+        if x0:
+            x_iters, func_vals = list(x0), list(y0)
+            not_archived = sum(1 for xi, yi in zip(x_iters, func_vals) if ((yi < pn_value) and (paretoArchive.getObjectives(xi) is None)))
+            if (not_archived > 0):
+                logger.warning("[pareto] " + str(not_archived) + " history points have no objectives in the Pareto archive, they will not be used by the surrogate")
+            result = create_result(x_iters, func_vals, space, rng, specs)
+            if post_callback(result):
+                return result
+
+        round_nbr = 0
+        while (remaining_runs > 0):
+            round_nbr = round_nbr + 1
+            # ParEGO: new scalarization weights, fresh surrogate fitted on the scalarized archive
+            fit_x, fit_vectors, failed_x = [], [], []
+            for xi, yi in zip(x_iters, func_vals):
+                objectives = paretoArchive.getObjectives(xi)
+                if (objectives is not None):
+                    fit_x.append(xi)
+                    fit_vectors.append(to_min_vector(objectives))
+                elif (yi >= pn_value):
+                    failed_x.append(xi)
+            optimizer = create_optimizer(search_space, optimizerConf, 0, rng.randint(0, np.iinfo(np.int32).max), feasible_sampler=feasibleSampler, failure_registry=failureRegistry, runtime_registry=runtimeRegistry)
+            if fit_vectors:
+                weights = scalarizer.update(fit_vectors, rng)
+                logger.info("[opttrace][pareto] Round " + str(round_nbr) + ": scalarization weights " + str(np.round(weights, 3).tolist()) + " (EE, PE, weight, thickness)")
+                # the failed shields get the worst scalarized value, unless they are kept out of the surrogate (feasibility classifier)
+                fail_y = pn_value if uses_feasibility_classifier(optimizerConf, failureRegistry) else scalarizer.getWorstValue()
+                fit_y = [scalarizer.scalarize(v) for v in fit_vectors] + [fail_y] * len(failed_x)
+                optimizer.tell(fit_x + failed_x, fit_y)
+
+            batch_sz = min(sim_slots, remaining_runs)
+            x_batch = optimizer.ask(n_points=batch_sz, strategy=strategy)
+            logger.info("[opttrace][pareto] Round " + str(round_nbr) + ": dispatching " + str(batch_sz) + " points to the simulator slots")
+            y_batch = evaluate_points(executor, objective_fn, x_batch)
+            x_iters = x_iters + list(x_batch)
+            func_vals = func_vals + list(y_batch)
+            remaining_runs = remaining_runs - batch_sz
+
+            result = create_result(x_iters, func_vals, space, rng, specs)
+            if post_callback(result):
+                break
+
+    return result
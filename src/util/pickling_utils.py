@@ -0,0 +1,25 @@
+import threading
+
+# -------------------------------------
+# Pickling of the objects held by the objective function
+# -------------------------------------
+# gp_minimize keeps its arguments (hence the objective function, and whatever it holds: results cache, simulation backend,
+# registries, journal, ...) in the result, which is pickled into the history. Locks, conditions and the like cannot be pickled:
+# they are left out of the pickled state, and created anew upon unpickling.
+class TransientStateMixin:
+    # attributes left out of the pickled state (by default, the lock of the object)
+    _TRANSIENT_ATTRS = ("_lock",)
+
+    # to be overridden along with '_TRANSIENT_ATTRS': creates the attributes left out of the pickled state
+    def _createTransientState(self):
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for attr in self._TRANSIENT_ATTRS:
+            state.pop(attr, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._createTransientState()
@@ -0,0 +1,102 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from logging_utils import init_logger
+from engine_factory import create_optimizer, ask_conditioned, get_initial_points_left
+from batch_driver import SIM_SLOT_THREAD_PFIX
+from async_driver import timed_objective
+from optimizer_checkpoint import resume_optimizer, tell_history, attach_checkpoint
+
+# -------------------------------------
+# Pipelined (sequential, speculative acquisition) optimization loop
+# -------------------------------------
+# One simulation at a time, as the sequential run mode, but the surrogate fit and the acquisition optimization of the next point
+# run while the current simulation is in flight, instead of between two simulations: the next point is asked conditioned on the
+# pending one (constant liar, ref. 'batch_strategy'), i.e. speculatively. When the real result arrives, it is told without refitting
+# (the next speculative ask fits on it), and the speculative point is simulated next. If the real result is a new incumbent (the
+# outcome the lie is most likely wrong about) and 'pipeline_refine' is enabled, the speculative point is discarded, and the next
+# point asked again on the real result (that fit is not overlapped). Per iteration wall-clock: about max(simulation, fit + acquisition).
+# With a checkpoint ('checkpoint', ref. OptimizerCheckpoint), the optimizer is resumed from it, and its next point (if any) simulated first.
+
+# Asks the next point, conditioned on the 'pending_points' (if any), screened if the pre-simulation screening is enabled
+def ask_next(optimizer, pending_points, strategy, preScreener):
+    if (preScreener is None):
+        return ask_conditioned(optimizer, pending_points, strategy)
+    # with pending points the conditioned ask fits its own copy of the optimizer (no refit needed upon rejections)
+    return preScreener.askScreened(optimizer, partial(ask_conditioned, optimizer, pending_points, strategy), fit=(not pending_points))
+
+def run_pipelined_optimization(objective_fn, search_space, x0, y0, max_runs, optimizerConf, post_callback, feasibleSampler=None, failureRegistry=None, preScreener=None, runtimeRegistry=None, checkpoint=None):
+    logger = init_logger()
+    strategy = optimizerConf.getParam("batch_strategy")
+    refine = optimizerConf.getParam("pipeline_refine")
+
+    x0 = x0 or []
+    optimizer, pending_points = resume_optimizer(checkpoint, search_space, optimizerConf, x0, y0, feasibleSampler, failureRegistry, runtimeRegistry)
+    resumed = (optimizer is not None)
+    if (not resumed):
+        optimizer = create_optimizer(search_space, optimizerConf, len(x0), feasible_sampler=feasibleSampler, failure_registry=failureRegistry, runtime_registry=runtimeRegistry)
+    specs = {"args": {"max_runs": max_runs, "batch_strategy": strategy, "pipeline_refine": refine}, "function": "run_pipelined_optimization"}
+    logger.info("[pipeline] Pipelined optimization loop (strategy: " + strategy + ", refine on new incumbent: " + str(refine) + ")")
+
+    result = None
+    # Same semantics as gp_minimize: X0 without Y0 gets evaluated (and counted as runs), X0 with Y0 is just told
+    preset_points = list(pending_points)
+    if (x0 and (y0 is None)):
+        preset_points = list(x0)
+    elif x0:
+        result = tell_history(optimizer, x0, y0, resumed)
+        result.specs = specs
+        attach_checkpoint(result, optimizer, optimizerConf, preset_points)
+        if post_callback(result):
+            return result
+
+    if (max_runs < 1):
+        return result
+    next_x = preset_points.pop(0) if preset_points else ask_next(optimizer, [], strategy, preScreener)
+    submitted = 0
+    num_refined = 0
+    tot_sim_secs, tot_acq_secs = 0.0, 0.0
+    t_loop = time.monotonic()
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix=SIM_SLOT_THREAD_PFIX) as executor:
+        while (next_x is not None):
+            t_iter = time.monotonic()
+            x = next_x
+            future = executor.submit(timed_objective, objective_fn, x)
+            submitted = submitted + 1
+
+            # speculative proposal of the next point, while the simulation runs
+            next_x = None
+            speculative = False
+            acq_secs = 0.0
+            if (submitted < max_runs):
+                if preset_points:
+                    next_x = preset_points.pop(0)
+                else:
+                    t_acq = time.monotonic()
+                    next_x = ask_next(optimizer, [x], strategy, preScreener)
+                    speculative = True
+                    acq_secs = time.monotonic() - t_acq
+
+            y, _, sim_secs = future.result()
+            is_incumbent = ((not optimizer.yi) or (y < min(optimizer.yi)))
+            refit = (refine and is_incumbent and speculative and (get_initial_points_left(optimizer) <= 1))
+            result = optimizer.tell(x, y, fit=refit)
+            result.specs = specs
+            refine_secs = 0.0
+            if refit:
+                t_acq = time.monotonic()
+                next_x = ask_next(optimizer, [], strategy, preScreener)
+                refine_secs = time.monotonic() - t_acq
+                num_refined = num_refined + 1
+            attach_checkpoint(result, optimizer, optimizerConf, ([next_x] if (next_x is not None) else []) + preset_points, fitted=refit)
+            tot_sim_secs, tot_acq_secs = tot_sim_secs + sim_secs, tot_acq_secs + acq_secs + refine_secs
+            logger.info(f"[opttrace][pipeline] Iteration {submitted}: simulation {sim_secs:.1f}s, speculative acquisition {acq_secs:.1f}s (overlapped)" +
+                        (f", refined on new incumbent {refine_secs:.1f}s" if refit else "") + f", wall-clock {time.monotonic() - t_iter:.1f}s")
+            if post_callback(result):
+                break
+
+    elapsed = time.monotonic() - t_loop
+    logger.info(f"[opttrace][pipeline] Pipelined loop: {submitted} iterations, simulations {tot_sim_secs:.1f}s, acquisitions {tot_acq_secs:.1f}s, wall-clock {elapsed:.1f}s " +
+                f"(sequential estimate: {tot_sim_secs + tot_acq_secs:.1f}s), refined proposals: {num_refined}")
+    return result
@@ -0,0 +1,129 @@
+from css_shield import CssShield
+from logging_utils import init_logger
+from constraint_utils import check_constraints_pre
+from feasibility_classifier import FAILURE_PRE_CHECK
+from engine_factory import get_initial_points_left
+
+#points asked at once upon each round of re-asks of a single point (the rejected points of a round are told together, with no refit)
+PRE_SCREENING_REASK_POINTS = 4
+
+# -------------------------------------
+# Pre-simulation screening of the proposed points
+# -------------------------------------
+# A point failing the pre-simulation constraints check is penalized by the objective function without being simulated, still
+# counting as one of the 'max_runs'. The screener builds each proposed point's shield as the objective function does (search space
+# builder, repair functions included) and checks it upfront: a rejected point is told to the optimizer with the penalization value
+# (so that the surrogate learns about the infeasible region) and the optimizer is asked again, at most 'pre_screening_max_asks' times
+# per point. The rejected points are told together, with no refit: the next points are asked in small batches (constant liar), so
+# that the surrogate is refitted once per round of re-asks, not once per rejected point. Rejected points do not consume runs, so 'max_runs' counts the actual simulations.
+# During the initial design a rejected point is not told (it would take the place of one of the initial points, with no surrogate to learn
+# from it yet): it is replaced by a random point drawn from the search space instead (the initial point generator, e.g. 'lhs', would
+# propose the same point again).
+class PreScreener:
+    def __init__(self):
+        self._search_sp_bldr = None
+        self._materials_set = None
+        self._constr_par = None
+        self._cf_factor = None
+        self._pn_value = None
+        self._max_asks = None
+        self._failure_registry = None
+        self._num_checked = 0
+        self._num_rejected = 0
+        self._num_exhausted = 0
+        self._is_initialized = False
+
+    # 'failureRegistry' (FailureRegistry, optional): records the rejected points as pre-simulation check failures
+    def init(self, paramsHolder, searchSpBuilder, materialsSet, constrPar, maxAsks, failureRegistry=None):
+        logger = init_logger()
+        if ((not isinstance(maxAsks, int)) or isinstance(maxAsks, bool) or (maxAsks < 1)):
+            raise ValueError("[prescreen] ERROR. 'pre_screening_max_asks' must be a positive integer, got: " + str(maxAsks))
+        self._search_sp_bldr = searchSpBuilder
+        self._materials_set = materialsSet
+        self._constr_par = constrPar
+        self._cf_factor = paramsHolder.get("stiffness_cf_factor")
+        self._pn_value = paramsHolder.get("penalization_value")
+        self._max_asks = maxAsks
+        self._failure_registry = failureRegistry
+        self._is_initialized = True
+        logger.info("[prescreen] Pre-simulation screening ready (max. asks per point: " + str(self._max_asks) + ")")
+
+    # Same shield building and pre-simulation constraints check as the objective function
+    def isFeasible(self, x):
+        if (not self._is_initialized):
+            raise RuntimeError("[prescreen] ERROR. Bad Sequence. 'isFeasible' cannot be called here, as the pre-simulation screener has not been initialized")
+        layers_data, _ = self._search_sp_bldr.getLayersData(x)
+        cShield = CssShield()
+        cShield.init(layers_data, self._materials_set, self._cf_factor)
+        self._num_checked = self._num_checked + 1
+        return check_constraints_pre(cShield, self._constr_par.getPRE())
+
+    # 'tell': whether the rejected points are told to the optimizer (not during the initial design)
+    def _reject(self, optimizer, points, fit, tell=True):
+        self._num_rejected = self._num_rejected + len(points)
+        if (not tell):
+            return
+        if (self._failure_registry is not None):
+            for xi in points:
+                self._failure_registry.record(xi, FAILURE_PRE_CHECK)
+        optimizer.tell(list(points), [self._pn_value] * len(points), fit=fit)
+
+    # Asks ONE point ('ask_fn', e.g. a conditioned ask, also asking a batch of points if given 'n_points', ref. Optimizer.ask) passing
+    # the pre-simulation check. The first point is asked alone; upon rejection, the rejected points are told together (no refit) and
+    # PRE_SCREENING_REASK_POINTS points are asked at once and screened, and so on. 'fit': whether the optimizer's next point is updated
+    # on the rejected ones before returning (not needed if 'ask_fn' fits its own copy of the optimizer). If no point passes the check
+    # within the limit, the last one is returned anyway (it will be penalized by the objective function, consuming a run).
+    def askScreened(self, optimizer, ask_fn, fit=True):
+        in_design = (get_initial_points_left(optimizer) > 0)
+        x_batch = [ask_fn()]
+        num_asks = 0
+        while True:
+            x_found = None
+            rejected = []
+            for x in x_batch:
+                num_asks = num_asks + 1
+                if self.isFeasible(x):
+                    x_found = x
+                    break
+                rejected.append(x)
+            if ((x_found is not None) or (num_asks >= self._max_asks)):
+                break
+            self._reject(optimizer, rejected, False, tell=(not in_design))
+            n_points = min(PRE_SCREENING_REASK_POINTS, self._max_asks - num_asks)
+            x_batch = ask_fn(n_points=n_points) if (not in_design) else optimizer.space.rvs(n_samples=n_points, random_state=optimizer.rng)
+
+        if (x_found is None):
+            x_found = rejected.pop()
+            self._num_exhausted = self._num_exhausted + 1
+            init_logger().warning("[prescreen] No point passing the pre-simulation check within " + str(self._max_asks) + " asks, the last one is evaluated anyway")
+        if rejected:
+            self._reject(optimizer, rejected, False, tell=(not in_design))
+        if (fit and (num_asks > 1) and (not in_design)):
+            optimizer.update_next()
+        return x_found
+
+    # Asks 'n_points' points (batch, ref. Optimizer.ask) passing the pre-simulation check: the rejected ones are told all together
+    # (one refit), and as many points are asked again (drawn at random during the initial design), at most 'pre_screening_max_asks' times
+    def askBatchScreened(self, optimizer, n_points, strategy):
+        in_design = (get_initial_points_left(optimizer) > 0)
+        accepted = []
+        for num_asks in range(self._max_asks):
+            if ((num_asks == 0) or (not in_design)):
+                x_batch = optimizer.ask(n_points=n_points - len(accepted), strategy=strategy)
+            else:
+                x_batch = optimizer.space.rvs(n_samples=n_points - len(accepted), random_state=optimizer.rng)
+            rejected = [xi for xi in x_batch if (not self.isFeasible(xi))]
+            accepted = accepted + [xi for xi in x_batch if (xi not in rejected)]
+            if (not rejected):
+                return accepted
+            if (num_asks == self._max_asks - 1):
+                self._num_exhausted = self._num_exhausted + 1
+                init_logger().warning("[prescreen] " + str(len(rejected)) + " points not passing the pre-simulation check within " + str(self._max_asks) + " asks, they are evaluated anyway")
+                return accepted + rejected
+            self._reject(optimizer, rejected, True, tell=(not in_design))
+        return accepted
+
+    def logStats(self):
+        logger = init_logger()
+        logger.info("[opttrace][prescreen] Proposed points checked: " + str(self._num_checked) + ", rejected (not simulated, no run consumed): " + str(self._num_rejected) +
+                    ", asks limit reached: " + str(self._num_exhausted))
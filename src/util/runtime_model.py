@@ -0,0 +1,101 @@
+import math
+import threading
+
+import numpy as np
+from skopt.learning import ExtraTreesRegressor
+
+from logging_utils import init_logger
+from pickling_utils import TransientStateMixin
+from pareto import get_point_key
+from feasibility_classifier import FeasibilityAwareOptimizer
+
+# Cost-aware acquisition functions ('acq_func'), and the acquisition function each one weights by the expected run time
+COST_AWARE_ACQ_FUNCS = {"EIps": "EI", "PIps": "PI"}
+
+#run times are floored to this value (e.g. dummy simulations), their logarithm being modelled
+RUNTIME_MIN_SECS = 1e-3
+
+#run time model: extremely randomized trees (cheap to fit, with a std. estimate, cope with the integer dimensions)
+RUNTIME_MODEL_N_ESTIMATORS = 100
+RUNTIME_MODEL_MIN_SAMPLES_LEAF = 2
+
+# -------------------------------------
+# Simulation run times: registry and run time model
+# -------------------------------------
+
+# Wall-clock time of each simulation (point), to be saved in the history along with the points
+class RuntimeRegistry(TransientStateMixin):
+    def __init__(self):
+        self._times = {}
+        self._num_timed = 0
+        self._tot_secs = 0.0
+        self._max_secs = 0.0
+        self._lock = threading.Lock()
+        self._is_initialized = False
+
+    # 'x0', 'times0': history points and their simulation run times, as saved in the history (None for the points which were
+    # not simulated; None at all if not saved)
+    def init(self, x0=None, times0=None):
+        logger = init_logger()
+        for xi, ti in zip(x0 or [], times0 or []):
+            if (ti is not None):
+                self._times[get_point_key(xi)] = ti
+        self._is_initialized = True
+        logger.info("[runtime] Run time registry ready (run times from history: " + str(len(self._times)) + ")")
+
+    def record(self, x, secs):
+        if (not self._is_initialized):
+            raise RuntimeError("[runtime] ERROR. Bad Sequence. 'record' cannot be called here, as the run time registry has not been initialized")
+        with self._lock:
+            self._times[get_point_key(x)] = secs
+            self._num_timed = self._num_timed + 1
+            self._tot_secs = self._tot_secs + secs
+            self._max_secs = max(self._max_secs, secs)
+
+    # Run time of each point (None for the points which were not simulated), e.g. for the history
+    def getTimes(self, x_iters):
+        with self._lock:
+            return [self._times.get(get_point_key(xi)) for xi in x_iters]
+
+    def logStats(self):
+        logger = init_logger()
+        with self._lock:
+            mean_secs = (self._tot_secs / self._num_timed) if self._num_timed else 0.0
+            logger.info(f"[opttrace][runtime] Simulations timed in this run: {self._num_timed}, run time: mean {mean_secs:.1f}s, max. {self._max_secs:.1f}s, total {self._tot_secs:.1f}s")
+
+# Regressor of the logarithm of the run time, on the transformed points. None if there are not enough points to learn from
+def fit_runtime_model(Xt, log_times, random_state):
+    if (len(log_times) < 2):
+        return None
+    model = ExtraTreesRegressor(n_estimators=RUNTIME_MODEL_N_ESTIMATORS, min_samples_leaf=RUNTIME_MODEL_MIN_SAMPLES_LEAF, random_state=random_state)
+    return model.fit(Xt, log_times)
+
+# skopt ask/tell Optimizer maximizing the improvement per simulator second (cost-aware acquisition functions, ref. COST_AWARE_ACQ_FUNCS):
+# the acquisition function (EI or PI, negative) of each candidate is weighted by its expected inverse run time, as skopt's EIps/PIps do,
+# exp(-mu + std^2 / 2), mu and std being predicted by a run time model fitted on the log of the run times recorded so far (ref. RuntimeRegistry).
+# The objective function still returns the objective value only (unlike skopt's EIps/PIps, which expect (value, time) pairs), so the run modes
+# and the history are not affected. It is optimized by sampling, and it can be combined with the feasibility classifier ('failure_registry').
+class CostAwareOptimizer(FeasibilityAwareOptimizer):
+    def __init__(self, *args, runtime_registry=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.runtime_registry = runtime_registry
+
+    def _getCopyKwargs(self):
+        copy_kwargs = super()._getCopyKwargs()
+        copy_kwargs["runtime_registry"] = self.runtime_registry
+        return copy_kwargs
+
+    def _getCandidateWeights(self, X, Xt, feasible):
+        logger = init_logger()
+        weights = super()._getCandidateWeights(X, Xt, feasible)
+        # points with no run time (e.g. not simulated, or constant liar ones) are left out of the run time model
+        times = self.runtime_registry.getTimes(self.Xi) if (self.runtime_registry is not None) else [None] * len(self.Xi)
+        timed = [i for i, ti in enumerate(times) if (ti is not None)]
+        model = fit_runtime_model(Xt[timed], [math.log(max(times[i], RUNTIME_MIN_SECS)) for i in timed], self.rng.randint(0, np.iinfo(np.int32).max))
+        if (model is None):
+            logger.info("[opttrace][runtime] Simulations timed: " + str(len(timed)) + " (of " + str(len(self.Xi)) + "), acquisition not weighted by the run time yet")
+            return weights
+        mu, std = model.predict(X, return_std=True)
+        inv_t = np.exp(-mu + 0.5 * std ** 2)
+        logger.info(f"[opttrace][runtime] Run time model fitted on {len(timed)} simulations, expected run time over the candidates: min. {np.min(1.0 / inv_t):.1f}s, max. {np.max(1.0 / inv_t):.1f}s")
+        return weights * inv_t
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from logging_utils import init_logger
+from pickling_utils import TransientStateMixin
+
+#thicknesses are rounded to this many decimals (mm) when building the canonical shield
+CACHE_THICKNESS_DECIMALS = 6
+
+# -------------------------------------
+# Persistent, content-addressed simulation results cache
+# -------------------------------------
+
+# Canonical key of a simulation: hash of the shield as the simulator sees it (consecutive layers of the same material merged),
+# plus the geometry template and the layers common configuration. 'extra_key_data' allows to add other simulation inputs.
+def build_cache_key(shield, conf_template_data, comm_layer_data, extra_key_data=None):
+    canonical_layers = [[material, f"{thickness:.{CACHE_THICKNESS_DECIMALS}f}"] for material, thickness in shield.getMergedLayers()]
+    key_data = {"layers": canonical_layers, "geometry_template": conf_template_data, "layer_conf": comm_layer_data, "extra": extra_key_data}
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode("utf-8")).hexdigest()
+
+class SimResultCache(TransientStateMixin):
+    def __init__(self):
+        self._db_path = None
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._lock = threading.Lock()
+        self._is_initialized = False
+
+    def init(self, db_path):
+        logger = init_logger()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._db_path = db_path
+        with closing(self._connect()) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS sim_results (cache_key TEXT PRIMARY KEY, sim_id TEXT, layers TEXT, kpis TEXT, created_at REAL, sim_secs REAL)")
+            # caches created before the run times were stored
+            if ("sim_secs" not in [row[1] for row in conn.execute("PRAGMA table_info(sim_results)")]):
+                conn.execute("ALTER TABLE sim_results ADD COLUMN sim_secs REAL")
+            num_entries = conn.execute("SELECT COUNT(*) FROM sim_results").fetchone()[0]
+        self._is_initialized = True
+        logger.info("[cache] Simulation results cache ready (" + db_path + ", entries: " + str(num_entries) + ")")
+
+    # one connection per operation, as the cache is used by many simulator slots (threads) at once
+    def _connect(self):
+        return sqlite3.connect(self._db_path, timeout=30)
+
+    # Returns (sim_id, kpis_dict, sim_secs) of a previous simulation of the same shield (its run time None if not stored), or None
+    def lookup(self, cache_key):
+        if (not self._is_initialized):
+            raise RuntimeError("[cache] ERROR. Bad Sequence. 'lookup' cannot be called here, as the cache has not been initialized")
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT sim_id, kpis, sim_secs FROM sim_results WHERE cache_key = ?", (cache_key,)).fetchone()
+        with self._lock:
+            if (row is None):
+                self._misses = self._misses + 1
+                return None
+            self._hits = self._hits + 1
+        return row[0], json.loads(row[1]), row[2]
+
+    # 'sim_secs': run time of the simulation (optional), returned upon the hits along with the KPIs
+    def store(self, cache_key, sim_id, shield, kpis_dict, sim_secs=None):
+        if (not self._is_initialized):
+            raise RuntimeError("[cache] ERROR. Bad Sequence. 'store' cannot be called here, as the cache has not been initialized")
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR IGNORE INTO sim_results (cache_key, sim_id, layers, kpis, created_at, sim_secs) VALUES (?, ?, ?, ?, ?, ?)",
+                         (cache_key, sim_id, json.dumps(shield.getMergedLayers()), json.dumps(kpis_dict), time.time(), sim_secs))
+        with self._lock:
+            self._stores = self._stores + 1
+
+    def logStats(self):
+        logger = init_logger()
+        with self._lock:
+            hits, misses, stores = self._hits, self._misses, self._stores
+        lookups = hits + misses
+        hit_ratio = (100.0 * hits / lookups) if (lookups > 0) else 0.0
+        logger.info(f"[opttrace][cache] Simulation results cache - lookups: {lookups}, hits: {hits}, misses: {misses} (hit ratio: {hit_ratio:.1f}%), new entries: {stores}")
@@ -0,0 +1,103 @@
+import os
+import subprocess
+import threading
+import time
+
+from logging_utils import init_logger
+from pickling_utils import TransientStateMixin
+from css_metadata import build_manifest_path, create_kpi_filepath
+
+# -------------------------------------
+# Multi-geometry manifests: many simulations per simulator invocation
+# -------------------------------------
+# Simulations requested concurrently (e.g. the simulator slots of the batch run mode) are gathered into a single manifest,
+# one "<run ID> <geometry configuration file> [<fidelity>]" line per shield, and the simulation script is invoked ONCE for all of them:
+#   <simulation script> --manifest <manifest path>
+# It has to produce the usual glob_kpis_<id>.csv file for each entry: entries without it are regarded as failed simulations.
+MANIFEST_SCRIPT_FLAG = "--manifest"
+MANIFEST_FIELD_DELIM = " "
+
+class SimManifestBatcher(TransientStateMixin):
+    # the jobs pending (with their events) are not pickled either
+    _TRANSIENT_ATTRS = ("_cond", "_pending")
+
+    def __init__(self):
+        self._sim_script = None
+        self._max_size = None
+        self._gather_secs = None
+        self._pending = []
+        self._last_add = 0.0
+        self._cond = threading.Condition()
+        self._is_initialized = False
+
+    # 'simSlots' (optional): maximum number of simulations in flight at once (e.g. 1 in the sequential run mode)
+    def init(self, paramsHolder, simSlots=None):
+        logger = init_logger()
+        self._sim_script = paramsHolder.get("simulation_script")
+        self._max_size = paramsHolder.get("manifest_max_size", 50)
+        self._gather_secs = paramsHolder.get("manifest_gather_secs", 2.0)
+        if ((not isinstance(self._max_size, int)) or (self._max_size < 1)):
+            raise ValueError("[manifest] ERROR. 'manifest_max_size' must be a positive integer, got: " + str(self._max_size))
+        if ((simSlots is not None) and (simSlots <= 1)):
+            # no other simulation can join the manifest: no point in waiting for it
+            self._gather_secs = 0.0
+        self._is_initialized = True
+        logger.info("[manifest] Manifest simulation backend ready (script: " + self._sim_script + ", max. entries per manifest: " + str(self._max_size) + ", gathering time: " + str(self._gather_secs) + "s)")
+
+    def _createTransientState(self):
+        self._cond = threading.Condition()
+        self._pending = []
+
+    def getDesc(self):
+        return "manifest"
+
+    # Blocks until the simulation has been run as part of a manifest, and its KPIs file is available in the output directory.
+    # The first caller of a new manifest leads it: it waits for other simulations to join (until the manifest is full, or no
+    # new simulation arrived within the gathering time), then invokes the simulator on behalf of all of them.
+    def runJob(self, sim_id, geom_path, out_data_dir, fidelity=None):
+        if (not self._is_initialized):
+            raise RuntimeError("[manifest] ERROR. Bad Sequence. 'runJob' cannot be called here, as the manifest backend has not been initialized")
+        job = {"sim_id": sim_id, "geometry_path": geom_path, "fidelity": fidelity, "done": threading.Event(), "error": None}
+        batch = None
+        with self._cond:
+            self._pending.append(job)
+            self._last_add = time.time()
+            is_leader = (len(self._pending) == 1)
+            self._cond.notify_all()
+            if is_leader:
+                while (len(self._pending) < self._max_size):
+                    idle_secs = time.time() - self._last_add
+                    if (idle_secs >= self._gather_secs):
+                        break
+                    self._cond.wait(self._gather_secs - idle_secs)
+                batch, self._pending = self._pending, []
+
+        if (batch is not None):
+            self._runManifest(batch, os.path.dirname(geom_path), out_data_dir)
+        job["done"].wait()
+        if (job["error"] is not None):
+            raise RuntimeError("[manifest][" + sim_id + "] " + job["error"])
+
+    def _runManifest(self, batch, conf_dir, out_data_dir):
+        logger = init_logger()
+        try:
+            manifest_path = os.path.abspath(build_manifest_path(conf_dir, batch[0]["sim_id"]))
+            with open(manifest_path, "w") as f:
+                for job in batch:
+                    entry = [job["sim_id"], os.path.abspath(job["geometry_path"])] + ([str(job["fidelity"])] if (job["fidelity"] is not None) else [])
+                    f.write(MANIFEST_FIELD_DELIM.join(entry) + "\n")
+            logger.info("[manifest] Calling simulation {script: " + self._sim_script + ", manifest: " + manifest_path + ", entries: " + str(len(batch)) + "} ..")
+            start_time = time.time()
+            proc = subprocess.run([self._sim_script, MANIFEST_SCRIPT_FLAG, manifest_path])
+            logger.info(f"[opttrace][manifest] Manifest of {len(batch)} simulations processed in {time.time() - start_time:.1f}s (exit code: {proc.returncode})")
+            # each entry is assessed on its own results, a failure of some simulations does not invalidate the others
+            for job in batch:
+                kpi_path, _ = create_kpi_filepath(out_data_dir, job["sim_id"])
+                if (not os.path.isfile(kpi_path)):
+                    job["error"] = "Simulation results not found after manifest processing (missing: " + kpi_path + ", exit code: " + str(proc.returncode) + ")"
+        except Exception as e:
+            for job in batch:
+                job["error"] = f"Manifest processing failed: {e}"
+        finally:
+            for job in batch:
+                job["done"].set()
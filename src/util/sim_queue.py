@@ -0,0 +1,243 @@
+import json
+import os
+import socket
+import time
+import uuid
+
+from logging_utils import init_logger
+from css_metadata import create_kpi_filepath
+
+# Shared-directory simulation job queue, used to dispatch simulations to worker daemons running on other nodes
+# (ref. src/sim_worker.py). The queue directory has to be visible by the optimizer and by all the workers (e.g. NFS).
+# Each attempt of a job (the first submission, and each resubmission after a lost lease) has its own lease token, so that the
+# files of an attempt are never mistaken for the ones of another attempt of the same simulation:
+#   pending/<sim_id>.<token>.json  -> job waiting for a worker (geometry + metadata)
+#   leased/<sim_id>.<token>.json   -> job claimed by a worker (atomic rename from pending); the worker keeps renewing the lease (mtime)
+#   done/<sim_id>.<token>.json     -> job result (KPIs csv payload, or error)
+#   workers/<worker>.json          -> worker heartbeat
+QUEUE_PENDING_DIR = "pending"
+QUEUE_LEASED_DIR = "leased"
+QUEUE_DONE_DIR = "done"
+QUEUE_WORKERS_DIR = "workers"
+JOB_FILE_EXT = ".json"
+
+JOB_STATUS_OK = "ok"
+JOB_STATUS_ERROR = "error"
+
+def write_json_atomic(path, data):
+    tmp_path = os.path.join(os.path.dirname(path), "." + os.path.basename(path) + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+def read_json(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+def create_worker_id():
+    return socket.gethostname() + "-" + str(os.getpid())
+
+class SimJobQueue:
+    def __init__(self):
+        self._queue_dir = None
+        self._lease_timeout = None
+        self._is_initialized = False
+
+    def init(self, queue_dir, lease_timeout):
+        logger = init_logger()
+        for sub_dir in (QUEUE_PENDING_DIR, QUEUE_LEASED_DIR, QUEUE_DONE_DIR, QUEUE_WORKERS_DIR):
+            os.makedirs(os.path.join(queue_dir, sub_dir), exist_ok=True)
+        self._queue_dir = queue_dir
+        self._lease_timeout = lease_timeout
+        self._is_initialized = True
+        logger.info("[simq] Simulation job queue ready (dir: " + queue_dir + ", lease timeout: " + str(lease_timeout) + "s)")
+
+    def _jobPath(self, sub_dir, sim_id, lease_token):
+        if (not self._is_initialized):
+            raise RuntimeError("[simq] ERROR. Bad Sequence. The simulation job queue has not been initialized")
+        return os.path.join(self._queue_dir, sub_dir, sim_id + "." + lease_token + JOB_FILE_EXT)
+
+    def getLeaseTimeout(self):
+        return self._lease_timeout
+
+    # ---------- coordinator side ----------
+
+    # Returns the lease token of this attempt of the job
+    def submit(self, sim_id, geom_data, attempt, fidelity=None):
+        lease_token = uuid.uuid4().hex
+        job = {"sim_id": sim_id, "lease_token": lease_token, "geometry": geom_data, "fidelity": fidelity, "attempt": attempt, "submitted_at": time.time()}
+        write_json_atomic(self._jobPath(QUEUE_PENDING_DIR, sim_id, lease_token), job)
+        return lease_token
+
+    # Returns the result of the attempt if available (and removes it from the queue), None otherwise
+    def popResult(self, sim_id, lease_token):
+        done_path = self._jobPath(QUEUE_DONE_DIR, sim_id, lease_token)
+        if (not os.path.exists(done_path)):
+            return None
+        res = read_json(done_path)
+        os.remove(done_path)
+        return res
+
+    # True if the attempt is currently leased by a worker which did not renew the lease in time
+    def isLeaseExpired(self, sim_id, lease_token):
+        try:
+            age = time.time() - os.path.getmtime(self._jobPath(QUEUE_LEASED_DIR, sim_id, lease_token))
+        except FileNotFoundError:
+            return False
+        return (age > self._lease_timeout)
+
+    # Takes back a leased attempt (e.g. expired). Returns the job data, or None if in the meantime the worker completed it
+    def revokeLease(self, sim_id, lease_token):
+        leased_path = self._jobPath(QUEUE_LEASED_DIR, sim_id, lease_token)
+        try:
+            job = read_json(leased_path)
+            os.remove(leased_path)
+        except FileNotFoundError:
+            return None
+        return job
+
+    # Withdraws an attempt still waiting for a worker (e.g. a resubmitted job whose original lease-holder delivered anyway)
+    def cancel(self, sim_id, lease_token):
+        try:
+            os.remove(self._jobPath(QUEUE_PENDING_DIR, sim_id, lease_token))
+        except FileNotFoundError:
+            pass
+
+    def getLiveWorkers(self):
+        workers_dir = os.path.join(self._queue_dir, QUEUE_WORKERS_DIR)
+        now = time.time()
+        live = []
+        for wfile in os.listdir(workers_dir):
+            if (wfile.endswith(JOB_FILE_EXT) and not wfile.startswith(".")):
+                try:
+                    if ((now - os.path.getmtime(os.path.join(workers_dir, wfile))) <= self._lease_timeout):
+                        live.append(wfile[:-len(JOB_FILE_EXT)])
+                except FileNotFoundError:
+                    pass
+        return live
+
+    # ---------- worker side ----------
+
+    # Claims the oldest pending job (run IDs are lexically sortable). Returns the job data (its lease token included), or None if nothing is pending
+    def claim(self, worker_id):
+        pending_dir = os.path.join(self._queue_dir, QUEUE_PENDING_DIR)
+        for jfile in sorted(f for f in os.listdir(pending_dir) if (f.endswith(JOB_FILE_EXT) and not f.startswith("."))):
+            leased_path = os.path.join(self._queue_dir, QUEUE_LEASED_DIR, jfile)
+            try:
+                os.rename(os.path.join(pending_dir, jfile), leased_path)
+            except FileNotFoundError:
+                # claimed by another worker in the meantime
+                continue
+            job = read_json(leased_path)
+            job["worker"] = worker_id
+            job["leased_at"] = time.time()
+            write_json_atomic(leased_path, job)
+            return job
+        return None
+
+    # Returns False if the lease was revoked (e.g. expired, and the job resubmitted)
+    def renewLease(self, sim_id, lease_token):
+        try:
+            os.utime(self._jobPath(QUEUE_LEASED_DIR, sim_id, lease_token))
+        except FileNotFoundError:
+            return False
+        return True
+
+    # Returns the result of the attempt to the coordinator. Returns False (and the result is discarded) if the lease was revoked:
+    # the job was resubmitted (or its result was delivered by another attempt), and nobody is waiting for this attempt any more
+    def complete(self, sim_id, lease_token, worker_id, status, kpis_csv, err_info):
+        leased_path = self._jobPath(QUEUE_LEASED_DIR, sim_id, lease_token)
+        if (not os.path.exists(leased_path)):
+            return False
+        res = {"sim_id": sim_id, "lease_token": lease_token, "worker": worker_id, "status": status, "kpis_csv": kpis_csv, "error": err_info, "completed_at": time.time()}
+        write_json_atomic(self._jobPath(QUEUE_DONE_DIR, sim_id, lease_token), res)
+        try:
+            os.remove(leased_path)
+        except FileNotFoundError:
+            pass
+        return True
+
+    def heartbeat(self, worker_id, info):
+        write_json_atomic(os.path.join(self._queue_dir, QUEUE_WORKERS_DIR, worker_id + JOB_FILE_EXT), info)
+
+    def unregisterWorker(self, worker_id):
+        try:
+            os.remove(os.path.join(self._queue_dir, QUEUE_WORKERS_DIR, worker_id + JOB_FILE_EXT))
+        except FileNotFoundError:
+            pass
+
+# -------------------------------------
+# Coordinator: simulation backend dispatching the simulations to the workers through the queue
+# -------------------------------------
+class SimQueueCoordinator:
+    def __init__(self):
+        self._queue = None
+        self._max_attempts = None
+        self._poll_interval = None
+        self._worker_timeout = None
+        self._is_initialized = False
+
+    def init(self, paramsHolder):
+        self._queue = SimJobQueue()
+        self._queue.init(paramsHolder.get("sim_queue_dir"), paramsHolder.get("sim_lease_timeout", 60))
+        self._max_attempts = paramsHolder.get("sim_max_attempts", 3)
+        self._poll_interval = paramsHolder.get("sim_poll_interval", 1.0)
+        self._worker_timeout = paramsHolder.get("sim_worker_timeout", 600)
+        self._is_initialized = True
+
+    def getDesc(self):
+        return "queue"
+
+    # Withdraws all the attempts of the job from the queue (pending or leased: the workers still running them discard their results)
+    def _withdraw(self, sim_id, lease_tokens):
+        for lease_token in lease_tokens:
+            self._queue.cancel(sim_id, lease_token)
+            self._queue.revokeLease(sim_id, lease_token)
+
+    # Runs a simulation on the first available worker, blocking until its KPIs file is available in the local output directory.
+    # The first result delivered by any attempt of the job wins. If no live worker is seen for 'sim_worker_timeout' seconds, the simulation fails.
+    def runJob(self, sim_id, geom_path, out_data_dir, fidelity=None):
+        logger = init_logger()
+        if (not self._is_initialized):
+            raise RuntimeError("[simq] ERROR. Bad Sequence. 'runJob' cannot be called here, as the queue coordinator has not been initialized")
+        geom_data = read_json(geom_path)
+        if (not self._queue.getLiveWorkers()):
+            logger.warning("[simq][" + sim_id + "] No live simulation worker found, the job will wait in the queue (at most " + str(self._worker_timeout) + "s)")
+
+        attempt = 1
+        lease_tokens = [self._queue.submit(sim_id, geom_data, attempt, fidelity)]
+        logger.info("[simq][" + sim_id + "] Simulation job submitted (attempt: " + str(attempt) + ")")
+        last_worker_seen = time.time()
+        res = None
+        while (res is None):
+            for lease_token in lease_tokens:
+                res = self._queue.popResult(sim_id, lease_token)
+                if (res is not None):
+                    break
+            if (res is not None):
+                break
+            if self._queue.isLeaseExpired(sim_id, lease_tokens[-1]):
+                job = self._queue.revokeLease(sim_id, lease_tokens[-1])
+                if (job is not None):
+                    logger.warning("[simq][" + sim_id + "] Lease expired (worker: " + str(job.get("worker")) + ", lost or dead)")
+                    if (attempt >= self._max_attempts):
+                        raise RuntimeError("[simq][" + sim_id + "] Simulation job lost " + str(attempt) + " times, giving up")
+                    attempt = attempt + 1
+                    lease_tokens.append(self._queue.submit(sim_id, geom_data, attempt, fidelity))
+                    logger.info("[simq][" + sim_id + "] Simulation job resubmitted (attempt: " + str(attempt) + ")")
+            if self._queue.getLiveWorkers():
+                last_worker_seen = time.time()
+            elif ((time.time() - last_worker_seen) > self._worker_timeout):
+                self._withdraw(sim_id, lease_tokens)
+                raise RuntimeError("[simq][" + sim_id + "] No live simulation worker for " + str(self._worker_timeout) + "s, giving up")
+            time.sleep(self._poll_interval)
+        self._withdraw(sim_id, lease_tokens)
+
+        if (res.get("status") != JOB_STATUS_OK):
+            raise RuntimeError("[simq][" + sim_id + "] Simulation failed on worker " + str(res.get("worker")) + ": " + str(res.get("error")))
+
+        kpi_path, _ = create_kpi_filepath(out_data_dir, sim_id)
+        os.makedirs(os.path.dirname(kpi_path), exist_ok=True)
+        with open(kpi_path, "w") as f:
+            f.write(res["kpis_csv"])
+        logger.info("[simq][" + sim_id + "] Simulation results received from worker " + str(res.get("worker")))
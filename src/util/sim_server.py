@@ -0,0 +1,176 @@
+import json
+import os
+import queue
+import socket
+import socketserver
+import subprocess
+from abc import ABC, abstractmethod
+
+from logging_utils import init_logger
+from pickling_utils import TransientStateMixin
+from css_metadata import create_kpi_filepath
+
+# -------------------------------------
+# Persistent simulator server protocol
+# -------------------------------------
+# A warm simulator process listens on a Unix socket, so that the per-run startup cost (environment setup, simulator launch,
+# physics/geometry initialization) is paid once. One connection per simulation, one JSON document per line:
+#   request:  {"op": "run", "sim_id": <run ID>, "geometry_path": <geometry configuration file>, "geometry": <its contents>,
+#              "fidelity": <number of primary particles, null for the simulator default>}
+#   response: {"status": "ok", "sim_id": <run ID>, "kpis_csv": <glob_kpis_<id>.csv contents>}
+#             {"status": "error", "sim_id": <run ID>, "error": <message>}
+#   request:  {"op": "ping"} -> response: {"status": "ok"}
+SRV_STATUS_OK = "ok"
+SRV_STATUS_ERROR = "error"
+SRV_MSG_ENCODING = "utf-8"
+
+def send_msg(sock_file, msg):
+    sock_file.write((json.dumps(msg) + "\n").encode(SRV_MSG_ENCODING))
+    sock_file.flush()
+
+def recv_msg(sock_file):
+    line = sock_file.readline()
+    if (not line):
+        raise ConnectionError("connection closed by peer")
+    return json.loads(line.decode(SRV_MSG_ENCODING))
+
+# -------------------------------------
+# Client side: simulation backend sending the simulations to the simulator server(s)
+# -------------------------------------
+class SimServerClient(TransientStateMixin):
+    # the queue of the free sockets is rebuilt upon unpickling
+    _TRANSIENT_ATTRS = ("_sockets",)
+
+    def __init__(self):
+        self._sock_paths = None
+        self._sockets = None
+        self._sim_script = None
+        self._fallback_enabled = True
+        self._is_initialized = False
+
+    # 'sim_server_socket' can list many sockets (one per server process), each one serving one simulation at a time
+    def init(self, paramsHolder):
+        logger = init_logger()
+        sock_paths = paramsHolder.get("sim_server_socket")
+        if (not isinstance(sock_paths, list)):
+            sock_paths = [sock_paths]
+        self._sock_paths = sock_paths
+        self._createTransientState()
+        self._sim_script = paramsHolder.get("simulation_script")
+        self._fallback_enabled = paramsHolder.get("sim_server_fallback", True)
+        self._is_initialized = True
+        logger.info("[simsrv] Simulator server client ready (sockets: " + ", ".join(sock_paths) + ", one-shot script fallback: " + str(self._fallback_enabled) + ")")
+
+    def _createTransientState(self):
+        self._sockets = None
+        if (self._sock_paths is not None):
+            self._sockets = queue.Queue()
+            for sock_path in self._sock_paths:
+                self._sockets.put(sock_path)
+
+    def getDesc(self):
+        return "server"
+
+    def _connect(self, sock_path):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(sock_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _request(self, sock, msg):
+        with sock, sock.makefile("rwb") as sock_file:
+            send_msg(sock_file, msg)
+            return recv_msg(sock_file)
+
+    # Runs a simulation on a free simulator server, blocking until its KPIs file is available in the local output directory.
+    # If the server cannot be reached, the simulation falls back to the one-shot simulation script (if enabled). Once the
+    # simulation is sent, a failure (e.g. the server dying mid-run) is a simulation failure: it is not run again.
+    def runJob(self, sim_id, geom_path, out_data_dir, fidelity=None):
+        logger = init_logger()
+        if (not self._is_initialized):
+            raise RuntimeError("[simsrv] ERROR. Bad Sequence. 'runJob' cannot be called here, as the simulator server client has not been initialized")
+        with open(geom_path, "r") as f:
+            geom_data = json.load(f)
+
+        sock_path = self._sockets.get()
+        try:
+            try:
+                sock = self._connect(sock_path)
+            except OSError as ce:
+                if (not self._fallback_enabled):
+                    raise
+                logger.warning(f"[simsrv][{sim_id}] Simulator server not reachable ({sock_path}: {ce}), falling back to the one-shot simulation script")
+                subprocess.run([self._sim_script] + [sim_id] + ([str(fidelity)] if (fidelity is not None) else []), check=True)
+                return
+            logger.info("[simsrv][" + sim_id + "] Sending simulation to server (" + sock_path + ")")
+            res = self._request(sock, {"op": "run", "sim_id": sim_id, "geometry_path": geom_path, "geometry": geom_data, "fidelity": fidelity})
+        finally:
+            self._sockets.put(sock_path)
+
+        if (res.get("status") != SRV_STATUS_OK):
+            raise RuntimeError("[simsrv][" + sim_id + "] Simulation failed on server: " + str(res.get("error")))
+        kpi_path, _ = create_kpi_filepath(out_data_dir, sim_id)
+        os.makedirs(os.path.dirname(kpi_path), exist_ok=True)
+        with open(kpi_path, "w") as f:
+            f.write(res["kpis_csv"])
+        logger.info("[simsrv][" + sim_id + "] Simulation results received from server")
+
+# -------------------------------------
+# Server side: protocol handling, to be specialized with the actual simulation logic (method 'runSimulation')
+# -------------------------------------
+class SimServerBase(ABC):
+    def __init__(self):
+        self._sock_path = None
+        self._server = None
+
+    # runs the simulation and returns the contents of its KPIs file
+    @abstractmethod
+    def runSimulation(self, sim_id, geometry_path, geometry, fidelity):
+        pass
+
+    def handleMessage(self, msg):
+        op = msg.get("op")
+        if (op == "ping"):
+            return {"status": SRV_STATUS_OK}
+        if (op == "run"):
+            sim_id = msg.get("sim_id")
+            try:
+                kpis_csv = self.runSimulation(sim_id, msg.get("geometry_path"), msg.get("geometry"), msg.get("fidelity"))
+                return {"status": SRV_STATUS_OK, "sim_id": sim_id, "kpis_csv": kpis_csv}
+            except Exception as e:
+                return {"status": SRV_STATUS_ERROR, "sim_id": sim_id, "error": f"{e}"}
+        return {"status": SRV_STATUS_ERROR, "error": "unknown operation: " + str(op)}
+
+    # Serves one connection at a time (i.e. one simulation at a time) until 'shutdown' is called
+    def serveForever(self, sock_path):
+        logger = init_logger()
+        if os.path.exists(sock_path):
+            os.remove(sock_path)
+        sim_server = self
+
+        class _Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                try:
+                    msg = recv_msg(self.rfile)
+                except (ConnectionError, ValueError) as e:
+                    logger.warning(f"[simsrv] Bad request: {e}")
+                    return
+                send_msg(self.wfile, sim_server.handleMessage(msg))
+
+        self._sock_path = sock_path
+        self._server = socketserver.UnixStreamServer(sock_path, _Handler)
+        logger.info("[simsrv] Simulator server listening on: " + sock_path)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(sock_path):
+                os.remove(sock_path)
+            logger.info("[simsrv] Simulator server stopped")
+
+    def shutdown(self):
+        if (self._server is not None):
+            self._server.shutdown()
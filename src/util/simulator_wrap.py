@@ -1,34 +1,72 @@
 import subprocess
+import time
 from logging_utils import init_logger
 
 from kpis_utils import KPIHolder
 from geom_utils import create_geometry_conf
-from css_metadata import create_run_id
+from css_metadata import allocate_run_workspace
+from sim_cache import build_cache_key
 
 # -------------------------------------
 # Run simulation
 # -------------------------------------
-def run_simulation(shield, gconf_trg_dir, conf_template_data, comm_layer_data, sim_script_path, out_data_dir, objFunEvaluator, trgReachedEvaluator):
+# 'simBackend', if specified, replaces the local launch of the simulation script (e.g. SimQueueCoordinator, to run the simulation on a remote worker)
+# 'simCache', if specified, is the simulation results cache: on a hit, the simulation is skipped and the ID of the original simulation is returned
+# 'fidelity', if specified, is the fidelity level (number of primary particles) of the simulation, passed to the simulation script after the
+# simulation ID; None means the simulator default (full statistics)
+# 'earlyAbort', if specified (EarlyAbortMonitor), monitors the partial KPIs of the simulation while running (local launch only), and kills it
+# if it cannot be competitive: in such case the KPIs returned are its partial estimate (and they are not cached)
+# Returns the simulation ID, the KPIs and the run time of the complete simulation: the one of the original simulation on a cache hit
+# (None if the cache did not store it), None for an aborted simulation
+def run_simulation(shield, gconf_trg_dir, conf_template_data, comm_layer_data, sim_script_path, out_data_dir, objFunEvaluator, trgReachedEvaluator, simBackend=None, simCache=None, fidelity=None, earlyAbort=None):
     logger = init_logger()
     logger.debug("[driver] Run simulation: begin")
 
-    simulation_id = create_run_id()
-    logger.info("[driver][" + simulation_id + "] Simulation ID established")
+    cache_key = None
+    if (simCache is not None):
+        cache_key = build_cache_key(shield, conf_template_data, comm_layer_data, {"fidelity": fidelity} if (fidelity is not None) else None)
+        cached = simCache.lookup(cache_key)
+        if (cached is not None):
+            cached_sim_id, cached_kpis_dict, cached_sim_secs = cached
+            logger.info("[driver][" + cached_sim_id + "] Simulation SKIPPED, KPIs retrieved from the cache {layers: " + shield.getLayersDesc() + "}")
+            kpis = KPIHolder()
+            kpis.initFromDict(cached_sim_id, cached_kpis_dict, objFunEvaluator, trgReachedEvaluator, fidelity)
+            return cached_sim_id, kpis, cached_sim_secs
+
+    simulation_id, _, out_dir = allocate_run_workspace(gconf_trg_dir, out_data_dir)
+    logger.info("[driver][" + simulation_id + "] Simulation ID established (output dir. reserved: " + out_dir + ")")
     geom_path = create_geometry_conf(simulation_id, gconf_trg_dir, conf_template_data, comm_layer_data, shield)
     #for i, (material, thickness) in enumerate(layers):
     #    shield_materials += [f"--material{i+1}", material, f"--thickness{i+1}", str(thickness)]
 
     layers_desc = shield.getLayersDesc()
-    logger.info("[driver][" + simulation_id + "] Calling simulation {script: " + sim_script_path + ", geometry: " + geom_path + ", layers: " + layers_desc + "} ..")
-    #subprocess.run([sim_script_path] + shield_materials, check=True)
-    #subprocess.run([sim_script_path] + ['batch'] + [simulation_id], check=True)
-    subprocess.run([sim_script_path] + [simulation_id], check=True)
+    t_sim = time.monotonic()
+    fidelity_desc = (", fidelity: " + str(fidelity)) if (fidelity is not None) else ""
+    if (simBackend is None):
+        logger.info("[driver][" + simulation_id + "] Calling simulation {script: " + sim_script_path + ", geometry: " + geom_path + ", layers: " + layers_desc + fidelity_desc + "} ..")
+        #subprocess.run([sim_script_path] + shield_materials, check=True)
+        #subprocess.run([sim_script_path] + ['batch'] + [simulation_id], check=True)
+        sim_cmd = [sim_script_path] + [simulation_id] + ([str(fidelity)] if (fidelity is not None) else [])
+        if (earlyAbort is None):
+            subprocess.run(sim_cmd, check=True)
+        else:
+            partial_kpis_dict = earlyAbort.runSimulation(sim_cmd, simulation_id, out_data_dir, shield, objFunEvaluator, trgReachedEvaluator)
+            if (partial_kpis_dict is not None):
+                kpis = KPIHolder()
+                kpis.initFromDict(simulation_id, partial_kpis_dict, objFunEvaluator, trgReachedEvaluator, fidelity, True)
+                return simulation_id, kpis, None
+    else:
+        logger.info("[driver][" + simulation_id + "] Calling simulation {backend: " + simBackend.getDesc() + ", geometry: " + geom_path + ", layers: " + layers_desc + fidelity_desc + "} ..")
+        simBackend.runJob(simulation_id, geom_path, out_data_dir, fidelity)
+    sim_secs = time.monotonic() - t_sim
 
     logger.info("[driver][" + simulation_id + "] Simulation complete")
 
     #shield.getTotThickness()
     kpis = KPIHolder()
-    kpis.load(simulation_id, out_data_dir, objFunEvaluator, trgReachedEvaluator)
-    return simulation_id, kpis
+    kpis.load(simulation_id, out_data_dir, objFunEvaluator, trgReachedEvaluator, fidelity)
+    if (simCache is not None):
+        simCache.store(cache_key, simulation_id, shield, kpis.getKPIsDict(), sim_secs)
+    return simulation_id, kpis, sim_secs
 
 
@@ -0,0 +1,157 @@
+import math
+import time
+from collections import OrderedDict
+
+import numpy as np
+from sklearn.base import BaseEstimator, RegressorMixin, clone
+from sklearn.cluster import KMeans
+from skopt.learning import GaussianProcessRegressor, GradientBoostingQuantileRegressor
+
+from logging_utils import init_logger
+
+#fitted states kept by a local GP, to update incrementally also the models fitted by copies of the optimizer (constant liar)
+LOCAL_GP_STATES_CACHE_SIZE = 8
+
+# -------------------------------------
+# Surrogate models
+# -------------------------------------
+
+# Exact GP (same as the one gp_minimize builds), reporting the time spent in each fit
+class TimedGaussianProcessRegressor(GaussianProcessRegressor):
+    def fit(self, X, y):
+        logger = init_logger()
+        t0 = time.monotonic()
+        super().fit(X, y)
+        logger.info(f"[opttrace][surrogate] Surrogate fit (exact GP, points: {len(X)}): {time.monotonic() - t0:.3f}s")
+        return self
+
+# skopt's GBRT quantile regressor, recognized as a regressor also by scikit-learn >= 1.6 (the estimator tags of the skopt
+# class are resolved on BaseEstimator first, losing the regressor type, so that the skopt Optimizer rejects it)
+class QuantileGBRTRegressor(GradientBoostingQuantileRegressor):
+    def __sklearn_tags__(self):
+        tags = super().__sklearn_tags__()
+        tags.estimator_type = "regressor"
+        return tags
+
+    # same as skopt's, with np.isin instead of np.in1d (removed in numpy 2.4)
+    def predict(self, X, return_std=False, return_quantiles=False):
+        if ((not return_std) or return_quantiles):
+            return super().predict(X, return_std=False, return_quantiles=return_quantiles)
+        if (not np.all(np.isin([0.16, 0.5, 0.84], self.quantiles))):
+            raise ValueError("return_std works only if the quantiles during instantiation include 0.16, 0.5 and 0.84")
+        low = self.regressors_[self.quantiles.index(0.16)].predict(X)
+        high = self.regressors_[self.quantiles.index(0.84)].predict(X)
+        mean = self.regressors_[self.quantiles.index(0.5)].predict(X)
+        return mean, ((high - low) / 2.0)
+
+# Fitted states of a local GP, shared by all its clones (the optimizer clones the estimator upon each fit)
+class LocalGPStateCache:
+    def __init__(self):
+        self._states = OrderedDict()
+
+    # clones share the cache, instead of copying it
+    def __deepcopy__(self, memo):
+        return self
+
+    # Returns the cached state whose training set is the longest prefix of (X, y), or None
+    def getBestPrefixState(self, X, y):
+        best_state = None
+        for state in self._states.values():
+            n = len(state["X"])
+            if ((n <= len(X)) and ((best_state is None) or (n > len(best_state["X"]))) and np.array_equal(state["X"], X[:n]) and np.array_equal(state["y"], y[:n])):
+                best_state = state
+        return best_state
+
+    def put(self, state):
+        key = id(state)
+        self._states[key] = state
+        while (len(self._states) > LOCAL_GP_STATES_CACHE_SIZE):
+            self._states.popitem(last=False)
+
+# Local GP partition: the (transformed) search space is partitioned into regions of at most 'partition_size' points (k-means),
+# with an exact GP per region; predictions come from the GP of the nearest region. Fitting costs O(n * partition_size^2)
+# instead of O(n^3), and is incremental: new observations join the nearest region, and only the regions which changed
+# (or got split, once exceeding 'partition_size') are refitted. With no more than 'partition_size' points, it is an exact GP.
+class LocalGPRegressor(RegressorMixin, BaseEstimator):
+    def __init__(self, base_estimator=None, partition_size=200, random_state=None, state_cache=None):
+        self.base_estimator = base_estimator
+        self.partition_size = partition_size
+        self.random_state = random_state
+        self.state_cache = state_cache
+
+    def _fitRegion(self, X, y, idxs):
+        gp = clone(self.base_estimator)
+        gp.fit(X[idxs], y[idxs])
+        return {"idxs": idxs, "centroid": X[idxs].mean(axis=0), "gp": gp}
+
+    def _kmeans(self, X, n_clusters):
+        km = KMeans(n_clusters=n_clusters, n_init=3, random_state=self.random_state)
+        return km.fit_predict(X)
+
+    def _splitRegion(self, X, idxs):
+        labels = self._kmeans(X[idxs], 2)
+        parts = [idxs[labels == lb] for lb in (0, 1)]
+        if (min(len(p) for p in parts) == 0):
+            # degenerate (e.g. duplicated points): split in halves
+            parts = [idxs[:len(idxs) // 2], idxs[len(idxs) // 2:]]
+        return parts
+
+    def fit(self, X, y):
+        logger = init_logger()
+        t0 = time.monotonic()
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float).ravel()
+        prev_state = self.state_cache.getBestPrefixState(X, y) if (self.state_cache is not None) else None
+
+        if (prev_state is None):
+            # full (re)build: regions half full, to leave room for the incremental updates
+            n_regions = max(1, math.ceil(len(X) / max(1, self.partition_size // 2))) if (len(X) > self.partition_size) else 1
+            labels = self._kmeans(X, n_regions) if (n_regions > 1) else np.zeros(len(X), dtype=int)
+            region_idxs = [np.flatnonzero(labels == lb) for lb in range(n_regions)]
+            region_idxs = [idxs for idxs in region_idxs if (len(idxs) > 0)]
+            regions = [self._fitRegion(X, y, idxs) for idxs in region_idxs]
+            num_refitted, mode_desc = len(regions), "full"
+        else:
+            regions = list(prev_state["regions"])
+            n_prev = len(prev_state["X"])
+            changed = {}
+            centroids = np.array([r["centroid"] for r in regions])
+            for i in range(n_prev, len(X)):
+                ri = int(np.argmin(np.sum((centroids - X[i]) ** 2, axis=1)))
+                changed.setdefault(ri, list(regions[ri]["idxs"])).append(i)
+            new_regions = [r for ri, r in enumerate(regions) if (ri not in changed)]
+            num_refitted = 0
+            for ri, idxs in changed.items():
+                idxs = np.array(idxs)
+                parts = self._splitRegion(X, idxs) if (len(idxs) > self.partition_size) else [idxs]
+                for part in parts:
+                    new_regions.append(self._fitRegion(X, y, part))
+                    num_refitted = num_refitted + 1
+            regions = new_regions
+            mode_desc = "incremental"
+
+        self.regions_ = regions
+        self.centroids_ = np.array([r["centroid"] for r in regions])
+        if (self.state_cache is not None):
+            self.state_cache.put({"X": X, "y": y, "regions": regions})
+        logger.info(f"[opttrace][surrogate] Surrogate fit (local GP, points: {len(X)}, regions: {len(regions)}, refitted: {num_refitted}, {mode_desc}): {time.monotonic() - t0:.3f}s")
+        return self
+
+    # Same interface as skopt's GaussianProcessRegressor.predict (gradients are available for one point at a time)
+    def predict(self, X, return_std=False, return_cov=False, return_mean_grad=False, return_std_grad=False):
+        X = np.asarray(X, dtype=float)
+        region_of = np.argmin(((X[:, None, :] - self.centroids_[None, :, :]) ** 2).sum(axis=2), axis=1)
+        if (return_mean_grad or return_std_grad or return_cov):
+            if (len(X) != 1):
+                raise ValueError("[surrogate] ERROR. The local GP provides gradients and covariance for one point at a time")
+            return self.regions_[region_of[0]]["gp"].predict(X, return_std=return_std, return_cov=return_cov, return_mean_grad=return_mean_grad, return_std_grad=return_std_grad)
+
+        y_mean = np.zeros(len(X))
+        y_std = np.zeros(len(X))
+        for ri in np.unique(region_of):
+            rows = (region_of == ri)
+            if return_std:
+                y_mean[rows], y_std[rows] = self.regions_[ri]["gp"].predict(X[rows], return_std=True)
+            else:
+                y_mean[rows] = self.regions_[ri]["gp"].predict(X[rows])
+        return (y_mean, y_std) if return_std else y_mean
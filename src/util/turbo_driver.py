@@ -0,0 +1,242 @@
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from sklearn.utils import check_random_state
+from skopt.space import Space, Integer, Real
+from skopt.utils import create_result, normalize_dimensions
+
+from logging_utils import init_logger
+from engine_factory import create_optimizer
+from batch_driver import evaluate_points, SIM_SLOT_THREAD_PFIX
+
+# -------------------------------------
+# Trust-region (TuRBO style) optimization loop
+# -------------------------------------
+# After the initial design (X0 and the n_initial_points random points, on the whole search space), the search goes on in
+# 'turbo_regions' trust regions: boxes centered on their own best shield, each side spanning 'length' times the range of
+# its dimension (integer dimensions rounded outwards, to at least two values; categorical ones are taken whole).
+# Upon each round, the 'sim_slots' points are shared among the regions: for each region, a local ask/tell optimizer is
+# fitted on the shields simulated inside the box, and asked for its share of points (constant liar), so the acquisition
+# is only optimized inside the region. A region doubles its length after 'turbo_success_tol' consecutive successes (an
+# improvement of its best value), halves it after 'turbo_failure_tol' consecutive failures, and once shorter than
+# 'turbo_length_min' it is restarted, on the best of a few random shields of the whole search space.
+# Unlike the original TuRBO, the box is not shaped on the GP length scales (the local surrogate is rebuilt each round).
+
+# relative improvement for a round to count as a success for a region
+TURBO_SUCCESS_MARGIN = 1e-3
+
+def validate_turbo_params(num_regions, length_init, length_min, length_max, success_tol, failure_tol):
+    if ((not isinstance(num_regions, int)) or (num_regions < 1)):
+        raise ValueError("[turbo] ERROR. 'turbo_regions' must be a positive integer, got: " + str(num_regions))
+    if (not (0.0 < length_min <= length_init <= length_max)):
+        raise ValueError("[turbo] ERROR. Trust region lengths must satisfy 0 < 'turbo_length_min' <= 'turbo_length_init' <= 'turbo_length_max', got: " + str((length_min, length_init, length_max)))
+    if ((not isinstance(success_tol, int)) or (success_tol < 1)):
+        raise ValueError("[turbo] ERROR. 'turbo_success_tol' must be a positive integer, got: " + str(success_tol))
+    if ((not isinstance(failure_tol, int)) or (failure_tol < 0)):
+        raise ValueError("[turbo] ERROR. 'turbo_failure_tol' must be a non-negative integer (0: automatic), got: " + str(failure_tol))
+
+# Dimensions of the trust region of the given center and length (same types, priors and transforms as the search space)
+def get_region_dimensions(search_space, center, length):
+    region_dims = []
+    for dim, c in zip(search_space, center):
+        if isinstance(dim, Integer):
+            half_span = 0.5 * length * (dim.high - dim.low)
+            low = max(dim.low, int(math.floor(c - half_span)))
+            high = min(dim.high, int(math.ceil(c + half_span)))
+            if (low == high):
+                if (high < dim.high):
+                    high = high + 1
+                else:
+                    low = low - 1
+            region_dims.append(Integer(low, high, prior=dim.prior, base=dim.base, transform=dim.transform_, name=dim.name, dtype=dim.dtype))
+        elif isinstance(dim, Real):
+            half_span = 0.5 * length * (dim.high - dim.low)
+            region_dims.append(Real(max(dim.low, c - half_span), min(dim.high, c + half_span), prior=dim.prior, base=dim.base, transform=dim.transform_, name=dim.name, dtype=dim.dtype))
+        else:
+            region_dims.append(dim)
+    return region_dims
+
+class TrustRegion:
+    def __init__(self, region_nbr, length_init, length_min, length_max, success_tol, failure_tol):
+        self._region_nbr = region_nbr
+        self._length_init = length_init
+        self._length_min = length_min
+        self._length_max = length_max
+        self._success_tol = success_tol
+        self._failure_tol = failure_tol
+        self._length = length_init
+        self._center = None
+        self._center_value = None
+        self._num_successes = 0
+        self._num_failures = 0
+        self._num_restarts = 0
+
+    def getDesc(self):
+        return "region " + str(self._region_nbr) + " (length: " + str(round(self._length, 4)) + ", best: " + str(self._center_value) + ", restarts: " + str(self._num_restarts) + ")"
+
+    def hasCenter(self):
+        return (self._center is not None)
+
+    def getCenter(self):
+        return self._center
+
+    def getLength(self):
+        return self._length
+
+    def setCenter(self, x, y):
+        self._center = list(x)
+        self._center_value = y
+
+    # Success/failure bookkeeping with the values of the points this region proposed in the last round
+    def update(self, x_batch, y_batch, pn_value):
+        logger = init_logger()
+        if (not x_batch):
+            return
+        best_idx = int(np.argmin(y_batch))
+        x_best, y_best = x_batch[best_idx], y_batch[best_idx]
+        if (not self.hasCenter()):
+            # restart: the region gets centered on the best of its random shields (if any was simulated successfully)
+            if (y_best < pn_value):
+                self.setCenter(x_best, y_best)
+                logger.info("[opttrace][turbo] Trust " + self.getDesc() + " restarted")
+            return
+
+        if (y_best < self._center_value - TURBO_SUCCESS_MARGIN * abs(self._center_value)):
+            self.setCenter(x_best, y_best)
+            self._num_successes = self._num_successes + 1
+            self._num_failures = 0
+        else:
+            self._num_successes = 0
+            self._num_failures = self._num_failures + 1
+
+        if (self._num_successes >= self._success_tol):
+            self._length = min(2.0 * self._length, self._length_max)
+            self._num_successes = 0
+            logger.info("[opttrace][turbo] Trust " + self.getDesc() + " expanded")
+        elif (self._num_failures >= self._failure_tol):
+            self._length = self._length / 2.0
+            self._num_failures = 0
+            logger.info("[opttrace][turbo] Trust " + self.getDesc() + " shrunk")
+        if (self._length < self._length_min):
+            logger.info("[opttrace][turbo] Trust " + self.getDesc() + " collapsed, it will be restarted")
+            self._center = None
+            self._center_value = None
+            self._length = self._length_init
+            self._num_restarts = self._num_restarts + 1
+
+# Regions with no center (e.g. upon start) are centered on the best shields of the history, one distinct shield each
+def seed_regions(regions, x_iters, func_vals, pn_value):
+    taken = [r.getCenter() for r in regions if r.hasCenter()]
+    ranked = sorted((i for i, yi in enumerate(func_vals) if (yi < pn_value)), key=lambda i: func_vals[i])
+    for region in regions:
+        if region.hasCenter():
+            continue
+        for i in ranked:
+            if (list(x_iters[i]) not in taken):
+                region.setCenter(x_iters[i], func_vals[i])
+                taken.append(list(x_iters[i]))
+                break
+
+def run_turbo_optimization(objective_fn, search_space, x0, y0, max_runs, optimizerConf, post_callback, pn_value, feasibleSampler=None, failureRegistry=None, runtimeRegistry=None):
+    logger = init_logger()
+    sim_slots = optimizerConf.getParam("sim_slots")
+    strategy = optimizerConf.getParam("batch_strategy")
+    num_regions = optimizerConf.getParam("turbo_regions")
+    length_init = optimizerConf.getParam("turbo_length_init")
+    length_min = optimizerConf.getParam("turbo_length_min")
+    length_max = optimizerConf.getParam("turbo_length_max")
+    success_tol = optimizerConf.getParam("turbo_success_tol")
+    failure_tol = optimizerConf.getParam("turbo_failure_tol")
+    if ((not isinstance(sim_slots, int)) or (sim_slots < 1)):
+        raise ValueError("[turbo] ERROR. 'sim_slots' must be a positive integer, got: " + str(sim_slots))
+    validate_turbo_params(num_regions, length_init, length_min, length_max, success_tol, failure_tol)
+    # 0: as in TuRBO, about one failure per dimension (in rounds, for the points each region gets per round)
+    failure_tol = failure_tol or int(math.ceil(max(4.0, len(search_space)) / max(1.0, sim_slots / num_regions)))
+
+    rng = check_random_state(optimizerConf.getParam("random_state"))
+    space = normalize_dimensions(search_space)
+    specs = {"args": {"max_runs": max_runs, "sim_slots": sim_slots, "batch_strategy": strategy, "turbo_regions": num_regions, "turbo_length_init": length_init,
+                      "turbo_length_min": length_min, "turbo_length_max": length_max, "turbo_success_tol": success_tol, "turbo_failure_tol": failure_tol},
+             "function": "run_turbo_optimization"}
+    logger.info("[turbo] Trust-region optimization loop (regions: " + str(num_regions) + ", lengths init/min/max: " + str(length_init) + "/" + str(length_min) + "/" + str(length_max) +
+                ", success/failure tolerance: " + str(success_tol) + "/" + str(failure_tol) + ", simulator slots: " + str(sim_slots) + ")")
+
+    x_iters = []
+    func_vals = []
+    result = None
+    remaining_runs = max_runs
+    x0 = x0 or []
+    # initial design on the whole search space (its points are random, so this optimizer is never fitted)
+    design_opt = create_optimizer(search_space, optimizerConf, len(x0), rng.randint(0, np.iinfo(np.int32).max), feasible_sampler=feasibleSampler, failure_registry=failureRegistry, runtime_registry=runtimeRegistry)
+    with ThreadPoolExecutor(max_workers=sim_slots, thread_name_prefix=SIM_SLOT_THREAD_PFIX) as executor:
+        # Same semantics as gp_minimize: X0 without Y0 gets evaluated (and counted as runs), X0 with Y0 is just taken as is
+        if (x0 and (y0 is None)):
+            logger.info("[opttrace][turbo] Evaluating X0 points (" + str(len(x0)) + ")")
+            y0 = evaluate_points(executor, objective_fn, x0)
+            remaining_runs = remaining_runs - len(x0)
+        if x0:
+            x_iters, func_vals = list(x0), list(y0)
+            design_opt.tell(x_iters, func_vals, fit=False)
+            result = create_result(x_iters, func_vals, space, rng, specs)
+            if post_callback(result):
+                return result
+
+        # X0 already told: what is left of the initial design is the configured number of initial points
+        init_points_left = optimizerConf.getParam("n_initial_points")
+        round_nbr = 0
+        while ((remaining_runs > 0) and (init_points_left > 0)):
+            round_nbr = round_nbr + 1
+            batch_sz = min(sim_slots, init_points_left, remaining_runs)
+            x_batch = design_opt.ask(n_points=batch_sz, strategy=strategy)
+            logger.info("[opttrace][turbo] Round " + str(round_nbr) + ": dispatching " + str(batch_sz) + " points to the simulator slots (initial design)")
+            y_batch = evaluate_points(executor, objective_fn, x_batch)
+            design_opt.tell(x_batch, y_batch, fit=False)
+            x_iters = x_iters + list(x_batch)
+            func_vals = func_vals + list(y_batch)
+            remaining_runs = remaining_runs - batch_sz
+            init_points_left = init_points_left - batch_sz
+            result = create_result(x_iters, func_vals, space, rng, specs)
+            if post_callback(result):
+                return result
+
+        regions = [TrustRegion(i + 1, length_init, length_min, length_max, success_tol, failure_tol) for i in range(num_regions)]
+        seed_regions(regions, x_iters, func_vals, pn_value)
+        while (remaining_runs > 0):
+            round_nbr = round_nbr + 1
+            batch_sz = min(sim_slots, remaining_runs)
+            # points shared among the regions (rotating, when they are fewer than the regions)
+            quotas = [batch_sz // num_regions + (1 if (((i - round_nbr) % num_regions) < (batch_sz % num_regions)) else 0) for i in range(num_regions)]
+            x_batch, owners = [], []
+            for region_idx, (region, quota) in enumerate(zip(regions, quotas)):
+                if (quota == 0):
+                    continue
+                if region.hasCenter():
+                    region_dims = get_region_dimensions(search_space, region.getCenter(), region.getLength())
+                    region_space = Space(region_dims)
+                    region_data = [(xi, yi) for xi, yi in zip(x_iters, func_vals) if (xi in region_space)]
+                    opt = create_optimizer(region_dims, optimizerConf, 0, rng.randint(0, np.iinfo(np.int32).max), n_initial_points=0, feasible_sampler=feasibleSampler, failure_registry=failureRegistry, runtime_registry=runtimeRegistry)
+                    opt.tell([xi for xi, _ in region_data], [yi for _, yi in region_data])
+                    region_points = opt.ask(n_points=quota, strategy=strategy)
+                    logger.info("[opttrace][turbo] Round " + str(round_nbr) + ", trust " + region.getDesc() + ": " + str(len(region_data)) + " shields inside, asking " + str(quota) + " points")
+                else:
+                    # random points from the feasible region, if feasible region sampling is enabled (same space as the design optimizer)
+                    region_points = design_opt.space.rvs(n_samples=quota, random_state=rng)
+                    logger.info("[opttrace][turbo] Round " + str(round_nbr) + ", region " + str(region_idx + 1) + " (restarting): " + str(quota) + " random points")
+                x_batch = x_batch + list(region_points)
+                owners = owners + [region_idx] * quota
+
+            y_batch = evaluate_points(executor, objective_fn, x_batch)
+            x_iters = x_iters + list(x_batch)
+            func_vals = func_vals + list(y_batch)
+            remaining_runs = remaining_runs - len(x_batch)
+            for region_idx, region in enumerate(regions):
+                region.update([xi for xi, o in zip(x_batch, owners) if (o == region_idx)], [yi for yi, o in zip(y_batch, owners) if (o == region_idx)], pn_value)
+
+            result = create_result(x_iters, func_vals, space, rng, specs)
+            if post_callback(result):
+                break
+
+        for region in regions:
+            logger.info("[opttrace][turbo] Trust " + region.getDesc())
+    return result